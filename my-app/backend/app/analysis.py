@@ -0,0 +1,315 @@
+"""
+设备数据分析公共函数
+charts(单设备图表) 和 home(运行时长时间轴) 共用的 cell 有效性筛选和按小时分组计算,
+全部基于 NumPy 的二维 cell 矩阵一次完成, 不再逐个 cell 复制 DataFrame
+"""
+import numpy as np
+import pandas as pd
+
+CELL_FIELDS = [f"cell_{i}" for i in range(1, 21)]  # 参与筛选的 cell_1 到 cell_20
+CELL_VOLTAGE_THRESHOLD = 1680  # 小室电压有效阈值(mV)
+ZERO_RATIO_LIMIT = 0.8  # 小时均值为0的比例超过该值的cell视为无效
+GAP_THRESHOLD_MINUTES = 60  # 相邻时间差超过该值视为停机间隔
+GAP_FILL_MINUTES = 10  # 连续时间映射中停机间隔替换成的时长
+
+NS_PER_MINUTE = 60 * 10 ** 9
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+
+
+def build_datetime(df: pd.DataFrame) -> pd.Series:
+    """把 date 和 time 两列组合成 datetime"""
+    date = pd.to_datetime(df["date"])
+
+    # 如果 time 是 timedelta, 直接加到 date 上
+    if pd.api.types.is_timedelta64_dtype(df["time"]) or isinstance(df["time"].iloc[0], pd.Timedelta):
+        return date + df["time"]
+    # 如果 time 是字符串或时间类型, 拼接后再解析
+    return pd.to_datetime(date.astype(str) + " " + df["time"].astype(str))
+
+
+def new_cell_stats(cells: list) -> dict:
+    """
+    创建空的 cell 有效性统计
+    每个 cell 记录第一个 >1680 的时间点(起点), 以及从起点开始按小时分组的统计:
+    - hours: 有数据的小时数
+    - zero_closed: 已结束的小时中均值为0的小时数
+    - open_*: 最后一个(可能还会有新数据的)小时的编号、行数、非空值个数、求和及求和的补偿项
+    """
+    n_cells = len(cells)
+    return {
+        "cells": list(cells),
+        "has_start": np.zeros(n_cells, dtype=bool),
+        "start": np.zeros(n_cells, dtype=np.int64),
+        "hours": np.zeros(n_cells, dtype=np.int64),
+        "zero_closed": np.zeros(n_cells, dtype=np.int64),
+        "open_code": np.zeros(n_cells, dtype=np.int64),
+        "open_rows": np.zeros(n_cells, dtype=np.int64),
+        "open_count": np.zeros(n_cells, dtype=float),
+        "open_sum": np.zeros(n_cells, dtype=float),
+        "open_comp": np.zeros(n_cells, dtype=float),
+    }
+
+
+def group_sums(keys: np.ndarray, values: np.ndarray, sums: np.ndarray, compensation: np.ndarray):
+    """
+    按分组键累加数值(NaN 不参与), 原地更新 sums 和 compensation
+
+    与 pandas groupby().mean() 相同, 每组按行顺序使用 Kahan 补偿求和, sums / 非空值个数
+    与 pandas 的均值逐位一致(直接求和在约1%的小时中第2位小数不同)。
+    sums 和 compensation 可以是上一批数据的结果, 继续累加后与一次处理全部数据的结果相同。
+
+    参数:
+    - keys: 每个值的分组键, 同一组的值需连续存放且保持行顺序
+    - values: 数值, 与 keys 一一对应
+    """
+    not_nan = ~np.isnan(values)
+    keys = keys[not_nan]
+    values = values[not_nan]
+    if len(keys) == 0:
+        return
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+    # 组按大小降序排列, 第 r 次循环累加前 live[r] 个组(大小 >r 的组)各自的第 r 个值
+    by_size = np.argsort(-sizes, kind="stable")
+    starts = starts[by_size]
+    group_keys = keys[starts]
+    live = np.searchsorted(-sizes[by_size], -np.arange(sizes.max()), side="left")
+
+    for r, count in enumerate(live):
+        key = group_keys[:count]
+        y = values[starts[:count] + r] - compensation[key]
+        t = sums[key] + y
+        comp = t - sums[key] - y
+        # 与 pandas 一致: 值为 ±inf 时补偿项为 NaN, 置0
+        comp[np.isnan(comp)] = 0.0
+        compensation[key] = comp
+        sums[key] = t
+
+
+def update_cell_stats(stats: dict, values: np.ndarray, times: np.ndarray) -> dict:
+    """
+    把新的行累加到 cell 有效性统计中(原地更新并返回)
+
+    参数:
+    - stats: new_cell_stats 创建的统计, 之前累加的行必须都早于本次的行
+    - values: 数值矩阵, 形状为 (行数, cell数), 列顺序与 stats["cells"] 一致
+    - times: 每行的时间(int64 纳秒), 升序排列
+    """
+    n_rows = len(times)
+    if n_rows == 0:
+        return stats
+
+    # 还没有起点的 cell, 在本批数据中找第一个 >1680 的行 (NaN 比较结果为 False)
+    above = values > CELL_VOLTAGE_THRESHOLD
+    first_above = above.argmax(axis=0)
+    new_start = ~stats["has_start"] & above.any(axis=0)
+    stats["start"][new_start] = times[first_above[new_start]]
+    stats["has_start"] |= new_start
+
+    active = np.flatnonzero(stats["has_start"])
+    if len(active) == 0:
+        return stats
+    start_rows = np.where(new_start, first_above, 0)[active]
+    had_open = stats["open_rows"][active] > 0
+
+    # 每个 cell 相对于自身起点的小时编号, 以未结束的小时为基准(编号0), 起点之前的行不参与
+    in_range = np.arange(n_rows)[:, None] >= start_rows[None, :]
+    base = np.where(had_open, stats["open_code"][active], 0)
+    codes = (times[:, None] - stats["start"][active][None, :]) // NS_PER_HOUR - base[None, :]
+    codes = np.where(in_range, codes, 0)
+    n_slots = int(codes.max()) + 1
+
+    # 把 (cell, 小时) 展平成一维分组键, 一次得到所有 cell 的小时统计;
+    # 按 cell 优先的顺序取值, 每个 cell 的小时编号随时间递增, 同一组的值连续存放
+    keys = (np.arange(len(active))[:, None] * n_slots + codes.T)[in_range.T]
+    active_values = values[:, active].T[in_range.T]
+    not_nan = ~np.isnan(active_values)
+    size = len(active) * n_slots
+    rows = np.bincount(keys, minlength=size).reshape(-1, n_slots)
+    counts = np.bincount(keys, weights=not_nan, minlength=size).reshape(-1, n_slots)
+
+    # 合并上次未结束的小时: 计数直接相加, 求和从上次的结果继续累加
+    rows[:, 0] += stats["open_rows"][active]
+    counts[:, 0] += stats["open_count"][active]
+    sums = np.zeros((len(active), n_slots))
+    compensation = np.zeros((len(active), n_slots))
+    sums[:, 0] = stats["open_sum"][active]
+    compensation[:, 0] = stats["open_comp"][active]
+    group_sums(keys, active_values, sums.reshape(-1), compensation.reshape(-1))
+
+    present = rows > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        zero = present & (counts > 0) & (np.round(sums / counts, 2) == 0)
+    last_slot = n_slots - 1 - present[:, ::-1].argmax(axis=1)
+    picked = np.arange(len(active))
+
+    stats["hours"][active] += present.sum(axis=1) - had_open
+    stats["zero_closed"][active] += zero.sum(axis=1) - zero[picked, last_slot]
+    stats["open_code"][active] = base + last_slot
+    stats["open_rows"][active] = rows[picked, last_slot]
+    stats["open_count"][active] = counts[picked, last_slot]
+    stats["open_sum"][active] = sums[picked, last_slot]
+    stats["open_comp"][active] = compensation[picked, last_slot]
+    return stats
+
+
+def valid_cell_mask(stats: dict) -> np.ndarray:
+    """根据有效性统计判断每个 cell 是否有效: 有起点且均值为0的小时占比 <=0.8"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        open_zero = (stats["open_count"] > 0) & (np.round(stats["open_sum"] / stats["open_count"], 2) == 0)
+        zero_ratio = (stats["zero_closed"] + open_zero) / stats["hours"]
+    return stats["has_start"] & (zero_ratio <= ZERO_RATIO_LIMIT)
+
+
+def cell_matrix(df: pd.DataFrame, cells: list) -> np.ndarray:
+    """把 cell 列转换为数值矩阵(无法转换的值为 NaN)"""
+    return df[cells].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+
+def select_valid_cells(df: pd.DataFrame):
+    """
+    cell 有效性筛选(df 需已按时间升序排列并包含 datetime 列)
+
+    1. 每个 cell 从第一个 >1680 的点开始按小时分组求均值, 均值为0的小时占比 >0.8 的 cell 排除
+    2. 剩余 cell 各自第一个 >1680 的时间点中最晚的一个作为全局起始时间
+    3. 全局起始时间之后且所有有效 cell 均 >=1680 的行为有效行
+
+    返回:
+    - valid_cells: 有效 cell 字段名列表
+    - global_start_time: 全局起始时间(pd.Timestamp), 没有有效 cell 时为 None
+    - row_mask: 有效行的布尔数组
+    - cell_values: 有效 cell 的数值矩阵, 形状为 (行数, 有效cell数)
+    - stats: cell 有效性统计, 可继续用 update_cell_stats 累加新数据
+    """
+    cells = [field for field in CELL_FIELDS if field in df.columns]
+    n_rows = len(df)
+    stats = new_cell_stats(cells)
+    if not cells or n_rows == 0:
+        return [], None, np.zeros(n_rows, dtype=bool), np.empty((n_rows, 0)), stats
+
+    values = cell_matrix(df, cells)
+    times = df["datetime"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    update_cell_stats(stats, values, times)
+
+    is_valid = valid_cell_mask(stats)
+    if not is_valid.any():
+        return [], None, np.zeros(n_rows, dtype=bool), np.empty((n_rows, 0)), stats
+
+    valid_idx = np.flatnonzero(is_valid)
+    valid_cells = [cells[i] for i in valid_idx]
+
+    # 使用最晚的起始时间, 确保所有cell在这个时间点都>1680
+    global_start_ns = stats["start"][valid_idx].max()
+    global_start_time = pd.Timestamp(global_start_ns)
+
+    cell_values = values[:, valid_idx]
+    row_mask = (times >= global_start_ns) & (cell_values >= CELL_VOLTAGE_THRESHOLD).all(axis=1)
+
+    return valid_cells, global_start_time, row_mask, cell_values, stats
+
+
+def compress_time_gaps(datetimes, gap_fill_minutes: float = GAP_FILL_MINUTES) -> np.ndarray:
+    """
+    把不连续的时间序列映射为连续时间(累加向量化计算)
+    相邻时间差 <=60分钟 保持原差值, >60分钟 替换为 gap_fill_minutes
+
+    参数:
+    - datetimes: 升序排列的时间点
+    - gap_fill_minutes: 停机间隔替换成的时长, 计算运行时长时传0
+
+    返回: 每个时间点相对第一个时间点的连续时间偏移(纳秒, int64数组)
+    """
+    times = np.asarray(datetimes, dtype="datetime64[ns]").astype(np.int64)
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64)
+    diffs = np.diff(times)
+    steps = np.where(diffs <= GAP_THRESHOLD_MINUTES * NS_PER_MINUTE, diffs,
+                     int(gap_fill_minutes * NS_PER_MINUTE))
+    return np.concatenate(([0], np.cumsum(steps)))
+
+
+def continuous_hour_codes(valid_datetimes, datetimes) -> np.ndarray:
+    """
+    计算每行在连续时间轴上的小时编号(从第一个基准时间点开始, 向下取整)
+
+    参数:
+    - valid_datetimes: 升序去重后的基准时间点
+    - datetimes: 需要分组的行时间, 必须都在基准时间点中
+    """
+    valid_ns = np.asarray(valid_datetimes, dtype="datetime64[ns]")
+    offsets = compress_time_gaps(valid_ns)
+    positions = np.searchsorted(valid_ns, np.asarray(datetimes, dtype="datetime64[ns]"))
+    return offsets[positions] // NS_PER_HOUR
+
+
+def runtime_hours(datetimes):
+    """
+    根据时间轴计算运行时长(小时)
+    相邻时间差 <=60分钟 计入运行时长, >60分钟 视为停机
+
+    返回: (总运行时长, 最后一次停机之后的连续运行时长)
+    """
+    times = np.asarray(datetimes, dtype="datetime64[ns]")
+    if len(times) == 0:
+        return 0.0, 0.0
+    offsets = compress_time_gaps(times, gap_fill_minutes=0)
+    gaps = np.flatnonzero(np.diff(times.astype(np.int64)) > GAP_THRESHOLD_MINUTES * NS_PER_MINUTE)
+    current_start = offsets[gaps[-1] + 1] if len(gaps) else 0
+    return offsets[-1] / NS_PER_HOUR, (offsets[-1] - current_start) / NS_PER_HOUR
+
+
+def hourly_cell_means(hour_codes, cell_values, datetimes, ids):
+    """
+    按小时编号对有效行的 cell 电压分组
+
+    参数:
+    - hour_codes: 每行的小时编号 (x)
+    - cell_values: 数值矩阵, 形状为 (行数, cell数)
+    - datetimes: 每行的原始时间, 每组取第一个作为 t
+    - ids: 每行的 id, 按组收集
+
+    返回:
+    - x: 升序的小时编号
+    - t: 每组第一个原始时间点
+    - means: 每组每个 cell 的均值(保留2位小数), 形状为 (组数, cell数)
+    - group_ids: 按组顺序排列的 id
+    - counts: 每组的行数, 与 group_ids 一起还原每组的 id 列表
+    """
+    hour_codes = np.asarray(hour_codes)
+    x, first_idx, inverse, counts = np.unique(
+        hour_codes, return_index=True, return_inverse=True, return_counts=True
+    )
+
+    # 与 hourly_metric_means 相同, 一次 groupby 计算所有 cell 的均值, 结果与逐个 cell 分组一致
+    means = pd.DataFrame(np.asarray(cell_values, dtype=float)).groupby(inverse).mean()
+    means = means.round(2).to_numpy(dtype=float)
+
+    # 每组的 id 列表和第一个时间点对所有 cell 都相同, 只计算一次
+    order = np.argsort(inverse, kind="stable")
+    group_ids = np.asarray(ids)[order]
+    t = np.asarray(datetimes, dtype="datetime64[ns]")[first_idx]
+    return x, t, means, group_ids, counts
+
+
+def hourly_metric_means(hour_codes, metric_df: pd.DataFrame) -> np.ndarray:
+    """
+    按小时编号对多个指标一次分组求均值(忽略空值)
+
+    参数:
+    - hour_codes: 每行的小时编号, 组的集合需与 hourly_cell_means 一致
+    - metric_df: 指标列组成的 DataFrame, 每列一个指标
+
+    返回: 每组每个指标的均值(保留2位小数, 无数据为 NaN), 形状为 (组数, 指标数)
+    """
+    values = metric_df.apply(pd.to_numeric, errors="coerce")
+    values.index = pd.RangeIndex(len(values))
+
+    # 一次 groupby 同时计算所有指标的均值
+    grouped = values.groupby(np.asarray(hour_codes)).mean()
+    return grouped.round(2).to_numpy(dtype=float)
+
+
+def nan_to_none(values) -> list:
+    """数值数组转列表, NaN 替换为 None, 避免JSON序列化错误"""
+    return [None if value != value else value for value in np.asarray(values, dtype=float).tolist()]
@@ -0,0 +1,136 @@
+"""
+cell 有效性筛选和小时均值的对比测试
+
+用法(在 backend 目录下执行):
+    python -m app.bench_analysis              # 默认 200000 行
+    python -m app.bench_analysis 50000        # 指定行数
+
+按 10 秒一行生成 20 个 cell 的电压数据(2位小数, 含停机时段的0值、空值和低于1680的值), 对比:
+- 原流程: 逐个 cell 复制 DataFrame, groupby 求小时均值并计算均值为0的小时占比
+- analysis: select_valid_cells + hourly_cell_means, 以及把数据分批累加的 update_cell_stats
+检查有效 cell、全局起始时间、每个小时的均值和 id 列表逐位一致, 并输出两者的耗时
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from .analysis import (CELL_FIELDS, CELL_VOLTAGE_THRESHOLD, ZERO_RATIO_LIMIT, NS_PER_HOUR, cell_matrix,
+                       continuous_hour_codes, hourly_cell_means, new_cell_stats, select_valid_cells,
+                       update_cell_stats, valid_cell_mask)
+
+BATCH_ROWS = 7000  # 分批累加时每批的行数
+
+
+def generate_frame(count: int, seed: int = 0) -> pd.DataFrame:
+    """生成 count 行数据, 已按时间升序排列并包含 datetime 列"""
+    rng = np.random.default_rng(seed)
+    datetimes = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(count) * 10, unit="s")
+    values = np.round(rng.uniform(1650, 2200, (count, len(CELL_FIELDS))), 2)
+    # 停机时段(约每 30 小时停 5 小时)全部为0
+    values[(np.arange(count) // 360) % 30 >= 25] = 0
+    # cell_1 大部分小时为0, cell_2 第一天没有 >1680 的值, 其余随机出现空值
+    values[(np.arange(count) // 360) % 20 < 17, 0] = 0
+    values[:8640, 1] = 1600
+    values[rng.random(values.shape) < 0.002] = np.nan
+
+    df = pd.DataFrame(values, columns=CELL_FIELDS)
+    df.insert(0, "datetime", datetimes)
+    df.insert(0, "id", np.arange(1, count + 1))
+    return df
+
+
+def legacy_analysis(df: pd.DataFrame) -> tuple:
+    """原流程: 返回 (有效cell, 全局起始时间, {cell: (x, y, id列表)})"""
+    valid_cells = []
+    start_times = []
+    for cell_field in CELL_FIELDS:
+        cell_df = df[["datetime", cell_field]].copy()
+        cell_df.columns = ["datetime", "value"]
+        cell_df["value"] = pd.to_numeric(cell_df["value"], errors="coerce")
+        valid_indices = cell_df[cell_df["value"] > CELL_VOLTAGE_THRESHOLD].index
+        if len(valid_indices) == 0:
+            continue
+        cell_df = cell_df.loc[valid_indices[0]:].copy()
+        temp_start_time = cell_df.iloc[0]["datetime"]
+        cell_df["time_diff"] = ((cell_df["datetime"] - temp_start_time).dt.total_seconds() / 3600).astype(int)
+        grouped = cell_df.groupby("time_diff").agg({"value": "mean"}).reset_index()
+        zero_ratio = (grouped["value"].round(2) == 0).sum() / len(grouped)
+        if zero_ratio <= ZERO_RATIO_LIMIT:
+            valid_cells.append(cell_field)
+            start_times.append(temp_start_time)
+    if not valid_cells:
+        return [], None, {}
+
+    global_start_time = max(start_times)
+    filtered = df[df["datetime"] >= global_start_time]
+    filtered = filtered[(filtered[valid_cells] >= CELL_VOLTAGE_THRESHOLD).all(axis=1)].copy()
+    filtered["time_diff"] = continuous_hour_codes(filtered["datetime"].unique(), filtered["datetime"])
+    voltage = {}
+    for cell_field in valid_cells:
+        grouped = filtered.groupby("time_diff").agg({cell_field: "mean", "id": lambda x: x.tolist()}).reset_index()
+        voltage[cell_field] = (grouped["time_diff"].tolist(), grouped[cell_field].round(2).tolist(),
+                               grouped["id"].tolist())
+    return valid_cells, global_start_time, voltage
+
+
+def current_analysis(df: pd.DataFrame) -> tuple:
+    """analysis 模块: 返回值与 legacy_analysis 相同"""
+    valid_cells, global_start_time, row_mask, cell_values, _ = select_valid_cells(df)
+    if not valid_cells:
+        return [], None, {}
+
+    datetimes = df["datetime"].to_numpy()[row_mask]
+    hour_codes = continuous_hour_codes(np.unique(datetimes), datetimes)
+    x, _, means, group_ids, counts = hourly_cell_means(
+        hour_codes, cell_values[row_mask], datetimes, df["id"].to_numpy()[row_mask]
+    )
+    id_lists = [ids.tolist() for ids in np.split(group_ids, np.cumsum(counts)[:-1])]
+    voltage = {cell_field: (x.tolist(), means[:, i].tolist(), id_lists) for i, cell_field in enumerate(valid_cells)}
+    return valid_cells, global_start_time, voltage
+
+
+def batched_valid_cells(df: pd.DataFrame) -> tuple:
+    """分批调用 update_cell_stats, 返回 (有效cell, 全局起始时间)"""
+    stats = new_cell_stats(CELL_FIELDS)
+    values = cell_matrix(df, CELL_FIELDS)
+    times = df["datetime"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    for start in range(0, len(df), BATCH_ROWS):
+        update_cell_stats(stats, values[start:start + BATCH_ROWS], times[start:start + BATCH_ROWS])
+    valid_idx = np.flatnonzero(valid_cell_mask(stats))
+    if not len(valid_idx):
+        return [], None
+    return [CELL_FIELDS[i] for i in valid_idx], pd.Timestamp(int(stats["start"][valid_idx].max()))
+
+
+def timed(function, df: pd.DataFrame):
+    started = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - started
+
+
+def main(argv):
+    total = int(argv[0]) if argv else 200000
+    df = generate_frame(total)
+    print(f"[Bench] {total} 行 x {len(CELL_FIELDS)} 个 cell, 约 {total * 10 // (NS_PER_HOUR // 10 ** 9)} 小时")
+
+    legacy, legacy_seconds = timed(legacy_analysis, df)
+    current, current_seconds = timed(current_analysis, df)
+    print(f"  {'原流程 (逐个 cell)':<28} {legacy_seconds:7.2f}秒")
+    print(f"  {'analysis':<28} {current_seconds:7.2f}秒  加速 {legacy_seconds / current_seconds:.2f}x")
+
+    if current[:2] != legacy[:2] or batched_valid_cells(df) != legacy[:2]:
+        print(f"[Bench] 有效cell不一致: 原流程 {legacy[:2]}, analysis {current[:2]}")
+        return 1
+    for cell_field, (x, y, ids) in legacy[2].items():
+        # 有效行的 cell 值均 >=1680, 均值没有 NaN, 浮点数直接比较即为逐位比较
+        if current[2][cell_field] != (x, y, ids):
+            print(f"[Bench] {cell_field} 的小时均值不一致")
+            return 1
+    print(f"[Bench] 有效cell {len(legacy[0])} 个, 与原流程逐位一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+"""
+CSV导出行格式化性能测试
+
+用法(在 backend 目录下执行):
+    python -m app.bench_export              # 默认 1000000 行
+    python -m app.bench_export 200000       # 指定行数
+
+按 wincc 的字段类型生成数据(DECIMAL 为 Decimal, TIME 为 timedelta), 每次取 EXPORT_CONFIG["chunk_rows"] 行
+经 csv.writer 写出并编码为 UTF-8, 与导出接口的流程一致。对比:
+- 原流程: 字典行, 每行重新定义 format_value 并逐个字段按字段名读取
+- format_export_row: 元组行, 由 EXPORT_COLUMNS 生成的格式化函数
+输出每秒处理的行数和CSV字节数, 并检查两者输出一致
+"""
+import csv
+import io
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from .config import EXPORT_CONFIG
+from .export_columns import EXPORT_COLUMNS, EXPORT_FIELDS, format_export_row
+
+POOL_ROWS = 10000  # 生成的不同行数, 测试时循环使用
+
+
+def generate_rows(count: int) -> list:
+    """生成 count 行元组数据, 约 2% 的数值为 NULL"""
+    rows = []
+    for i in range(count):
+        row = []
+        for column, _, fmt in EXPORT_COLUMNS:
+            if column == "machine_name":
+                value = f"{i % 15 + 1}#"
+            elif column == "machine_model":
+                value = "A1B2C3D4"
+            elif column == "date":
+                value = date(2024, 1, 1) + timedelta(days=i // 8640)
+            elif column == "time":
+                value = timedelta(seconds=i * 10 % 86400)
+            elif random.random() < 0.02:
+                value = None
+            elif fmt == 0:
+                value = random.randint(0, 2200)
+            else:
+                value = Decimal(f"{random.uniform(0, 2200):.{fmt}f}")
+            row.append(value)
+        rows.append(tuple(row))
+    return rows
+
+
+def legacy_format_row(row: dict) -> list:
+    """原流程的行格式化"""
+    def format_value(value, decimals=2):
+        if value is None:
+            return ""
+        try:
+            return f"{float(value):.{decimals}f}"
+        except (ValueError, TypeError):
+            return str(value) if value else ""
+
+    values = []
+    for column, _, fmt in EXPORT_COLUMNS:
+        if fmt is None:
+            values.append(row[column] or "")
+        elif isinstance(fmt, str):
+            values.append(row[column].strftime(fmt) if hasattr(row[column], "strftime") else str(row[column]))
+        else:
+            values.append(format_value(row[column], fmt))
+    return values
+
+
+def chunks(pool: list, total: int, chunk_rows: int):
+    """循环使用 pool 中的行, 共产生 total 行, 每块 chunk_rows 行"""
+    position = 0
+    while position < total:
+        start = position % len(pool)
+        size = min(chunk_rows, total - position, len(pool) - start)
+        yield pool[start:start + size]
+        position += size
+
+
+def write_csv(row_chunks, format_row) -> int:
+    """按导出接口的方式写出CSV, 返回字节数"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    total_bytes = 0
+    for rows in row_chunks:
+        writer.writerows(map(format_row, rows))
+        total_bytes += len(output.getvalue().encode("utf-8"))
+        output.seek(0)
+        output.truncate(0)
+    return total_bytes
+
+
+def bench(name: str, row_chunks, format_row, total: int) -> float:
+    started = time.perf_counter()
+    total_bytes = write_csv(row_chunks, format_row)
+    elapsed = time.perf_counter() - started
+    print(f"  {name:<36} {elapsed:7.2f}秒  {total / elapsed:10,.0f} 行/秒  {total_bytes / elapsed / 1024 / 1024:6.1f} MB/秒")
+    return elapsed
+
+
+def main(argv):
+    total = int(argv[0]) if argv else 1000000
+    chunk_rows = EXPORT_CONFIG["chunk_rows"]
+    pool = generate_rows(min(POOL_ROWS, total))
+    dict_pool = [dict(zip(EXPORT_FIELDS, row)) for row in pool]
+
+    if any(legacy_format_row(d) != format_export_row(t) for d, t in zip(dict_pool, pool)):
+        print("[Bench] 两种格式化的输出不一致")
+        return 1
+
+    print(f"[Bench] {total} 行 x {len(EXPORT_COLUMNS)} 列, 每块 {chunk_rows} 行")
+    legacy = bench("原流程 (字典行)", chunks(dict_pool, total, chunk_rows), legacy_format_row, total)
+    compiled = bench("format_export_row (元组行)", chunks(pool, total, chunk_rows), format_export_row, total)
+    print(f"[Bench] 加速 {legacy / compiled:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
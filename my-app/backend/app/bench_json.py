@@ -0,0 +1,80 @@
+"""
+MQTT消息 JSON 解码性能测试
+
+用法(在 backend 目录下执行):
+    python -m app.bench_json              # 默认 15台设备 x 20轮
+    python -m app.bench_json 100          # 指定轮数
+
+按 mqtt_sender.py 的格式生成消息, 对比:
+- 原流程: 接收时 payload.decode('utf-8'), 清洗时 json.loads(str)
+- 标准库直接解析 bytes: json.loads(bytes)
+- json_codec.loads: 清洗时实际使用的后端
+- orjson 解析 bytes (已安装时)
+输出每条消息的平均解码耗时和缓冲区中保存的消息大小
+"""
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from . import json_codec
+from .mqtt_tags import FIELD_TAGS, NUM_DEVICES, device_tag
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def generate_payloads(rounds: int) -> list:
+    """生成 rounds 轮所有设备所有字段的消息 payload (bytes)"""
+    payloads = []
+    for _ in range(rounds):
+        current_time = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        for device_num in range(1, NUM_DEVICES + 1):
+            for field in ['machine_model', *FIELD_TAGS]:
+                value = "A1B2C3D4" if field == 'machine_model' else round(random.uniform(0, 2200), 4)
+                payload = {
+                    "name": device_tag(field, device_num),
+                    "value": value,
+                    "qualityCode": 128,
+                    "time": current_time
+                }
+                payloads.append(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+    return payloads
+
+
+def bench(name: str, func, payloads: list, repeat: int = 5):
+    """执行 repeat 次取最快的一次, 输出每条消息的平均耗时"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for payload in payloads:
+            func(payload)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {name:<36} {best / len(payloads) * 1e6:8.2f} us/条")
+
+
+def main(argv):
+    rounds = int(argv[0]) if argv else 20
+    payloads = generate_payloads(rounds)
+    as_str = [payload.decode('utf-8') for payload in payloads]
+    bytes_size = sum(sys.getsizeof(payload) for payload in payloads)
+    str_size = sum(sys.getsizeof(payload) for payload in as_str)
+
+    print(f"[Bench] {len(payloads)} 条消息 ({NUM_DEVICES}台设备 x {len(FIELD_TAGS) + 1}个字段 x {rounds}轮)")
+    print(f"  缓冲区占用: 保存 bytes {bytes_size / 1024:.0f} KB, 保存 str {str_size / 1024:.0f} KB")
+    print("[Bench] 解码耗时")
+    bench("decode('utf-8') + json.loads(str)", lambda p: json.loads(p.decode('utf-8')), payloads)
+    bench("json.loads(bytes)", json.loads, payloads)
+    bench(f"json_codec.loads(bytes) [{json_codec.BACKEND}]", json_codec.loads, payloads)
+    if orjson is not None:
+        bench("orjson.loads(bytes)", orjson.loads, payloads)
+    else:
+        print("  orjson 未安装, 跳过")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,230 @@
+"""
+单设备图表状态缓存
+/api/get/one_device/all_data 的计算状态按 (machine_name, machine_model) 缓存,
+采用 LRU 淘汰并限制总内存
+- MQTT 写入新数据时只标记为 dirty, 下次请求时增量累加新数据
+- 手动修改或删除数据时按设备失效, 下次请求时全量重建
+
+缓存保存在每个进程中, 而 MQTT 只在 leader 进程写入, 手动修改由处理请求的进程执行。
+因此设备的版本号同时写入所有进程共享的 SharedGenerations 文件, 每次读取缓存前检查该文件,
+其他进程发布的失效和新数据在本进程中同样生效
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .chart_state import DeviceChartState
+from .config import CHART_CACHE_CONFIG, backend_path
+from .file_lock import file_lock
+
+
+class SharedGenerations:
+    """
+    所有进程共享的设备版本号文件 {machine_name: [数据修改版本, 写入版本]}
+
+    - bump: 加文件锁后读取、递增并替换文件
+    - read: 文件未变化(mtime 和大小相同)时返回上次读取的内容, 每次请求只需要一次 stat
+    """
+
+    EDIT = 0
+    INGEST = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._data = {}
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def bump(self, machine_name: str, kind: int) -> list:
+        """递增设备的版本号, 返回递增后的 [修改版本, 写入版本]"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with file_lock(self.path + ".lock"):
+            data = self._load()
+            generation = data.setdefault(machine_name, [0, 0])
+            generation[kind] += 1
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        return list(generation)
+
+    def read(self) -> dict:
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            return {}
+        with self._lock:
+            if stamp != self._stamp:
+                self._data = self._load()
+                self._stamp = stamp
+            return self._data
+
+
+class ChartCache:
+    """
+    线程安全的 LRU 缓存
+    - max_bytes: 缓存状态总大小上限(字节)
+    - max_entries: 最大缓存条目数
+
+    每个设备有两个版本号: 数据修改版本(失效时递增)和写入版本(有新数据时递增)。
+    写入缓存时携带计算开始前的版本号:
+    - 修改版本已变化说明计算期间数据被修改, 此时不写入缓存
+    - 写入版本已变化说明计算期间有新数据, 写入后标记为 dirty
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int, generation_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.shared = SharedGenerations(backend_path(generation_path)) if generation_path else None
+        # machine_name -> 本进程已处理的共享版本号 [修改版本, 写入版本], 启动时缓存为空, 已有的版本号视为已处理
+        self._seen = {machine_name: list(generation) for machine_name, generation in self.shared.read().items()} \
+            if self.shared else {}
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], DeviceChartState]" = OrderedDict()
+        self._sizes = {}  # key -> 写入时估算的大小
+        self._generations = {}  # machine_name -> 数据修改版本
+        self._ingest_generations = {}  # machine_name -> 写入版本
+        self._size = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "rebuilds": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "shared_invalidations": 0,  # 其他进程发布的修改使本进程缓存失效的次数
+        }
+
+    def sync(self):
+        """应用其他进程发布的版本号变化: 修改版本变化时失效, 写入版本变化时标记为 dirty"""
+        if self.shared is None:
+            return
+        shared = self.shared.read()
+        with self._lock:
+            for machine_name, generation in shared.items():
+                seen = self._seen.get(machine_name, [0, 0])
+                if generation == seen:
+                    continue
+                if generation[SharedGenerations.EDIT] != seen[SharedGenerations.EDIT]:
+                    self._invalidate_locked(machine_name)
+                    self.stats["shared_invalidations"] += 1
+                elif generation[SharedGenerations.INGEST] != seen[SharedGenerations.INGEST]:
+                    self._mark_dirty_locked(machine_name)
+                self._seen[machine_name] = list(generation)
+
+    def get(self, key: Tuple[str, str]) -> Optional[DeviceChartState]:
+        self.sync()
+        with self._lock:
+            state = self._entries.get(key)
+            if state is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return state
+
+    def generation(self, machine_name: str) -> Tuple[int, int]:
+        """获取设备当前版本号, 在开始计算前调用"""
+        with self._lock:
+            return self._generations.get(machine_name, 0), self._ingest_generations.get(machine_name, 0)
+
+    def put(self, key: Tuple[str, str], state: DeviceChartState, generation: Tuple[int, int]):
+        """写入缓存, generation 为计算开始前获取的版本号"""
+        size = state.nbytes()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            edit_generation, ingest_generation = generation
+            if self._generations.get(key[0], 0) != edit_generation:
+                return
+            if self._ingest_generations.get(key[0], 0) != ingest_generation:
+                state.dirty = True
+
+            if key in self._entries:
+                del self._entries[key]
+                self._size -= self._sizes.pop(key)
+            self._entries[key] = state
+            self._sizes[key] = size
+            self._size += size
+
+            # 超出内存或条目上限时淘汰最久未使用的条目
+            while self._size > self.max_bytes or len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._size -= self._sizes.pop(evicted)
+                self.stats["evictions"] += 1
+
+    def record(self, name: str):
+        """累加统计计数(refreshes / rebuilds)"""
+        with self._lock:
+            self.stats[name] += 1
+
+    def discard(self, key: Tuple[str, str], state: DeviceChartState):
+        """移除无法继续增量计算的状态(不影响版本号)"""
+        with self._lock:
+            if self._entries.get(key) is state:
+                del self._entries[key]
+                self._size -= self._sizes.pop(key)
+
+    def _mark_dirty_locked(self, machine_name: str):
+        self._ingest_generations[machine_name] = self._ingest_generations.get(machine_name, 0) + 1
+        for key, state in self._entries.items():
+            if key[0] == machine_name:
+                state.dirty = True
+
+    def _invalidate_locked(self, machine_name: str):
+        self._generations[machine_name] = self._generations.get(machine_name, 0) + 1
+        for key in [key for key in self._entries if key[0] == machine_name]:
+            del self._entries[key]
+            self._size -= self._sizes.pop(key)
+            self.stats["invalidations"] += 1
+
+    def _publish(self, machine_name: str, kind: int):
+        """把版本号变化写入共享文件, 本进程已经处理过, 记录为已处理"""
+        if self.shared is None:
+            return
+        try:
+            generation = self.shared.bump(machine_name, kind)
+        except OSError as e:
+            print(f"[ChartCache] 写入版本号文件失败: {str(e)}")
+            return
+        with self._lock:
+            seen = self._seen.setdefault(machine_name, [0, 0])
+            # 只有本次递增时才记录为已处理; 期间其他进程也发布了变化时保持不变, 由 sync 再处理一次
+            if generation[kind] == seen[kind] + 1:
+                seen[kind] = generation[kind]
+
+    def mark_dirty(self, machine_name: str):
+        """设备(所有型号)有新数据写入, 下次请求时增量累加; 同时通知其他进程"""
+        with self._lock:
+            self._mark_dirty_locked(machine_name)
+        self._publish(machine_name, SharedGenerations.INGEST)
+
+    def invalidate_machine(self, machine_name: str):
+        """使某个设备(所有型号)的缓存失效; 同时通知其他进程"""
+        with self._lock:
+            self._invalidate_locked(machine_name)
+        self._publish(machine_name, SharedGenerations.EDIT)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                **self.stats,
+            }
+
+
+chart_cache = ChartCache(**CHART_CACHE_CONFIG)
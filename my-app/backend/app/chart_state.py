@@ -0,0 +1,220 @@
+"""
+单设备图表的增量计算状态
+保存一台设备的聚合结果(有效cell、全局起始时间、连续时间偏移、按小时分组的结果和最后一个未结束的小时),
+有新数据时只把 id 大于水位线的行累加进来, 不再重新读取和计算整个历史
+"""
+import threading
+import uuid
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .analysis import (CELL_FIELDS, CELL_VOLTAGE_THRESHOLD, NS_PER_HOUR, build_datetime, cell_matrix,
+                       compress_time_gaps, hourly_cell_means, hourly_metric_means, nan_to_none,
+                       new_cell_stats, update_cell_stats, valid_cell_mask)
+
+
+class DeviceChartState:
+    """
+    单设备图表状态
+
+    - watermark_id: 已处理的最大 id, 增量查询只读取 id 更大的行
+    - version: 状态版本, 全量重建时变化, 客户端用它判断增量结果能否直接合并
+    - dirty: 有新数据写入但还没有累加
+    """
+
+    def __init__(self, machine_name: str, machine_model: str, metric_fields: list):
+        self.machine_name = machine_name
+        self.machine_model = machine_model
+        self.metric_fields = list(metric_fields)
+        self.version = uuid.uuid4().hex[:12]
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.content: Optional[bytes] = None  # 缓存的完整响应
+
+        self.watermark_id = 0
+        self.last_seen_ns: Optional[int] = None
+        self.cell_stats = new_cell_stats(CELL_FIELDS)
+        self.valid_idx = np.zeros(0, dtype=np.int64)
+        self.global_start_ns: Optional[int] = None
+
+        # 连续时间: 最后一个有效时间点及其连续时间偏移
+        self.last_valid_ns: Optional[int] = None
+        self.last_offset_ns = 0
+
+        # 按小时分组的结果
+        self.x = np.zeros(0, dtype=np.int64)
+        self.t = np.zeros(0, dtype="datetime64[ns]")
+        self.voltage = np.zeros((0, 0))
+        self.metrics = np.zeros((0, len(self.metric_fields)))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.id_counts = np.zeros(0, dtype=np.int64)
+
+        # 最后一个小时的原始行, 新数据落在同一小时时与其合并后重新计算
+        self.open_cell_rows: Optional[pd.DataFrame] = None
+        self.open_metric_rows: Optional[pd.DataFrame] = None
+
+    @property
+    def valid_cells(self) -> list:
+        return [CELL_FIELDS[i] for i in self.valid_idx]
+
+    @property
+    def global_start_time(self) -> Optional[pd.Timestamp]:
+        return None if self.global_start_ns is None else pd.Timestamp(self.global_start_ns)
+
+    @classmethod
+    def build(cls, machine_name: str, machine_model: str, df: pd.DataFrame, metric_fields: list):
+        """根据设备的全部数据构建状态"""
+        state = cls(machine_name, machine_model, metric_fields)
+        if not df.empty:
+            state.fold(df)
+        return state
+
+    def fold(self, df: pd.DataFrame) -> bool:
+        """
+        把新的行(已按 date, time 升序)累加到状态中
+
+        返回 False 表示无法增量计算, 需要全量重建:
+        - 新行的时间不晚于已处理的数据(补录或乱序)
+        - 新数据使有效cell集合或全局起始时间发生变化
+
+        抛出异常时状态恢复为调用前的样子(水位线、cell 统计和分组结果都不变), 之后可以重新累加相同的行
+        """
+        # 其他属性在累加时整体替换, 只有 cell_stats 中的数组被原地修改, 需要复制
+        snapshot = dict(vars(self))
+        snapshot["cell_stats"] = {key: value.copy() for key, value in self.cell_stats.items()}
+        try:
+            return self._fold(df)
+        except Exception:
+            vars(self).update(snapshot)
+            raise
+
+    def _fold(self, df: pd.DataFrame) -> bool:
+        if df.empty:
+            return True
+
+        df = df.reset_index(drop=True)
+        df["datetime"] = build_datetime(df)
+        times = df["datetime"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        if self.last_seen_ns is not None and times[0] <= self.last_seen_ns:
+            return False
+
+        values = cell_matrix(df, CELL_FIELDS)
+        update_cell_stats(self.cell_stats, values, times)
+        valid_idx = np.flatnonzero(valid_cell_mask(self.cell_stats))
+        global_start_ns = int(self.cell_stats["start"][valid_idx].max()) if len(valid_idx) else None
+
+        has_history = self.last_seen_ns is not None
+        if has_history and (not np.array_equal(valid_idx, self.valid_idx)
+                            or global_start_ns != self.global_start_ns):
+            return False
+
+        self.valid_idx = valid_idx
+        self.global_start_ns = global_start_ns
+        self.watermark_id = max(self.watermark_id, int(df["id"].max()))
+        self.last_seen_ns = int(times[-1])
+        self.content = None
+
+        if len(valid_idx):
+            self._aggregate(df, values[:, valid_idx], times)
+        return True
+
+    def _aggregate(self, df: pd.DataFrame, cell_values: np.ndarray, times: np.ndarray):
+        """对新行执行时间过滤、连续时间映射和按小时分组, 并与最后一个小时合并"""
+        # 全局起始时间之后且所有有效cell均>=1680的行
+        row_mask = (times >= self.global_start_ns) & (cell_values >= CELL_VOLTAGE_THRESHOLD).all(axis=1)
+        if not row_mask.any():
+            return
+        valid_times = np.unique(times[row_mask])
+
+        # 连续时间映射, 从上一个有效时间点继续累加
+        if self.last_valid_ns is None:
+            offsets = compress_time_gaps(valid_times.astype("datetime64[ns]"))
+        else:
+            offsets = compress_time_gaps(
+                np.concatenate(([self.last_valid_ns], valid_times)).astype("datetime64[ns]")
+            )[1:] + self.last_offset_ns
+
+        # 其他指标使用有效时间点上的所有行
+        metric_mask = np.isin(times, valid_times)
+        cell_rows = pd.DataFrame(cell_values[row_mask], columns=self.valid_cells)
+        cell_rows.insert(0, "id", df["id"].to_numpy()[row_mask])
+        cell_rows.insert(0, "datetime", df["datetime"].to_numpy()[row_mask])
+        cell_rows.insert(0, "x", offsets[np.searchsorted(valid_times, times[row_mask])] // NS_PER_HOUR)
+        metric_rows = df.loc[metric_mask, ["datetime"] + self.metric_fields].reset_index(drop=True)
+        metric_rows.insert(0, "x", offsets[np.searchsorted(valid_times, times[metric_mask])] // NS_PER_HOUR)
+
+        # 最后一个小时还可能有新数据, 与新行合并后重新计算该小时
+        keep = len(self.x)
+        if self.open_cell_rows is not None:
+            cell_rows = pd.concat([self.open_cell_rows, cell_rows], ignore_index=True)
+            metric_rows = pd.concat([self.open_metric_rows, metric_rows], ignore_index=True)
+            keep -= 1
+
+        x, t, voltage, group_ids, counts = hourly_cell_means(
+            cell_rows["x"].to_numpy(), cell_rows[self.valid_cells].to_numpy(),
+            cell_rows["datetime"].to_numpy(), cell_rows["id"].to_numpy()
+        )
+        metrics = hourly_metric_means(metric_rows["x"].to_numpy(), metric_rows[self.metric_fields])
+
+        kept_ids = int(self.id_counts[:keep].sum())
+        self.x = np.concatenate((self.x[:keep], x))
+        self.t = np.concatenate((self.t[:keep], t))
+        self.voltage = voltage if keep == 0 else np.concatenate((self.voltage[:keep], voltage))
+        self.metrics = metrics if keep == 0 else np.concatenate((self.metrics[:keep], metrics))
+        self.ids = np.concatenate((self.ids[:kept_ids], group_ids))
+        self.id_counts = np.concatenate((self.id_counts[:keep], counts))
+
+        self.last_valid_ns = int(valid_times[-1])
+        self.last_offset_ns = int(offsets[-1])
+        self.open_cell_rows = cell_rows[cell_rows["x"] == x[-1]].reset_index(drop=True)
+        self.open_metric_rows = metric_rows[metric_rows["x"] == x[-1]].reset_index(drop=True)
+
+    def series(self, since: Optional[int] = None):
+        """
+        生成图表数据
+
+        参数:
+        - since: 只返回 x >= since 的分组(增量结果), None 返回全部
+
+        返回: (voltage_data, metric_data)
+        - voltage_data: {cell: {"x", "y", "t", "id"}}
+        - metric_data: {field: {"x", "y", "t"}}
+        """
+        start = 0 if since is None else int(np.searchsorted(self.x, since))
+        x = self.x[start:].tolist()
+        t = pd.DatetimeIndex(self.t[start:]).strftime("%Y-%m-%d %H:%M:%S").tolist()
+        bounds = np.concatenate(([0], np.cumsum(self.id_counts)))
+        ids = [self.ids[bounds[i]:bounds[i + 1]].tolist() for i in range(start, len(self.x))]
+
+        voltage_data = {}
+        for j, cell in enumerate(self.valid_cells):
+            voltage_data[cell] = {
+                "x": x,
+                "y": nan_to_none(self.voltage[start:, j]),
+                "t": t,
+                "id": ids,
+            }
+        metric_data = {}
+        for j, field in enumerate(self.metric_fields):
+            metric_data[field] = {
+                "x": x,
+                "y": nan_to_none(self.metrics[start:, j]),
+                "t": t,
+            }
+        return voltage_data, metric_data
+
+    @property
+    def last_x(self) -> Optional[int]:
+        return int(self.x[-1]) if len(self.x) else None
+
+    def nbytes(self) -> int:
+        """估算状态占用的内存"""
+        size = sum(array.nbytes for array in (self.x, self.t, self.voltage, self.metrics, self.ids, self.id_counts))
+        for frame in (self.open_cell_rows, self.open_metric_rows):
+            if frame is not None:
+                size += int(frame.memory_usage(deep=True).sum())
+        if self.content is not None:
+            size += len(self.content)
+        return size
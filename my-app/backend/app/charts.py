@@ -1,28 +1,26 @@
-import time
-from fastapi import APIRouter, HTTPException
+import json
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
 import pymysql
 import pandas as pd
-import numpy as np
 from datetime import datetime
-from .config import DB_CONFIG
+from typing import Optional
+from .analysis import CELL_FIELDS
+from .chart_cache import chart_cache
+from .chart_state import DeviceChartState
+from .db import get_db_connection
+from .workers import run_heavy, run_light
 from pydantic import BaseModel
 
 router = APIRouter()
 
-
-def get_db_connection():
-    """获取数据库连接,最多重试10次,每次间隔1秒"""
-    last_error: Exception
-    for attempt in range(10):
-        try:
-            connection = pymysql.connect(**DB_CONFIG)
-            return connection
-        except Exception as e:
-            last_error = e
-            if attempt < 9:
-                time.sleep(1)
-    # 所有重试均失败,抛出HTTP异常
-    raise HTTPException(status_code=500, detail=f"数据库连接失败: {str(last_error)}")
+# 图表中除cell电压外的其他指标字段
+METRIC_FIELDS = [
+    'avg_voltage', 'voltage_range', 'pump_pressure', 'specific_gravity', 'hydrogen_flow_meter',
+    'inlet_pressure', 'oxygen_outlet_pressure', 'hydrogen_outlet_pressure',
+    'oxygen_outlet_temp', 'hydrogen_outlet_temp', 'oxygen_in_hydrogen', 'hydrogen_in_oxygen',
+    'pressure_diff',
+]
 
 
 @router.get("/device_list")
@@ -30,6 +28,10 @@ async def get_device_list():
     """
     获取 wincc 表中所有唯一的 machine_name 和 machine_model 组合
     """
+    return await run_light(_get_device_list)
+
+
+def _get_device_list():
     connection = get_db_connection()
     cursor = connection.cursor(pymysql.cursors.DictCursor)
 
@@ -55,286 +57,68 @@ async def get_device_list():
         connection.close()
 
 
+@router.get("/cache/stats")
+async def get_chart_cache_stats():
+    """
+    获取单设备图表缓存的命中统计
+    refreshes 为增量累加次数, rebuilds 为无法增量计算而全量重建的次数
+
+    返回:
+    {
+        "entries": 3,
+        "size_bytes": 1234567,
+        "max_bytes": 67108864,
+        "hits": 10,
+        "misses": 3,
+        "refreshes": 5,
+        "rebuilds": 1,
+        "evictions": 0,
+        "invalidations": 2
+    }
+    """
+    return chart_cache.status()
+
+
 @router.get("/one_device/all_data")
-async def get_all_device_data(machine_name: str, machine_model: str):
+async def get_all_device_data(
+        machine_name: str,
+        machine_model: str,
+        since: Optional[int] = Query(None, description="增量查询: 只返回 x >= since 的分组"),
+        version: Optional[str] = Query(None, description="上次响应中的 version, 与当前不一致时返回全量数据"),
+):
     """
     优化版本: 一次性获取设备的所有数据
-    1. 只进行一次数据库查询
+    1. 只进行一次数据库查询, 之后只增量读取新写入的数据
     2. 基于cell数据过滤后的时间点来确保所有数据的时间一致性
     3. 返回所有图表所需的数据
+
+    增量模式: 传入上次响应的 last_x 作为 since 和 version, 只返回 x >= since 的分组
+    (最后一个小时的分组可能被更新, 客户端按 x 覆盖); version 不一致说明数据已全量重建,
+    此时返回全量数据且 is_incremental 为 false
     """
+    return await run_heavy(_get_all_device_data, machine_name, machine_model, since, version)
+
+
+def _fetch_device_rows(machine_name: str, machine_model: str, after_id: int = 0) -> pd.DataFrame:
+    """查询设备数据, after_id 大于0时只查询 id 更大的新数据"""
     connection = get_db_connection()
     cursor = connection.cursor(pymysql.cursors.DictCursor)
 
     try:
         # 一次性查询所有需要的字段
-        sql = '''
-              SELECT id, date, time, cell_1, cell_2, cell_3, cell_4, cell_5, cell_6, cell_7, cell_8, cell_9, cell_10, cell_11, cell_12, cell_13, cell_14, cell_15, cell_16, cell_17, cell_18, cell_19, cell_20, avg_voltage, voltage_range, pump_pressure, specific_gravity, hydrogen_flow_meter, inlet_pressure, oxygen_outlet_pressure, hydrogen_outlet_pressure, oxygen_outlet_temp, hydrogen_outlet_temp, oxygen_in_hydrogen, hydrogen_in_oxygen, pressure_diff
+        sql = f'''
+              SELECT id, date, time, {', '.join(CELL_FIELDS)}, {', '.join(METRIC_FIELDS)}
               FROM wincc
               WHERE machine_name = %s
                 AND machine_model = %s
+                AND id > %s
               ORDER BY date, time
               '''
-        cursor.execute(sql, (machine_name, machine_model))
+        cursor.execute(sql, (machine_name, machine_model, after_id))
         results = cursor.fetchall()
 
         # 使用 pandas 处理数据
-        df = pd.DataFrame(results)
-
-        if df.empty:
-            return {
-                "status": "success",
-                "data": {},
-                "global_start_time": None
-            }
-
-        # 组合 date 和 time 成 datetime
-        df['date'] = pd.to_datetime(df['date'])
-
-        # 如果 time 是 timedelta,直接加到 date 上
-        if pd.api.types.is_timedelta64_dtype(df['time']) or isinstance(df['time'].iloc[0], pd.Timedelta):
-            df['datetime'] = df['date'] + df['time']
-        else:
-            # 如果 time 是字符串或时间类型,转换为 timedelta
-            df['datetime'] = pd.to_datetime(df['date'].astype(str) + ' ' + df['time'].astype(str))
-
-        # ===== 步骤1: 处理cell数据,计算每个cell的zero_ratio,排除>0.8的cell =====
-        valid_cells = []
-        for i in range(1, 21):  # cell_1 到 cell_20
-            cell_field = f'cell_{i}'
-
-            if cell_field not in df.columns:
-                continue
-
-            # 创建副本避免警告
-            cell_df = df[['datetime', cell_field]].copy()
-            cell_df.columns = ['datetime', 'value']
-
-            # 转换为数值类型
-            cell_df['value'] = pd.to_numeric(cell_df['value'], errors='coerce')
-
-            # 找到第一个非0且>1680的值的索引
-            mask = (cell_df['value'] > 0) & (cell_df['value'] > 1680)
-            valid_indices = cell_df[mask].index
-
-            if len(valid_indices) == 0:
-                continue
-
-            # 从第一个>1680的值开始计算
-            start_idx = valid_indices[0]
-            cell_df = cell_df.loc[start_idx:].copy()
-
-            # 计算临时时间差用于分组
-            temp_start_time = cell_df.iloc[0]['datetime']
-            cell_df['time_diff'] = ((cell_df['datetime'] - temp_start_time).dt.total_seconds() / 3600).astype(int)
-
-            # 分组计算 y=0 比例
-            grouped_temp = cell_df.groupby('time_diff').agg({
-                'value': 'mean'
-            }).reset_index()
-            grouped_temp.columns = ['x', 'y']
-            grouped_temp['y'] = grouped_temp['y'].round(2)
-
-            zero_ratio = (grouped_temp['y'] == 0).sum() / len(grouped_temp) if len(grouped_temp) > 0 else 0
-
-            # 只保留zero_ratio <= 0.8的cell
-            if zero_ratio <= 0.8:
-                valid_cells.append(cell_field)
-
-        # 如果没有有效的cell,返回空数据
-        if len(valid_cells) == 0:
-            return {
-                "status": "success",
-                "data": {},
-                "global_start_time": None
-            }
-
-        # ===== 步骤2: 获取剩余cell的起始时间点,为所有cell均>1680的最小时间点 =====
-        start_time_candidates = []
-        for cell_field in valid_cells:
-            cell_df = df[['datetime', cell_field]].copy()
-            cell_df.columns = ['datetime', 'value']
-            cell_df['value'] = pd.to_numeric(cell_df['value'], errors='coerce')
-
-            # 找到第一个非0且>1680的值
-            mask = (cell_df['value'] > 0) & (cell_df['value'] > 1680)
-            valid_indices = cell_df[mask].index
-
-            if len(valid_indices) > 0:
-                start_time = cell_df.loc[valid_indices[0], 'datetime']
-                start_time_candidates.append(start_time)
-
-        # 使用最晚的起始时间,确保所有cell在这个时间点都>1680
-        global_start_time = max(start_time_candidates)
-
-        # ===== 步骤3: 基于global_start_time过滤数据,并获取实际的时间点列表 =====
-        # 先处理cell数据,获取过滤后的实际时间点
-        cell_df_filtered = df[['datetime', 'id'] + valid_cells].copy()
-
-        # 转换所有cell列为数值类型
-        for cell_field in valid_cells:
-            cell_df_filtered[cell_field] = pd.to_numeric(cell_df_filtered[cell_field], errors='coerce')
-
-        # 使用全局起始时间筛选数据
-        cell_df_filtered = cell_df_filtered[cell_df_filtered['datetime'] >= global_start_time].copy()
-
-        # 过滤掉任意cell < 1680 的行,确保所有cell都>=1680
-        mask = pd.Series([True] * len(cell_df_filtered), index=cell_df_filtered.index)
-        for cell_field in valid_cells:
-            mask &= (cell_df_filtered[cell_field] >= 1680)
-
-        cell_df_filtered = cell_df_filtered[mask].copy()
-
-        if cell_df_filtered.empty:
-            return {
-                "status": "success",
-                "data": {},
-                "global_start_time": global_start_time.strftime('%Y-%m-%d %H:%M:%S')
-            }
-
-        # 获取过滤后的有效时间点列表(这是基准时间点,用于过滤其他数据)
-        valid_datetimes = cell_df_filtered['datetime'].unique()
-        valid_datetimes = pd.Series(valid_datetimes).sort_values().reset_index(drop=True)
-
-        # ===== 新增步骤: 将不连续的时间映射为连续的时间序列 =====
-        # 规则: 如果时间差<=60分钟,保持原差值; 如果>60分钟,增加0
-
-        # 计算所有时间与前一个时间的差值(分钟)
-        time_diffs = []
-        for i in range(len(valid_datetimes)):
-            if i == 0:
-                time_diffs.append(0)  # 第一个点差值为0
-            else:
-                diff_minutes = (valid_datetimes[i] - valid_datetimes[i - 1]).total_seconds() / 60
-                time_diffs.append(diff_minutes)
-
-        # 生成连续时间序列
-        continuous_datetimes = [global_start_time]  # 第一个点使用全局起始时间
-        for i in range(1, len(valid_datetimes)):
-            diff = time_diffs[i]
-            if diff <= 60:
-                # 差值<=60分钟,保持原差值
-                next_time = continuous_datetimes[-1] + pd.Timedelta(minutes=diff)
-            else:
-                # 差值>60分钟,不增加
-                next_time = continuous_datetimes[-1] + pd.Timedelta(minutes=10)
-            continuous_datetimes.append(next_time)
-
-        # 创建时间映射表: 原始时间 -> 连续时间
-        datetime_mapping = dict(zip(valid_datetimes, continuous_datetimes))
-
-        # 保留原始时间用于显示,添加连续时间列用于计算time_diff
-        cell_df_filtered['datetime_original'] = cell_df_filtered['datetime']  # 保存原始时间
-        cell_df_filtered['datetime_continuous'] = cell_df_filtered['datetime'].map(datetime_mapping)  # 连续时间
-
-        # 计算时间差(小时),向下取整,用于分组(使用连续时间计算)
-        cell_df_filtered['time_diff'] = (
-                    (cell_df_filtered['datetime_continuous'] - global_start_time).dt.total_seconds() / 3600).astype(int)
-
-        # ===== 步骤4: 处理cell电压数据 =====
-        voltage_data = {}
-        for cell_field in valid_cells:
-            # 按time_diff分组计算平均值,同时获取每组的第一个原始时间点和id列表
-            grouped = cell_df_filtered.groupby('time_diff').agg({
-                cell_field: 'mean',
-                'datetime_original': 'first',  # 使用原始时间
-                'id': lambda x: x.tolist()  # 收集所有id到列表
-            }).reset_index()
-
-            # 重命名列为图表格式: x, y, t, id
-            grouped.columns = ['x', 'y', 't', 'id']
-            # 先round,再替换NaN为None,避免JSON序列化错误
-            grouped['y'] = grouped['y'].round(2)
-            grouped['y'] = grouped['y'].replace({np.nan: None})
-            # 将时间转换为字符串格式
-            grouped['t'] = grouped['t'].dt.strftime('%Y-%m-%d %H:%M:%S')
-
-            voltage_data[cell_field] = {
-                'x': grouped['x'].tolist(),
-                'y': grouped['y'].tolist(),
-                't': grouped['t'].tolist(),
-                'id': grouped['id'].tolist()
-            }
-
-        # ===== 步骤5: 使用相同的时间点过滤其他指标数据 =====
-        # 创建一个辅助函数来处理单个字段
-        def process_field(field_name, filter_condition=None):
-            """处理单个字段,使用valid_datetimes中的时间点并映射为连续时间"""
-            if field_name not in df.columns:
-                return {"x": [], "y": [], "t": []}
-
-            field_df = df[['datetime', field_name]].copy()
-            field_df[field_name] = pd.to_numeric(field_df[field_name], errors='coerce')
-
-            # 应用额外的过滤条件(如avg_voltage >= 1680)
-            if filter_condition is not None:
-                field_df = field_df[filter_condition(field_df[field_name])].copy()
-
-            # 只保留valid_datetimes中存在的时间点(这是关键:使用cell过滤后的原始时间点)
-            field_df = field_df[field_df['datetime'].isin(valid_datetimes)].copy()
-
-            if field_df.empty:
-                return {"x": [], "y": [], "t": []}
-
-            # 保留原始时间用于显示,添加连续时间列用于计算time_diff
-            field_df['datetime_original'] = field_df['datetime']  # 保存原始时间
-            field_df['datetime_continuous'] = field_df['datetime'].map(datetime_mapping)  # 连续时间
-
-            # 计算时间差(小时),向下取整,用于分组(使用连续时间计算)
-            field_df['time_diff'] = (
-                        (field_df['datetime_continuous'] - global_start_time).dt.total_seconds() / 3600).astype(int)
-
-            # 按time_diff分组计算平均值,同时获取每组的第一个原始时间点
-            grouped = field_df.groupby('time_diff').agg({
-                field_name: 'mean',
-                'datetime_original': 'first'  # 使用原始时间
-            }).reset_index()
-
-            # 重命名列
-            grouped.columns = ['x', 'y', 't']
-            # 先round,再替换NaN为None,避免JSON序列化错误
-            grouped['y'] = grouped['y'].round(2)
-            grouped['y'] = grouped['y'].replace({np.nan: None})
-            grouped['t'] = grouped['t'].dt.strftime('%Y-%m-%d %H:%M:%S')
-
-            return {
-                'x': grouped['x'].tolist(),
-                'y': grouped['y'].tolist(),
-                't': grouped['t'].tolist()
-            }
-
-        # 处理各个指标
-        result_data = {
-            "voltage": voltage_data,
-            "avg_voltage": process_field('avg_voltage'),
-            "voltage_range": process_field('voltage_range'),
-            "pump_pressure": process_field('pump_pressure'),
-            "specific_gravity": process_field('specific_gravity'),
-            "hydrogen_flow_meter": process_field('hydrogen_flow_meter'),
-            "inlet_outlet_pressure": {
-                "inlet_pressure": process_field('inlet_pressure'),
-                "oxygen_outlet_pressure": process_field('oxygen_outlet_pressure')
-            },
-            "oxygen_hydrogen_outlet_pressure": {
-                "oxygen_outlet_pressure": process_field('oxygen_outlet_pressure'),
-                "hydrogen_outlet_pressure": process_field('hydrogen_outlet_pressure')
-            },
-            "oxygen_hydrogen_outlet_temp": {
-                "oxygen_outlet_temp": process_field('oxygen_outlet_temp'),
-                "hydrogen_outlet_temp": process_field('hydrogen_outlet_temp')
-            },
-            "oxygen_hydrogen_cross": {
-                "oxygen_in_hydrogen": process_field('oxygen_in_hydrogen'),
-                "hydrogen_in_oxygen": process_field('hydrogen_in_oxygen')
-            },
-            "pressure_difference": process_field('pressure_diff')
-        }
-
-        return {
-            "status": "success",
-            "data": result_data,
-            "global_start_time": global_start_time.strftime('%Y-%m-%d %H:%M:%S')
-        }
+        return pd.DataFrame(results)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
     finally:
@@ -342,6 +126,130 @@ async def get_all_device_data(machine_name: str, machine_model: str):
         connection.close()
 
 
+def _build_device_state(machine_name: str, machine_model: str) -> DeviceChartState:
+    """全量读取设备数据并构建图表状态"""
+    try:
+        return DeviceChartState.build(
+            machine_name, machine_model, _fetch_device_rows(machine_name, machine_model), METRIC_FIELDS
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+
+def _get_all_device_data(machine_name: str, machine_model: str, since: Optional[int], version: Optional[str]):
+    """优先使用缓存的状态; 有新数据写入时只累加新数据, 无法增量计算时全量重建"""
+    cache_key = (machine_name, machine_model)
+    state = chart_cache.get(cache_key)
+    if state is None:
+        # 先记录版本号, 计算期间如果设备数据被修改则不写入缓存
+        generation = chart_cache.generation(machine_name)
+        state = _build_device_state(machine_name, machine_model)
+        chart_cache.put(cache_key, state, generation)
+    elif state.dirty:
+        state = _refresh_device_state(cache_key, state)
+
+    with state.lock:
+        if since is not None and version == state.version:
+            content = json.dumps(_build_payload(state, since), ensure_ascii=False,
+                                 separators=(",", ":")).encode("utf-8")
+        else:
+            content = _render_full(state)
+    return Response(content=content, media_type="application/json")
+
+
+def _refresh_device_state(cache_key, state: DeviceChartState) -> DeviceChartState:
+    """把新写入的数据累加到缓存的状态中, 无法增量计算时全量重建"""
+    machine_name, machine_model = cache_key
+    with state.lock:
+        if not state.dirty:
+            # 其他请求已经完成累加
+            return state
+        generation = chart_cache.generation(machine_name)
+        state.dirty = False
+        try:
+            folded = state.fold(_fetch_device_rows(machine_name, machine_model, state.watermark_id))
+        except Exception:
+            # 查询失败或 fold 抛出异常时状态保持不变, 下次请求重新读取并累加相同的行
+            state.dirty = True
+            raise
+
+    if folded:
+        # 重新写入以更新缓存大小
+        chart_cache.record("refreshes")
+        chart_cache.put(cache_key, state, generation)
+        return state
+
+    # 新数据改变了有效cell/起始时间或时间乱序, 全量重建
+    chart_cache.discard(cache_key, state)
+    chart_cache.record("rebuilds")
+    state = _build_device_state(machine_name, machine_model)
+    chart_cache.put(cache_key, state, generation)
+    return state
+
+
+def _render_full(state: DeviceChartState) -> bytes:
+    """完整响应的JSON, 状态未变化时直接复用"""
+    if state.content is None:
+        state.content = json.dumps(_build_payload(state), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return state.content
+
+
+def _build_payload(state: DeviceChartState, since: Optional[int] = None) -> dict:
+    """根据图表状态生成响应, since 不为空时只包含 x >= since 的分组"""
+    payload = {
+        "status": "success",
+        "data": {},
+        "global_start_time": None,
+        "version": state.version,
+        "last_x": state.last_x,
+        "is_incremental": since is not None,
+    }
+    # 没有有效的cell, 返回空数据
+    if not state.valid_cells:
+        return payload
+
+    payload["global_start_time"] = state.global_start_time.strftime('%Y-%m-%d %H:%M:%S')
+    # 没有所有cell均>=1680的数据
+    if state.last_x is None:
+        return payload
+
+    voltage_data, metrics = state.series(since)
+
+    def metric(field_name):
+        """获取单个指标的分组结果, 同一指标在多个图表中共用同一份数据"""
+        return metrics.get(field_name, {"x": [], "y": [], "t": []})
+
+    # 处理各个指标
+    payload["data"] = {
+        "voltage": voltage_data,
+        "avg_voltage": metric('avg_voltage'),
+        "voltage_range": metric('voltage_range'),
+        "pump_pressure": metric('pump_pressure'),
+        "specific_gravity": metric('specific_gravity'),
+        "hydrogen_flow_meter": metric('hydrogen_flow_meter'),
+        "inlet_outlet_pressure": {
+            "inlet_pressure": metric('inlet_pressure'),
+            "oxygen_outlet_pressure": metric('oxygen_outlet_pressure')
+        },
+        "oxygen_hydrogen_outlet_pressure": {
+            "oxygen_outlet_pressure": metric('oxygen_outlet_pressure'),
+            "hydrogen_outlet_pressure": metric('hydrogen_outlet_pressure')
+        },
+        "oxygen_hydrogen_outlet_temp": {
+            "oxygen_outlet_temp": metric('oxygen_outlet_temp'),
+            "hydrogen_outlet_temp": metric('hydrogen_outlet_temp')
+        },
+        "oxygen_hydrogen_cross": {
+            "oxygen_in_hydrogen": metric('oxygen_in_hydrogen'),
+            "hydrogen_in_oxygen": metric('hydrogen_in_oxygen')
+        },
+        "pressure_difference": metric('pressure_diff')
+    }
+    return payload
+
+
 # 请求体模型
 class UpdateMachineModelRequest(BaseModel):
     machine_name: str
@@ -366,6 +274,10 @@ async def update_machine_model(request: UpdateMachineModelRequest):
         "message": "更新成功"
     }
     """
+    return await run_light(_update_machine_model, request)
+
+
+def _update_machine_model(request: UpdateMachineModelRequest):
     connection = None
     try:
         connection = get_db_connection()
@@ -399,6 +311,9 @@ async def update_machine_model(request: UpdateMachineModelRequest):
         cursor.execute(update_sql, (request.new_machine_model, request.machine_name, request.old_machine_model))
         connection.commit()
 
+        # 型号变更后该设备的图表缓存失效
+        chart_cache.invalidate_machine(request.machine_name)
+
         updated_count = cursor.rowcount
 
         cursor.close()
@@ -447,6 +362,10 @@ async def get_raw_data(request: RawDataRequest):
         ]
     }
     """
+    return await run_light(_get_raw_data, request)
+
+
+def _get_raw_data(request: RawDataRequest):
     connection = None
     try:
         connection = get_db_connection()
@@ -512,6 +431,10 @@ async def update_raw_data(request: UpdateRawDataRequest):
         "deleted_count": 5
     }
     """
+    return await run_light(_update_raw_data, request)
+
+
+def _update_raw_data(request: UpdateRawDataRequest):
     connection = None
     try:
         connection = get_db_connection()
@@ -520,6 +443,14 @@ async def update_raw_data(request: UpdateRawDataRequest):
         updated_count = 0
         deleted_count = 0
 
+        # 0. 查询受影响的设备, 用于提交后使图表缓存失效
+        affected_ids = list(request.deletes) + [update['id'] for update in request.updates]
+        affected_machines = []
+        if affected_ids:
+            placeholders = ', '.join(['%s'] * len(affected_ids))
+            cursor.execute(f"SELECT DISTINCT machine_name FROM wincc WHERE id IN ({placeholders})", affected_ids)
+            affected_machines = [row[0] for row in cursor.fetchall()]
+
         # 1. 执行删除操作
         if request.deletes:
             placeholders = ', '.join(['%s'] * len(request.deletes))
@@ -551,6 +482,9 @@ async def update_raw_data(request: UpdateRawDataRequest):
         connection.commit()
         cursor.close()
 
+        for affected_machine in affected_machines:
+            chart_cache.invalidate_machine(affected_machine)
+
         return {
             "status": "success",
             "updated_count": updated_count,
@@ -1,3 +1,14 @@
+import os
+
+# backend 目录, 配置中的相对路径(data/...)都相对于该目录, 与启动时的工作目录无关
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def backend_path(path: str) -> str:
+    """把配置中的相对路径转换为 backend 目录下的绝对路径"""
+    return path if os.path.isabs(path) else os.path.join(BACKEND_DIR, path)
+
+
 DB_CONFIG = {
     "host": "gz-cdb-bqpsb1r0.sql.tencentcdb.com",
     "port": 21325,
@@ -7,12 +18,114 @@ DB_CONFIG = {
     "charset": "utf8mb4",
 }
 
+# 数据库连接池配置
+DB_POOL_CONFIG = {
+    "max_size": 10,  # 最大连接数
+    "min_size": 2,  # 启动时预热的连接数
+    "acquire_timeout": 10,  # 获取连接的最长等待时间(秒)
+    "ping_interval": 30,  # 空闲超过该秒数的连接在取出前先ping检查
+    "recycle": 3600,  # 连接最长存活时间(秒),避免被服务端wait_timeout断开
+    "connect_timeout": 10,  # 建立连接超时(秒)
+    "connect_retries": 3,  # 建立连接失败时的重试次数
+    "retry_interval": 1,  # 重试间隔(秒)
+}
+
+# 阻塞任务工作池配置
+# heavy: 图表分析、导出等耗时计算; light: 简单查询和数据修改
+# max_workers: 并发执行数; max_pending: 最大排队数; wait_timeout: 排队超时(秒), 超出返回503
+WORKER_CONFIG = {
+    "heavy": {"max_workers": 2, "max_pending": 8, "wait_timeout": 30},
+    "light": {"max_workers": 6, "max_pending": 32, "wait_timeout": 10},
+}
+
+# CSV导出配置
+# parallel_partitions > 1 时导出范围按 设备 x 自然日 拆分, 由共享线程池并发查询, 按顺序拼接后逐块发送,
+# 所有导出同时执行的分区查询(占用的连接)不超过 parallel_partitions, 每个导出最多缓存 parallel_partitions 个分区;
+# 为 1 时使用单个查询, 按块从服务端游标读取并逐块发送, 内存占用与时间范围无关, 导出期间一直占用一个连接池连接
+EXPORT_CONFIG = {
+    "chunk_rows": 2000,  # 每次读取和编码的行数
+    "max_streams": 2,  # 同时进行的导出数, 超过返回503
+    "parallel_partitions": 3,  # 同时查询的分区数上限(导出的吞吐量), 不超过连接池 max_size 的一半
+    "gzip_level": 6,  # gzip=true 时的压缩级别(1-9)
+    "arrow_batch_rows": 50000,  # parquet/arrow 每批(row group)的行数, 这两种格式需要安装 requirements-optional.txt 中的 pyarrow
+    "parquet_compression": "zstd",
+    "net_write_timeout": 600,  # 客户端下载较慢时 MySQL 等待发送结果的最长时间(秒)
+}
+
+# 后台导出任务配置 (/api/home/export/jobs)
+# 导出文件和任务信息保存在 dir 中, 相同参数且范围内没有新数据时复用已导出的文件
+EXPORT_JOB_CONFIG = {
+    "dir": "data/exports",  # 导出文件目录(相对于backend目录), 多个进程需要使用同一目录
+    "max_running": 1,  # 同时执行的任务数
+    "max_queued": 4,  # 所有进程排队和执行中的任务数上限, 超过返回503
+    "ttl": 3600,  # 导出文件保留时间(秒)
+    "max_bytes": 2 * 1024 * 1024 * 1024,  # 导出文件总大小上限(字节)
+    "progress_interval": 1,  # 写入进度的最短间隔(秒)
+    "heartbeat_interval": 10,  # 排队和执行中的任务更新任务文件的间隔(秒), 与是否读取到数据无关
+    "stale_seconds": 120,  # 排队和执行中的任务超过该秒数没有更新视为失败(进程已退出)
+}
+
+# 单设备图表结果缓存配置
+# 缓存在每个进程中各自保存; 设备的数据版本号写入 generation_path, 所有进程共享,
+# 使用 uvicorn --workers 时 MQTT 写入(leader 进程)和手动修改(任一进程)都能使其他进程的缓存失效
+# (多台机器时 generation_path 需要放在共享存储上)
+CHART_CACHE_CONFIG = {
+    "max_bytes": 64 * 1024 * 1024,  # 缓存总大小上限(字节)
+    "max_entries": 64,  # 最大缓存设备数
+    "generation_path": "data/chart_generations.json",  # 设备数据版本号文件(相对于backend目录)
+}
+
 # MQTT配置
+# mode: 接收方式
+# - thread: paho 在后台网络线程中接收(loop_start), 写入线程负责组批和写入
+# - asyncio: 在 FastAPI 的事件循环中接收和组批, 通过 asyncio.Queue 交给写入任务;
+#   需要支持 add_reader 的事件循环, 不支持时(如 Windows 的 ProactorEventLoop)退回 thread
+# clean_session=False 时使用持久会话: Broker 保留订阅, 并缓存断开期间的 QoS 1 消息,
+# 需要同时设置固定的 client_id(为 None 时使用随机ID, 只能使用 clean_session=True)
 MQTT_CONFIG = {
     "broker": "115.190.206.11",
     "port": 1883,
     "keepalive": 120,
     "topic": "WinCC/#",  # 订阅WinCC下的所有主题
+    "qos": 0,  # 订阅的QoS等级(0 或 1)
+    "client_id": None,  # 固定的客户端ID
+    "clean_session": True,
+    "mode": "thread",
+    "reconnect_min_delay": 1,  # 连接失败或断开后首次重连等待时间(秒), 之后指数增长
+    "reconnect_max_delay": 60,  # 最长重连等待时间(秒)
+    "reconnect_jitter": 0.5,  # 随机抖动比例, 实际等待时间在 [(1-jitter)*t, t] 之间
+}
+
+# MQTT消息缓冲区配置
+# overflow_policy: 缓冲区满时的处理方式
+# - drop_oldest: 丢弃最早的消息
+# - drop_newest: 丢弃新收到的消息
+# - spill: 写入本地文件, 由重试线程读回处理
+# 数据库不可用导致写入失败的消息也写入同一个本地文件, 数据库恢复后由重试线程按顺序重新写入
+MQTT_BUFFER_CONFIG = {
+    "max_messages": 50000,  # 缓冲区最大消息数
+    "overflow_policy": "drop_oldest",
+    "spool_path": "data/mqtt_spool.jsonl",  # 本地文件路径(相对于backend目录)
+    "replay_batch_size": 5000,  # 每次从本地文件读回的消息数
+    "replay_max_rate": 2000,  # 重新写入的最大速度(条/秒), 避免数据库刚恢复时被压垮
+    "retry_interval": 5,  # 数据库仍不可用时的首次重试间隔(秒), 之后指数增长
+    "max_retry_interval": 60,  # 最长重试间隔(秒)
+}
+
+# MQTT接收选主配置
+# 使用 uvicorn --workers 启动多个进程时, 只有持有锁的进程(leader)接收MQTT消息并写入数据库,
+# 其他进程只处理HTTP请求, leader 退出后由其他进程接替
+# - backend: file(文件锁, 同一台机器上的多个进程) / mysql(GET_LOCK 咨询锁, 可跨机器,
+#   数据库不可用时锁随连接释放, leader 会停止接收直到重新获得锁)
+# leader 定期把状态和日志写入 state_path, 其他进程的 /api/mqtt/status 和 /api/mqtt/logs 从该文件读取
+# (多台机器时 state_path 需要放在共享存储上)
+MQTT_LEADER_CONFIG = {
+    "backend": "file",
+    "lock_path": "data/mqtt_leader.lock",  # 文件锁路径(相对于backend目录)
+    "mysql_lock_name": "yk8_mqtt_ingest",  # GET_LOCK 的锁名
+    "state_path": "data/mqtt_state.json",
+    "state_interval": 2,  # leader 写入状态和检查锁的间隔(秒)
+    "election_interval": 5,  # 其他进程尝试成为 leader 的间隔(秒)
 }
 
 # debug 模式
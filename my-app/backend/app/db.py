@@ -0,0 +1,299 @@
+"""
+MySQL 连接池
+charts / home 路由和 MQTT 写入共享同一个有界连接池,
+避免每个请求都对远程云数据库重新进行 TCP+TLS+认证握手
+
+acquire / get_db_connection 会阻塞(等待空闲连接最多 acquire_timeout 秒, 新建连接时还会重试),
+只能在线程中调用: async 接口通过 workers 的 run_heavy / run_light 执行, 其他协程使用 asyncio.to_thread,
+不能在事件循环中直接调用
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from fastapi import HTTPException
+
+from .config import DB_CONFIG, DB_POOL_CONFIG
+
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    """在 acquire_timeout 内没有可用连接"""
+
+
+class PooledConnection:
+    """
+    连接池中的连接包装
+    用法与 pymysql 连接一致, close() 时把连接归还到连接池而不是真正断开
+    """
+
+    def __init__(self, pool: "ConnectionPool", raw: pymysql.connections.Connection):
+        self._pool = pool
+        self._raw = raw
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        """归还连接"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+    def discard(self):
+        """丢弃连接(连接状态不可信时使用),不再放回连接池"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw, discard=True)
+
+
+class ConnectionPool:
+    """
+    线程安全的有界 pymysql 连接池
+
+    - max_size: 最大连接数,超过后 acquire 会等待
+    - acquire_timeout: 等待可用连接的最长时间,超时抛出 PoolTimeoutError
+    - ping_interval: 空闲超过该秒数的连接在取出前先 ping 检查
+    - recycle: 连接创建超过该秒数后重建,避免被服务端 wait_timeout 断开
+    """
+
+    def __init__(self, db_config: dict, max_size: int = 10, min_size: int = 0,
+                 acquire_timeout: float = 10, ping_interval: float = 30,
+                 recycle: float = 3600, connect_timeout: float = 10,
+                 connect_retries: int = 3, retry_interval: float = 1):
+        self.db_config = db_config
+        self.max_size = max_size
+        self.min_size = min(min_size, max_size)
+        self.acquire_timeout = acquire_timeout
+        self.ping_interval = ping_interval
+        self.recycle = recycle
+        self.connect_timeout = connect_timeout
+        self.connect_retries = max(1, connect_retries)
+        self.retry_interval = retry_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # [(connection, 上次归还时间)], 后进先出
+        self._created_at = {}  # id(connection) -> 创建时间
+        self._size = 0  # 已创建(空闲+使用中)的连接数
+        self._closed = False
+
+        # 统计信息
+        self.stats = {
+            "acquired": 0,
+            "created": 0,
+            "discarded": 0,
+            "timeouts": 0,
+        }
+
+    def _connect(self) -> pymysql.connections.Connection:
+        """创建新的物理连接,失败时按配置重试"""
+        last_error: Exception
+        for attempt in range(self.connect_retries):
+            try:
+                connection = pymysql.connect(connect_timeout=self.connect_timeout, **self.db_config)
+                self._created_at[id(connection)] = time.monotonic()
+                return connection
+            except Exception as e:
+                last_error = e
+                if attempt < self.connect_retries - 1:
+                    time.sleep(self.retry_interval)
+        raise last_error
+
+    def _close_raw(self, connection):
+        self._created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, connection, idle_since: float) -> bool:
+        """取出前的健康检查: 超过 recycle 的连接重建, 空闲过久的连接先 ping"""
+        now = time.monotonic()
+        created_at = self._created_at.get(id(connection), now)
+        if self.recycle and now - created_at > self.recycle:
+            return False
+        if not connection.open:
+            return False
+        if now - idle_since > self.ping_interval:
+            try:
+                connection.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        获取连接
+        没有空闲连接且已达到 max_size 时等待, 超过 timeout 抛出 PoolTimeoutError
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            candidate = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise pymysql.err.InterfaceError("连接池已关闭")
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise PoolTimeoutError(f"获取数据库连接超时({timeout}秒), 连接池已满({self.max_size})")
+                    self._cond.wait(remaining)
+
+            if candidate is not None:
+                connection, idle_since = candidate
+                # 健康检查在锁外执行, ping 需要一次网络往返
+                if self._is_healthy(connection, idle_since):
+                    with self._cond:
+                        self.stats["acquired"] += 1
+                    return PooledConnection(self, connection)
+                self._close_raw(connection)
+                with self._cond:
+                    self.stats["discarded"] += 1
+                # 旧连接作废后占用的名额直接用于新建连接
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.stats["created"] += 1
+                self.stats["acquired"] += 1
+            return PooledConnection(self, connection)
+
+    def release(self, connection, discard: bool = False):
+        """归还连接; 未结束的事务会先回滚, 避免下一个使用者读到旧快照"""
+        if not discard and connection.open:
+            try:
+                if connection.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    connection.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._close_raw(connection)
+
+        with self._cond:
+            if discard or self._closed:
+                if not discard:
+                    self._close_raw(connection)
+                self._size -= 1
+                self.stats["discarded"] += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def warm_up(self):
+        """预先建立 min_size 个连接, 失败时只记录日志"""
+        connections = []
+        try:
+            for _ in range(self.min_size):
+                connections.append(self.acquire())
+        except Exception as e:
+            print(f"[DB] 连接池预热失败: {e}")
+        finally:
+            for connection in connections:
+                connection.close()
+
+    def close(self):
+        """关闭连接池和所有空闲连接, 使用中的连接在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection, _ in idle:
+            self._close_raw(connection)
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                **self.stats,
+            }
+
+
+# 全局连接池, 由 main.py 的 lifespan 创建和关闭
+db_pool: Optional[ConnectionPool] = None
+db_pool_lock = threading.Lock()
+
+
+def init_db_pool() -> ConnectionPool:
+    """创建全局连接池(重复调用返回同一个实例)"""
+    global db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            db_pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
+        return db_pool
+
+
+def get_db_pool() -> ConnectionPool:
+    """获取全局连接池, 未初始化时(如独立脚本)自动创建"""
+    if db_pool is None:
+        return init_db_pool()
+    return db_pool
+
+
+def close_db_pool():
+    """关闭全局连接池"""
+    global db_pool
+    with db_pool_lock:
+        if db_pool is not None:
+            db_pool.close()
+            db_pool = None
+
+
+def get_db_connection() -> PooledConnection:
+    """从连接池获取数据库连接(供路由在工作线程中使用), 失败时抛出HTTP异常"""
+    try:
+        return get_db_pool().acquire()
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=f"数据库繁忙: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"数据库连接失败: {str(e)}")
+
+
+def datetime_range_conditions(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                              alias: str = "") -> Tuple[List[str], list]:
+    """
+    生成按 (date, time) 过滤时间范围的 WHERE 条件
+
+    等价于 CONCAT(date, ' ', time) >= start AND CONCAT(date, ' ', time) <= end,
+    但不对列做运算, 可以使用 (machine_name, date, time) / (date, time) 索引:
+    先用 date 的范围缩小扫描区间, 只在边界日期上再比较 time
+
+    参数:
+    - start / end: 起止时间(包含), 为 None 时不限制
+    - alias: 表别名, 如 "t1"
+
+    返回: (条件列表, 参数列表), 条件之间用 AND 连接
+    """
+    prefix = f"{alias}." if alias else ""
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append(f"{prefix}date >= %s AND ({prefix}date > %s OR {prefix}time >= %s)")
+        params += [start.date(), start.date(), start.strftime("%H:%M:%S")]
+    if end is not None:
+        conditions.append(f"{prefix}date <= %s AND ({prefix}date < %s OR {prefix}time <= %s)")
+        params += [end.date(), end.date(), end.strftime("%H:%M:%S")]
+    return conditions, params
@@ -0,0 +1,154 @@
+"""
+合并 wincc 中 (machine_name, date, time) 重复的数据
+
+用法(在 backend 目录下执行):
+    python -m app.dedup                 # 合并所有重复数据
+    python -m app.dedup --dry-run       # 只统计, 不修改
+    python -m app.dedup --machine 1#    # 只处理一台设备
+
+同一组重复行保留 id 最小的一行, 每个字段取组内 id 最大的非空值(与 MQTT 写入时后到的数据覆盖先到的一致),
+其余行删除。每次处理 CHUNK_GROUPS 组, 每批一个事务。
+合并后执行 python -m app.migrate 创建唯一索引; 服务运行中执行时, 完成后重启服务使图表缓存重新计算
+"""
+import sys
+from datetime import datetime
+from typing import Optional
+
+import pymysql
+
+from .db import get_db_pool, close_db_pool
+
+CHUNK_GROUPS = 500  # 每批处理的重复组数
+KEY_FIELDS = ("machine_name", "date", "time")
+
+
+def duplicate_filter(machine_name: Optional[str]):
+    """重复组查询的 WHERE 条件, NULL 不受唯一索引约束, 不参与合并"""
+    conditions = ["machine_name IS NOT NULL", "date IS NOT NULL", "time IS NOT NULL"]
+    params = []
+    if machine_name:
+        conditions.append("machine_name = %s")
+        params.append(machine_name)
+    return " AND ".join(conditions), params
+
+
+def duplicate_summary(cursor, machine_name: Optional[str] = None):
+    """返回 (重复组数, 需要删除的行数)"""
+    where, params = duplicate_filter(machine_name)
+    cursor.execute(
+        f"""
+        SELECT COUNT(*), COALESCE(SUM(cnt - 1), 0)
+        FROM (SELECT COUNT(*) AS cnt
+              FROM wincc
+              WHERE {where}
+              GROUP BY machine_name, date, time
+              HAVING COUNT(*) > 1) AS duplicates
+        """,
+        params,
+    )
+    groups, extra_rows = cursor.fetchone()
+    return int(groups), int(extra_rows)
+
+
+def duplicate_keys(cursor, machine_name: Optional[str] = None, limit: int = CHUNK_GROUPS) -> list:
+    """最多 limit 组重复的 (machine_name, date, time)"""
+    where, params = duplicate_filter(machine_name)
+    cursor.execute(
+        f"""
+        SELECT machine_name, date, time
+        FROM wincc
+        WHERE {where}
+        GROUP BY machine_name, date, time
+        HAVING COUNT(*) > 1
+        LIMIT %s
+        """,
+        params + [limit],
+    )
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def merge_rows(rows: list) -> tuple:
+    """
+    合并一组重复行(已按 id 升序)
+
+    返回: (保留的 id, 需要更新的字段 {字段: 值}, 需要删除的 id 列表)
+    """
+    keep = rows[0]
+    merged = {}
+    for row in rows:
+        for field, value in row.items():
+            if field != "id" and field not in KEY_FIELDS and value is not None:
+                merged[field] = value
+    changes = {field: value for field, value in merged.items() if keep[field] != value}
+    return keep["id"], changes, [row["id"] for row in rows[1:]]
+
+
+def dedup_chunk(connection, keys: list) -> tuple:
+    """合并一批重复组并提交, 返回 (更新的行数, 删除的行数)"""
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    try:
+        placeholders = ", ".join(["(%s, %s, %s)"] * len(keys))
+        cursor.execute(
+            f"SELECT * FROM wincc WHERE (machine_name, date, time) IN ({placeholders}) ORDER BY id",
+            [value for key in keys for value in key],
+        )
+        groups = {}
+        for row in cursor.fetchall():
+            groups.setdefault(tuple(row[field] for field in KEY_FIELDS), []).append(row)
+
+        updated = 0
+        delete_ids = []
+        for rows in groups.values():
+            keep_id, changes, duplicate_ids = merge_rows(rows)
+            if changes:
+                set_clause = ", ".join(f"{field} = %s" for field in changes)
+                cursor.execute(f"UPDATE wincc SET {set_clause} WHERE id = %s", [*changes.values(), keep_id])
+                updated += 1
+            delete_ids += duplicate_ids
+
+        if delete_ids:
+            cursor.execute(f"DELETE FROM wincc WHERE id IN ({', '.join(['%s'] * len(delete_ids))})", delete_ids)
+        connection.commit()
+        return updated, len(delete_ids)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main(argv):
+    dry_run = "--dry-run" in argv
+    machine_name = argv[argv.index("--machine") + 1] if "--machine" in argv else None
+
+    connection = get_db_pool().acquire()
+    try:
+        cursor = connection.cursor()
+        groups, extra_rows = duplicate_summary(cursor, machine_name)
+        print(f"[Dedup] 重复数据 {groups} 组, 需要删除 {extra_rows} 行")
+        if dry_run or not groups:
+            for key in duplicate_keys(cursor, machine_name, limit=10):
+                print(f"[Dedup]   {key[0]} {key[1]} {key[2]}")
+            cursor.close()
+            return 0
+
+        started = datetime.now()
+        total_updated = total_deleted = 0
+        while True:
+            keys = duplicate_keys(cursor, machine_name)
+            if not keys:
+                break
+            updated, deleted = dedup_chunk(connection, keys)
+            total_updated += updated
+            total_deleted += deleted
+            print(f"[Dedup] 已合并 {len(keys)} 组, 累计更新 {total_updated} 行, 删除 {total_deleted} 行")
+        cursor.close()
+        print(f"[Dedup] 完成, 耗时 {(datetime.now() - started).total_seconds():.1f}秒")
+        return 0
+    finally:
+        connection.close()
+        close_db_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
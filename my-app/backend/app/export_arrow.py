@@ -0,0 +1,128 @@
+"""
+Parquet / Arrow 格式导出 (/api/home/export?format=parquet|arrow)
+
+查询结果按块(record batch)转换为 Arrow 列式数据后直接写出, 不经过字符串格式化:
+- INT 列为 int32, DECIMAL 列为 float64(pandas/numpy 可直接使用), date 为 date32, time 为 time32[s]
+- machine_name / machine_model 为字典编码, 字典在整个导出中累加, 各批次只写入新增的值
+- parquet: 每批一个 row group, 使用 zstd 压缩
+- arrow: Arrow IPC 文件格式(Feather v2), 不压缩, 可以 memory map 零拷贝读取
+
+pyarrow 是可选依赖, 未安装时 AVAILABLE 为 False, 只能导出CSV
+"""
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 是可选依赖
+    pa = None
+    pq = None
+
+AVAILABLE = pa is not None
+
+# 格式 -> (文件扩展名, media type)
+FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+# wincc 中的 INT 列, 其余数值列为 DECIMAL
+INT_FIELDS = {
+    "hours", "max_voltage", "min_voltage", "voltage_range", "oxygen_in_hydrogen", "hydrogen_in_oxygen",
+    *(f"cell_{i}" for i in range(1, 26)),
+}
+DICTIONARY_FIELDS = {"machine_name", "machine_model"}
+
+
+def arrow_type(field: str):
+    if field in DICTIONARY_FIELDS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if field == "date":
+        return pa.date32()
+    if field == "time":
+        return pa.time32("s")
+    if field in INT_FIELDS:
+        return pa.int32()
+    return pa.float64()
+
+
+class _ChunkSink(io.RawIOBase):
+    """只追加的输出, 写入的字节由 take() 取走, 用于边写边发送"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BatchBuilder:
+    """把查询结果(元组行)转换为 RecordBatch, 字典列的字典在各批次之间累加"""
+
+    def __init__(self, fields: list):
+        self.fields = list(fields)
+        self.schema = pa.schema([(field, arrow_type(field)) for field in self.fields])
+        self._dictionaries = {field: {} for field in self.fields if field in DICTIONARY_FIELDS}
+
+    def _column(self, field: str, values: tuple):
+        if field in DICTIONARY_FIELDS:
+            codes = self._dictionaries[field]
+            indices = [None if value is None else codes.setdefault(value, len(codes)) for value in values]
+            return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(list(codes), pa.string()))
+        if field == "time":
+            # pymysql 把 TIME 读取为 timedelta
+            values = [None if value is None else int(value.total_seconds()) for value in values]
+            return pa.array(values, pa.time32("s"))
+        if field == "date" or field in INT_FIELDS:
+            return pa.array(values, arrow_type(field))
+        return pa.array([None if value is None else float(value) for value in values], pa.float64())
+
+    def build(self, rows: list):
+        columns = list(zip(*rows))
+        return pa.record_batch(
+            [self._column(field, column) for field, column in zip(self.fields, columns)],
+            schema=self.schema,
+        )
+
+
+def arrow_chunks(cursor, fields: list, export_format: str, batch_rows: int, parquet_compression: str = "zstd"):
+    """
+    从服务端游标按 batch_rows 行读取, 生成 parquet / arrow 文件的字节块
+
+    参数:
+    - cursor: 已执行查询的元组游标, 列顺序与 fields 一致
+    """
+    builder = BatchBuilder(fields)
+    sink = _ChunkSink()
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(sink, builder.schema, compression=parquet_compression)
+    else:
+        writer = pa.ipc.new_file(sink, builder.schema,
+                                 options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        writer.write_batch(builder.build(rows))
+        chunk = sink.take()
+        if chunk:
+            yield chunk
+
+    writer.close()
+    yield sink.take()
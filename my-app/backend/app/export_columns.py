@@ -0,0 +1,118 @@
+"""
+导出CSV的列定义 (/api/home/export)
+
+EXPORT_COLUMNS 每项为 (字段, 表头, 格式):
+- None: 文本, NULL 输出空字符串
+- str: strftime 格式(date / time), 没有 strftime 的值(pymysql 把 TIME 读取为 timedelta)输出 str(value)
+- int: 保留的小数位数, NULL 输出空字符串
+
+查询字段 EXPORT_FIELDS 和表头 EXPORT_HEADERS 都由 EXPORT_COLUMNS 生成。
+format_export_row 在导入时由 EXPORT_COLUMNS 生成一次, 按位置读取元组行的各列, 格式串为常量,
+每行只执行一次函数调用
+"""
+
+EXPORT_COLUMNS = [
+    ("machine_name", "机器名", None),
+    ("machine_model", "机器型号", None),
+    ("date", "日期", "%Y-%m-%d"),
+    ("time", "时间", "%H:%M:%S"),
+    ("hours", "运行小时数/h", 0),
+    ("total_current", "总电流/A", 1),
+    ("total_voltage", "总电压/V", 1),
+    *((f"cell_{i}", f"cell-{i}/mV", 0) for i in range(1, 21)),
+    ("max_voltage", "电压最大值/mV", 0),
+    ("min_voltage", "电压最小值/mV", 0),
+    ("avg_voltage", "平均电压/mV", 1),
+    ("voltage_range", "电压极差/mV", 0),
+    ("std_deviation", "小室电压标准差/mV", 4),
+    ("pump_pressure", "泵后压力/MPa", 4),
+    ("pump_opening", "泵的开度/Hz", 2),
+    ("fan_opening", "风扇开度/Hz", 2),
+    ("specific_gravity", "碱液比重/mg/cm³", 4),
+    ("liquid_level", "液位/mm", 2),
+    ("inlet_pressure", "进槽压力/MPa", 4),
+    ("oxygen_outlet_pressure", "氧侧出槽压力/MPa", 4),
+    ("hydrogen_outlet_pressure", "氢侧出槽压力/MPa", 4),
+    ("pressure_diff", "电解槽进出口压差/MPa", 4),
+    ("sep_pressure_diff", "氢氧侧压差/MPa", 4),
+    ("alkali_inlet_temp", "碱液入口温度/℃", 2),
+    ("oxygen_outlet_temp", "氧侧出槽温度/℃", 2),
+    ("hydrogen_outlet_temp", "氢气出槽温度/℃", 2),
+    ("hydrogen_gas_temp", "氢侧出气温度/℃", 2),
+    ("hydrogen_flow_meter", "氢气流量", 4),
+    ("oxygen_in_hydrogen", "氧中氢/ppm", 0),
+    ("hydrogen_in_oxygen", "氢中氧/ppm", 0),
+    ("current_power", "当前能耗（直流电耗）", 4),
+    ("alkali_flow_meter", "碱液流量L/min", 4),
+]
+
+# 导出的字段(查询顺序)
+EXPORT_FIELDS = [column for column, _, _ in EXPORT_COLUMNS]
+# 导出CSV的表头, 与 EXPORT_FIELDS 一一对应
+EXPORT_HEADERS = [header for _, header, _ in EXPORT_COLUMNS]
+
+
+def format_value(value, decimals=2):
+    """格式化数值，如果为None则显示空字符串"""
+    if value is None:
+        return ""
+    try:
+        return f"{float(value):.{decimals}f}"
+    except (ValueError, TypeError):
+        return str(value) if value else ""
+
+
+def format_temporal(value, fmt: str) -> str:
+    return value.strftime(fmt) if hasattr(value, "strftime") else str(value)
+
+
+def _format_slow(row, columns: list) -> list:
+    """逐个字段格式化, 与生成的函数结果一致, 用于数值列出现非数值时"""
+    values = []
+    for value, (_, _, fmt) in zip(row, columns):
+        if fmt is None:
+            values.append(value or "")
+        elif isinstance(fmt, str):
+            values.append(format_temporal(value, fmt))
+        else:
+            values.append(format_value(value, fmt))
+    return values
+
+
+def compile_row_formatter(columns: list):
+    """
+    由列定义生成把元组行格式化为CSV一行的函数
+
+    生成的函数把行解包到局部变量, 每列一个内联表达式; 数值列遇到无法转换为 float 的值时
+    整行改为逐个字段格式化(format_value 的处理), 结果与逐个字段格式化相同
+    """
+    names = [f"v{i}" for i in range(len(columns))]
+    items = []
+    for name, (_, _, fmt) in zip(names, columns):
+        if fmt is None:
+            items.append(f'{name} or ""')
+        elif isinstance(fmt, str):
+            items.append(f'{name}.strftime({fmt!r}) if hasattr({name}, "strftime") else str({name})')
+        elif fmt == 0:
+            # INT 列: 32位整数的 str() 与 float 后保留0位小数的结果相同
+            items.append(f'"" if {name} is None else str({name}) if {name}.__class__ is int else f"{{float({name}):.0f}}"')
+        else:
+            items.append(f'"" if {name} is None else f"{{float({name}):.{int(fmt)}f}}"')
+
+    lines = [
+        "def format_row(row):",
+        "    try:",
+        f"        {', '.join(names)}, = row",
+        "        return [",
+        *(f"            {item}," for item in items),
+        "        ]",
+        "    except (ValueError, TypeError):",
+        "        return _format_slow(row, columns)",
+    ]
+    namespace = {"_format_slow": _format_slow, "columns": list(columns)}
+    exec(compile("\n".join(lines), f"<export row formatter: {len(columns)} columns>", "exec"), namespace)
+    return namespace["format_row"]
+
+
+# 把一行(元组, 顺序与 EXPORT_FIELDS 一致)格式化为CSV的一行
+format_export_row = compile_row_formatter(EXPORT_COLUMNS)
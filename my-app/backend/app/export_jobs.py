@@ -0,0 +1,318 @@
+"""
+后台导出任务 (/api/home/export/jobs)
+
+提交后由 export_job_executor 在后台把导出文件写入 EXPORT_JOB_CONFIG["dir"], 客户端查询进度, 完成后下载:
+- 任务信息保存为 <job_id>.json(先写临时文件再替换), 使用 uvicorn --workers 时任何一个进程都可以查询和下载
+- 进度: rows_written / estimated_rows, estimated_rows 为提交时范围内的行数
+- 排队和执行期间每 heartbeat_interval 秒更新一次任务文件, 超过 stale_seconds 没有更新说明提交任务的进程已退出
+- 提交时加文件锁, 查找可复用的任务、统计所有进程排队和执行中的任务数、创建任务在进程之间互斥
+- 下载时支持 Range 请求, 浏览器中断后可以从断点继续
+- 结果缓存: 相同 (start, end, format) 且范围内的数据指纹 (行数, 最大id) 没有变化时, 直接返回已完成、
+  排队中或执行中的任务; 有新数据写入该范围后重新导出, 旧文件删除
+- 文件保留 ttl 秒, 总大小超过 max_bytes 时先删除最早完成的文件
+
+数据指纹不能发现对已有行的原地修改(手动修改数据、MQTT 补齐同一时刻的字段), 这类修改最迟在 ttl 后生效
+"""
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+
+from .config import EXPORT_JOB_CONFIG, backend_path
+from .db import datetime_range_conditions
+from .file_lock import file_lock
+from .workers import export_job_executor
+
+JOB_DIR = backend_path(EXPORT_JOB_CONFIG["dir"])
+
+# 执行任务的线程和心跳线程都会写入任务文件
+save_lock = threading.Lock()
+
+
+def _format_time(timestamp: Optional[float]) -> Optional[str]:
+    return None if timestamp is None else datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _write_json(path: str, data: dict):
+    """先写临时文件再替换, 读取方不会读到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        # 不存在, 或 Windows 上正在被下载
+        pass
+
+
+def range_fingerprint(cursor, start: datetime, end: datetime) -> list:
+    """范围内的数据指纹 [行数, 最大id], 有新数据写入该范围时变化"""
+    range_conditions, range_params = datetime_range_conditions(start, end)
+    cursor.execute(
+        f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM wincc WHERE {' AND '.join(range_conditions)}",
+        range_params,
+    )
+    count, max_id = cursor.fetchone()
+    return [int(count), int(max_id)]
+
+
+class ExportJob:
+    """
+    一个导出任务
+
+    - status: queued / running / done / failed
+    - fingerprint: 提交时范围内的数据指纹, 第一个值同时作为 estimated_rows
+    """
+
+    def __init__(self, job_id: str, start_datetime: str, end_datetime: str, export_format: str,
+                 extension: str, fingerprint: list):
+        self.job_id = job_id
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.export_format = export_format
+        self.extension = extension
+        self.fingerprint = list(fingerprint)
+        self.status = "queued"
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[float] = None
+        self._saved_at = 0.0
+
+    @property
+    def key(self) -> tuple:
+        return self.start_datetime, self.end_datetime, self.export_format
+
+    @property
+    def estimated_rows(self) -> int:
+        return self.fingerprint[0]
+
+    @property
+    def path(self) -> str:
+        return os.path.join(JOB_DIR, f"{self.job_id}.{self.extension}")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(JOB_DIR, f"{self.job_id}.json")
+
+    @property
+    def active(self) -> bool:
+        """排队或执行中, 且提交任务的进程没有退出"""
+        return self.status in ("queued", "running") and not self.stale
+
+    @property
+    def stale(self) -> bool:
+        """排队或执行中超过 stale_seconds 没有更新(没有心跳), 提交任务的进程已退出"""
+        return (self.status in ("queued", "running")
+                and time.time() - self.updated_at > EXPORT_JOB_CONFIG["stale_seconds"])
+
+    def save(self):
+        with save_lock:
+            self.updated_at = time.time()
+            self._saved_at = self.updated_at
+            _write_json(self.meta_path, {key: value for key, value in vars(self).items() if key != "_saved_at"})
+
+    def add_rows(self, count: int):
+        """记录进度, 每 progress_interval 秒最多写入一次任务文件"""
+        self.rows_written += count
+        if time.time() - self._saved_at >= EXPORT_JOB_CONFIG["progress_interval"]:
+            self.save()
+
+    @classmethod
+    def load(cls, job_id: str) -> Optional["ExportJob"]:
+        try:
+            with open(os.path.join(JOB_DIR, f"{job_id}.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls.__new__(cls)
+        job.__dict__.update(data)
+        job._saved_at = 0.0
+        return job
+
+    def info(self) -> dict:
+        status = "failed" if self.stale else self.status
+        if status == "done":
+            progress = 100.0
+        else:
+            progress = round(min(99.9, self.rows_written / self.estimated_rows * 100), 1) if self.estimated_rows else 0.0
+        return {
+            "job_id": self.job_id,
+            "status": status,
+            "start_datetime": self.start_datetime,
+            "end_datetime": self.end_datetime,
+            "format": self.export_format,
+            "rows_written": self.rows_written,
+            "estimated_rows": self.estimated_rows,
+            "progress": progress,
+            "bytes": self.bytes_written,
+            "error": "提交导出任务的进程已退出" if self.stale else self.error,
+            "created_at": _format_time(self.created_at),
+            "finished_at": _format_time(self.finished_at),
+            "download_url": f"/api/home/export/jobs/{self.job_id}/download" if status == "done" else None,
+        }
+
+
+class ProgressCursor:
+    """统计读取的行数, 用法与游标一致"""
+
+    def __init__(self, cursor, job: ExportJob):
+        self.cursor = cursor
+        self.job = job
+
+    def fetchmany(self, size: int):
+        rows = self.cursor.fetchmany(size)
+        self.job.add_rows(len(rows))
+        return rows
+
+    def close(self):
+        self.cursor.close()
+
+
+def list_jobs() -> list:
+    jobs = []
+    for meta_path in glob.glob(os.path.join(JOB_DIR, "*.json")):
+        job = ExportJob.load(os.path.splitext(os.path.basename(meta_path))[0])
+        if job is not None:
+            jobs.append(job)
+    return jobs
+
+
+def delete_job(job: ExportJob):
+    _remove(job.path)
+    _remove(f"{job.path}.part")
+    _remove(job.meta_path)
+
+
+def cleanup(jobs: list) -> list:
+    """删除过期、失败和超出总大小的任务, 返回保留的任务"""
+    now = time.time()
+    ttl = EXPORT_JOB_CONFIG["ttl"]
+    kept = []
+    for job in jobs:
+        if job.status == "done":
+            expired = now - job.finished_at > ttl or not os.path.exists(job.path)
+        else:
+            expired = (job.status == "failed" or job.stale) and now - job.updated_at > ttl
+        if expired:
+            delete_job(job)
+        else:
+            kept.append(job)
+
+    finished = sorted((job for job in kept if job.status == "done"), key=lambda job: job.finished_at)
+    total_bytes = sum(job.bytes_written for job in finished)
+    for job in finished:
+        if total_bytes <= EXPORT_JOB_CONFIG["max_bytes"]:
+            break
+        delete_job(job)
+        kept.remove(job)
+        total_bytes -= job.bytes_written
+    return kept
+
+
+class Heartbeat:
+    """
+    任务排队和执行期间每 heartbeat_interval 秒更新任务文件
+
+    进度只在读取到行时写入, 排队等待、数据库执行查询还没有返回第一批行时也需要说明任务仍然有效;
+    stop 等待心跳线程结束, 之后写入的完成/失败状态不会被心跳覆盖
+    """
+
+    def __init__(self, job: ExportJob):
+        self.job = job
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"export-heartbeat-{job.job_id[:8]}", daemon=True)
+
+    def _beat(self):
+        while not self._stop.wait(EXPORT_JOB_CONFIG["heartbeat_interval"]):
+            self.job.save()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _run(job: ExportJob, produce, heartbeat: Heartbeat):
+    """在 export_job_executor 中执行: 把 produce(job) 生成的字节块写入文件"""
+    part_path = f"{job.path}.part"
+    try:
+        try:
+            job.status = "running"
+            job.save()
+            with open(part_path, "wb") as f:
+                for chunk in produce(job):
+                    f.write(chunk)
+                    job.bytes_written += len(chunk)
+        finally:
+            # 先停止心跳, 再写入完成/失败状态
+            heartbeat.stop()
+        os.replace(part_path, job.path)
+        job.status = "done"
+        job.finished_at = time.time()
+        job.save()
+        print(f"[Export] 导出任务 {job.job_id} 完成, {job.rows_written} 行, {job.bytes_written} 字节")
+    except Exception as e:
+        _remove(part_path)
+        job.status = "failed"
+        job.error = str(getattr(e, "detail", e))
+        job.save()
+        print(f"[Export] 导出任务 {job.job_id} 失败: {job.error}")
+
+
+def submit(start_datetime: str, end_datetime: str, export_format: str, extension: str,
+           fingerprint: list, produce) -> tuple:
+    """
+    提交导出任务, 相同参数且数据指纹相同的任务直接复用
+
+    参数:
+    - produce: produce(job) 返回导出文件的字节块迭代器, 在后台线程中执行
+
+    返回: (任务, 是否复用)
+    """
+    os.makedirs(JOB_DIR, exist_ok=True)
+    key = (start_datetime, end_datetime, export_format)
+    # 多个进程同时提交相同的导出时只创建一个任务, 任务数上限按所有进程的任务文件统计
+    with file_lock(os.path.join(JOB_DIR, "submit.lock")):
+        jobs = cleanup(list_jobs())
+        for job in jobs:
+            if job.key != key or not (job.status == "done" or job.active):
+                continue
+            if job.fingerprint == fingerprint:
+                return job, True
+            if job.status == "done":
+                # 范围内有新数据, 旧文件不再使用
+                delete_job(job)
+
+        if sum(job.active for job in jobs) >= EXPORT_JOB_CONFIG["max_queued"]:
+            raise HTTPException(status_code=503, detail="导出任务过多, 请稍后重试")
+
+        job = ExportJob(uuid.uuid4().hex, start_datetime, end_datetime, export_format, extension, fingerprint)
+        job.save()
+
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        export_job_executor.submit(_run, job, produce, heartbeat)
+    except Exception as e:
+        # 进程正在退出
+        heartbeat.stop()
+        job.status = "failed"
+        job.error = str(e)
+        job.save()
+        raise
+    return job, False
@@ -0,0 +1,124 @@
+"""
+分区并行导出 (/api/home/export, EXPORT_CONFIG["parallel_partitions"] > 1 时)
+
+导出范围按 设备 x 自然日 拆分为多个分区, 每个分区单独查询(ORDER BY date, time), 由所有导出共享的
+export_executor 线程池并发执行, 每个分区从连接池取一个连接, 查询结束即归还:
+- 分区按 machine_name(数据库排序规则, 与 ORDER BY machine_name 一致)、日期的顺序排列,
+  依次拼接后与单个 ORDER BY machine_name, date, time 查询的结果顺序相同
+- 每个导出最多同时有 parallel_partitions 个分区在查询或等待发送, 内存占用与这几个分区的数据量相关
+- 所有导出同时执行的分区查询不超过 parallel_partitions 个, 连接池的其余连接留给图表和页面查询
+"""
+from collections import deque
+from datetime import datetime, time, timedelta
+
+from .db import get_db_pool, datetime_range_conditions
+from .export_columns import EXPORT_FIELDS
+from .workers import export_executor
+
+
+def day_ranges(start: datetime, end: datetime) -> list:
+    """把 [start, end] 按自然日拆分为 [(起始时间, 截止时间)], 均包含边界"""
+    ranges = []
+    day = start.date()
+    while day <= end.date():
+        day_start = max(start, datetime.combine(day, time.min))
+        day_end = min(end, datetime.combine(day, time(23, 59, 59)))
+        if day_start <= day_end:
+            ranges.append((day_start, day_end))
+        day += timedelta(days=1)
+    return ranges
+
+
+def list_partitions(cursor, start: datetime, end: datetime) -> list:
+    """返回 [(machine_name, 起始时间, 截止时间)], 顺序与导出结果的顺序一致"""
+    range_conditions, range_params = datetime_range_conditions(start, end)
+    cursor.execute(
+        f"""
+        SELECT DISTINCT machine_name
+        FROM wincc
+        WHERE {" AND ".join(range_conditions)}
+        ORDER BY machine_name ASC
+        """,
+        range_params,
+    )
+    machines = [row[0] for row in cursor.fetchall()]
+    days = day_ranges(start, end)
+    return [(machine_name, day_start, day_end) for machine_name in machines for day_start, day_end in days]
+
+
+def fetch_partition(partition: tuple) -> list:
+    """查询一个分区的所有数据(元组行, 列顺序与 EXPORT_FIELDS 一致)"""
+    machine_name, start, end = partition
+    conditions, params = datetime_range_conditions(start, end)
+    if machine_name is None:
+        conditions.insert(0, "machine_name IS NULL")
+    else:
+        conditions.insert(0, "machine_name = %s")
+        params.insert(0, machine_name)
+
+    connection = get_db_pool().acquire()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            f"""
+            SELECT {", ".join(EXPORT_FIELDS)}
+            FROM wincc
+            WHERE {" AND ".join(conditions)}
+            ORDER BY date ASC, time ASC
+            """,
+            params,
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    except Exception:
+        connection.discard()
+        raise
+    connection.close()
+    return rows
+
+
+class PartitionReader:
+    """
+    按分区顺序读取各分区的查询结果, fetchmany / close 的用法与游标一致
+
+    - window: 已提交查询但还没有读完的分区数上限
+    """
+
+    def __init__(self, partitions: list, window: int):
+        self.window = max(1, window)
+        self._partitions = iter(partitions)
+        self._futures = deque()
+        self._rows = []
+        self._position = 0
+        self._submit()
+
+    def _submit(self):
+        while len(self._futures) < self.window:
+            partition = next(self._partitions, None)
+            if partition is None:
+                break
+            self._futures.append(export_executor.submit(fetch_partition, partition))
+
+    def fetchmany(self, size: int) -> list:
+        result = []
+        while len(result) < size:
+            if self._position >= len(self._rows):
+                if not self._futures:
+                    break
+                # 按顺序等待下一个分区, 同时补充提交后面的分区
+                self._rows = self._futures.popleft().result()
+                self._position = 0
+                self._submit()
+                continue
+            rows = self._rows[self._position:self._position + size - len(result)]
+            result.extend(rows)
+            self._position += len(rows)
+        return result
+
+    def close(self):
+        """取消尚未开始的分区查询, 正在执行的查询结束后归还连接"""
+        for future in self._futures:
+            future.cancel()
+        self._futures.clear()
+        self._partitions = iter(())
+        self._rows = []
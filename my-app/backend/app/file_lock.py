@@ -0,0 +1,27 @@
+"""
+跨进程的文件锁
+使用 uvicorn --workers 时多个进程共享 data 目录下的文件(图表版本号、导出任务),
+读取-修改-写入需要在进程之间互斥; 只能在同一台机器的进程之间互斥
+"""
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path: str):
+    """跨进程的文件锁(阻塞等待)"""
+    with open(path, "a+") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            # 关闭文件即释放锁
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
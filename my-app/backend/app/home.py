@@ -1,37 +1,30 @@
-import asyncio
 import csv
+import functools
 import io
-import time
+import os
+import threading
+import zlib
 from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List
 from urllib.parse import quote
-from itertools import groupby
+from itertools import chain, groupby
 import pandas as pd
 import pymysql
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel
 
-from .config import DB_CONFIG
+from .config import DB_CONFIG, EXPORT_CONFIG
+from .analysis import build_datetime, select_valid_cells, runtime_hours
+from . import export_arrow, export_jobs, export_partitions
+from .export_columns import EXPORT_FIELDS, EXPORT_HEADERS, format_export_row
+from .db import get_db_connection, datetime_range_conditions
+from .workers import run_heavy, run_light
 
 router = APIRouter()
 
 
-def get_db_connection():
-    """获取数据库连接，最多重试10次，每次间隔1秒"""
-    last_error: Exception
-    for attempt in range(10):
-        try:
-            connection = pymysql.connect(**DB_CONFIG)
-            return connection
-        except Exception as e:
-            last_error = e
-            if attempt < 9:
-                time.sleep(1)
-    # 所有重试均失败，抛出HTTP异常
-    raise HTTPException(status_code=500, detail=f"数据库连接失败: {str(last_error)}")
-
-
 @router.get("/overview")
 async def get_overview(
         day: int = Query(1, description="查询天数: 1, 7, 15, 30"),
@@ -62,6 +55,10 @@ async def get_overview(
         "is_incremental": true/false
     }
     """
+    return await run_light(_get_overview, day, last_query_time, isfake)
+
+
+def _get_overview(day: int, last_query_time: str, isfake: int):
     if day not in [1, 7, 15, 30]:
         raise HTTPException(status_code=400, detail="day参数只能是1, 7, 15 或 30")
 
@@ -95,10 +92,6 @@ async def get_overview(
 
         devices_data = []
 
-        # 构建完整的时间戳范围
-        start_datetime = start_time.strftime("%Y-%m-%d %H:%M:%S")
-        end_datetime = query_time.strftime("%Y-%m-%d %H:%M:%S")
-
         # 准备机器名称列表
         target_machines = [f"{i}#" for i in range(1, 16)]
 
@@ -106,17 +99,18 @@ async def get_overview(
         placeholders = ",".join(["%s"] * len(target_machines))
 
         # 优化后的SQL查询：一次查询所有设备的数据
+        # 时间范围使用 (date, time) 条件, 可以走 (machine_name, date, time) 索引
+        range_conditions, range_params = datetime_range_conditions(start_time, query_time)
         sql = f"""
             SELECT machine_name, machine_model, date, time, avg_voltage
             FROM wincc
             WHERE machine_name IN ({placeholders})
-              AND CONCAT(date, ' ', time) >= %s
-              AND CONCAT(date, ' ', time) <= %s
+              AND {" AND ".join(range_conditions)}
             ORDER BY date ASC, time ASC
         """
 
         # 执行查询
-        params = target_machines + [start_datetime, end_datetime]
+        params = target_machines + range_params
         cursor.execute(sql, params)
         rows = cursor.fetchall()
 
@@ -208,223 +202,336 @@ async def get_overview(
             connection.close()
 
 
+# 同时进行的导出数
+export_slots = threading.BoundedSemaphore(EXPORT_CONFIG["max_streams"])
+
+
 @router.get("/export")
 async def export_data(
         start_datetime: str = Query(..., description="起始时间 格式: YYYY-MM-DD HH:MM:SS"),
         end_datetime: str = Query(..., description="截止时间 格式: YYYY-MM-DD HH:MM:SS"),
+        gzip: bool = Query(False, description="是否以 gzip 压缩传输(Content-Encoding: gzip)"),
+        export_format: str = Query("csv", alias="format", pattern="^(csv|parquet|arrow)$",
+                                   description="导出格式: csv / parquet / arrow"),
 ):
     """
-    导出指定时间范围内的所有设备数据为CSV文件
+    导出指定时间范围内的所有设备数据
 
     参数:
     - start_datetime: 起始时间
     - end_datetime: 截止时间
+    - gzip: 为 true 时按 EXPORT_CONFIG["gzip_level"] 压缩传输, 浏览器自动解压, 保存的文件不变
+    - format: csv(默认) / parquet / arrow, 后两种需要安装 pyarrow, 未安装时返回501
 
-    返回: CSV文件流
+    返回: 文件流(边查询边发送, 同时进行的导出超过 max_streams 时返回503)
+    时间范围较大时可以使用 POST /export/jobs 在后台导出, 下载中断后可以续传
     """
-    connection = None
+    return await run_heavy(_export_data, start_datetime, end_datetime, gzip, export_format)
+
+
+def _parse_export_range(start_datetime: str, end_datetime: str):
+    """验证导出的起止时间, 返回 (start_dt, end_dt)"""
+    # 验证时间格式
     try:
-        # 验证时间格式
-        try:
-            start_dt = datetime.strptime(start_datetime, "%Y-%m-%d %H:%M:%S")
-            end_dt = datetime.strptime(end_datetime, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            raise HTTPException(
-                status_code=400, detail="时间格式错误，应为: YYYY-MM-DD HH:MM:SS"
-            )
+        start_dt = datetime.strptime(start_datetime, "%Y-%m-%d %H:%M:%S")
+        end_dt = datetime.strptime(end_datetime, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="时间格式错误，应为: YYYY-MM-DD HH:MM:SS"
+        )
 
-        # 验证时间范围
-        if start_dt >= end_dt:
-            raise HTTPException(status_code=400, detail="起始时间必须早于截止时间")
+    # 验证时间范围
+    if start_dt >= end_dt:
+        raise HTTPException(status_code=400, detail="起始时间必须早于截止时间")
+    return start_dt, end_dt
 
-        connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
 
-        # 查询所有设备在指定时间范围内的所有字段数据，按device, date, time升序
-        sql = """
-              SELECT machine_name,
-                     machine_model, date, time, hours, total_current, total_voltage, cell_1, cell_2, cell_3, cell_4, cell_5, cell_6, cell_7, cell_8, cell_9, cell_10, cell_11, cell_12, cell_13, cell_14, cell_15, cell_16, cell_17, cell_18, cell_19, cell_20, max_voltage, min_voltage, avg_voltage, voltage_range, std_deviation, pump_pressure, pump_opening, fan_opening, specific_gravity, liquid_level, inlet_pressure, oxygen_outlet_pressure, hydrogen_outlet_pressure, pressure_diff, sep_pressure_diff, alkali_inlet_temp, oxygen_outlet_temp, hydrogen_outlet_temp, hydrogen_gas_temp, hydrogen_flow_meter, oxygen_in_hydrogen, hydrogen_in_oxygen, current_power, alkali_flow_meter
-              FROM wincc
-              WHERE CONCAT(date
-                  , ' '
-                  , time) >= %s
-                AND CONCAT(date
-                  , ' '
-                  , time) <= %s
-              ORDER BY machine_name ASC, date ASC, time ASC \
-              """
+def _check_export_format(export_format: str):
+    if export_format != "csv" and not export_arrow.AVAILABLE:
+        raise HTTPException(status_code=501, detail=f"服务器未安装 pyarrow, 不支持导出 {export_format} 格式")
+
+
+def _export_file_type(start_dt: datetime, end_dt: datetime, export_format: str):
+    """返回 (文件名, 文件扩展名, media type)"""
+    start_str = start_dt.strftime("%Y%m%d%H%M%S")
+    end_str = end_dt.strftime("%Y%m%d%H%M%S")
+    extension, media_type = export_arrow.FORMATS.get(export_format, ("csv", "text/csv; charset=utf-8"))
+    return f"设备数据_{start_str}_{end_str}.{extension}", extension, media_type
 
-        cursor.execute(sql, (start_datetime, end_datetime))
-        rows = cursor.fetchall()
 
+def _open_export_cursor(connection, start_dt: datetime, end_dt: datetime):
+    """
+    执行导出查询, 返回 (connection, cursor), cursor 为元组行, 列顺序与 EXPORT_FIELDS 一致
+
+    分区并行查询时 connection 只用于列出分区, 返回前已归还, 返回的 connection 为 None
+    """
+    if EXPORT_CONFIG["parallel_partitions"] > 1:
+        # 分区并行查询: 各分区查询时从连接池另取连接
+        cursor = connection.cursor()
+        partitions = export_partitions.list_partitions(cursor, start_dt, end_dt)
         cursor.close()
+        connection.close()
+        return None, export_partitions.PartitionReader(partitions, EXPORT_CONFIG["parallel_partitions"])
 
-        # 创建CSV内容
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # 写入表头（带BOM用于Excel正确识别UTF-8）
-        headers = [
-            "机器名",
-            "机器型号",
-            "日期",
-            "时间",
-            "运行小时数/h",
-            "总电流/A",
-            "总电压/V",
-            "cell-1/mV",
-            "cell-2/mV",
-            "cell-3/mV",
-            "cell-4/mV",
-            "cell-5/mV",
-            "cell-6/mV",
-            "cell-7/mV",
-            "cell-8/mV",
-            "cell-9/mV",
-            "cell-10/mV",
-            "cell-11/mV",
-            "cell-12/mV",
-            "cell-13/mV",
-            "cell-14/mV",
-            "cell-15/mV",
-            "cell-16/mV",
-            "cell-17/mV",
-            "cell-18/mV",
-            "cell-19/mV",
-            "cell-20/mV",
-            "电压最大值/mV",
-            "电压最小值/mV",
-            "平均电压/mV",
-            "电压极差/mV",
-            "小室电压标准差/mV",
-            "泵后压力/MPa",
-            "泵的开度/Hz",
-            "风扇开度/Hz",
-            "碱液比重/mg/cm³",
-            "液位/mm",
-            "进槽压力/MPa",
-            "氧侧出槽压力/MPa",
-            "氢侧出槽压力/MPa",
-            "电解槽进出口压差/MPa",
-            "氢氧侧压差/MPa",
-            "碱液入口温度/℃",
-            "氧侧出槽温度/℃",
-            "氢气出槽温度/℃",
-            "氢侧出气温度/℃",
-            "氢气流量",
-            "氧中氢/ppm",
-            "氢中氧/ppm",
-            "当前能耗（直流电耗）",
-            "碱液流量L/min",
-        ]
-        writer.writerow(headers)
+    # 服务端游标: 结果逐块从数据库读取, 不一次性载入内存
+    cursor = connection.cursor(pymysql.cursors.SSCursor)
+    cursor.execute("SET SESSION net_write_timeout = %s", (EXPORT_CONFIG["net_write_timeout"],))
 
-        # 写入数据
-        for row in rows:
-            date_str = (
-                row["date"].strftime("%Y-%m-%d")
-                if hasattr(row["date"], "strftime")
-                else str(row["date"])
-            )
-            time_str = (
-                row["time"].strftime("%H:%M:%S")
-                if hasattr(row["time"], "strftime")
-                else str(row["time"])
-            )
+    # 查询所有设备在指定时间范围内的所有字段数据，按device, date, time升序
+    range_conditions, range_params = datetime_range_conditions(start_dt, end_dt)
+    sql = f"""
+          SELECT {", ".join(EXPORT_FIELDS)}
+          FROM wincc
+          WHERE {" AND ".join(range_conditions)}
+          ORDER BY machine_name ASC, date ASC, time ASC \
+          """
 
-            # 格式化数值，如果为None则显示空字符串
-            def format_value(value, decimals=2):
-                if value is None:
-                    return ""
-                try:
-                    return f"{float(value):.{decimals}f}"
-                except (ValueError, TypeError):
-                    return str(value) if value else ""
-
-            writer.writerow(
-                [
-                    row["machine_name"] or "",
-                    row["machine_model"] or "",
-                    date_str,
-                    time_str,
-                    format_value(row["hours"], 0),
-                    format_value(row["total_current"], 1),
-                    format_value(row["total_voltage"], 1),
-                    format_value(row["cell_1"], 0),
-                    format_value(row["cell_2"], 0),
-                    format_value(row["cell_3"], 0),
-                    format_value(row["cell_4"], 0),
-                    format_value(row["cell_5"], 0),
-                    format_value(row["cell_6"], 0),
-                    format_value(row["cell_7"], 0),
-                    format_value(row["cell_8"], 0),
-                    format_value(row["cell_9"], 0),
-                    format_value(row["cell_10"], 0),
-                    format_value(row["cell_11"], 0),
-                    format_value(row["cell_12"], 0),
-                    format_value(row["cell_13"], 0),
-                    format_value(row["cell_14"], 0),
-                    format_value(row["cell_15"], 0),
-                    format_value(row["cell_16"], 0),
-                    format_value(row["cell_17"], 0),
-                    format_value(row["cell_18"], 0),
-                    format_value(row["cell_19"], 0),
-                    format_value(row["cell_20"], 0),
-                    format_value(row["max_voltage"], 0),
-                    format_value(row["min_voltage"], 0),
-                    format_value(row["avg_voltage"], 1),
-                    format_value(row["voltage_range"], 0),
-                    format_value(row["std_deviation"], 4),
-                    format_value(row["pump_pressure"], 4),
-                    format_value(row["pump_opening"], 2),
-                    format_value(row["fan_opening"], 2),
-                    format_value(row["specific_gravity"], 4),
-                    format_value(row["liquid_level"], 2),
-                    format_value(row["inlet_pressure"], 4),
-                    format_value(row["oxygen_outlet_pressure"], 4),
-                    format_value(row["hydrogen_outlet_pressure"], 4),
-                    format_value(row["pressure_diff"], 4),
-                    format_value(row["sep_pressure_diff"], 4),
-                    format_value(row["alkali_inlet_temp"], 2),
-                    format_value(row["oxygen_outlet_temp"], 2),
-                    format_value(row["hydrogen_outlet_temp"], 2),
-                    format_value(row["hydrogen_gas_temp"], 2),
-                    format_value(row["hydrogen_flow_meter"], 4),
-                    format_value(row["oxygen_in_hydrogen"], 0),
-                    format_value(row["hydrogen_in_oxygen"], 0),
-                    format_value(row["current_power"], 4),
-                    format_value(row["alkali_flow_meter"], 4)
-                ]
-            )
+    cursor.execute(sql, range_params)
+    return connection, cursor
 
-        # 生成文件名
-        start_str = start_dt.strftime("%Y%m%d%H%M%S")
-        end_str = end_dt.strftime("%Y%m%d%H%M%S")
-        filename = f"设备数据_{start_str}_{end_str}.csv"
 
-        # URL编码文件名以支持中文字符
-        encoded_filename = quote(filename)
+def _release_export_cursor(connection, cursor, completed: bool):
+    """
+    结束导出查询: 读完时归还连接; 中途停止时丢弃连接(未读完的结果集使连接不可用, 也不必把剩余结果读完)
 
-        # 返回CSV文件（添加BOM以支持Excel正确显示中文）
-        csv_content = "\ufeff" + output.getvalue()
-        output.close()
+    归还前把导出时调大的 net_write_timeout 恢复为全局值, 之后从连接池取到该连接的查询不会沿用导出的超时;
+    恢复失败时丢弃连接
+    """
+    if connection is None:
+        # 分区读取: 取消尚未开始的分区查询, 各分区的连接在查询结束时已归还
+        cursor.close()
+    elif completed:
+        cursor.close()
+        try:
+            session_cursor = connection.cursor()
+            session_cursor.execute("SET SESSION net_write_timeout = DEFAULT")
+            session_cursor.close()
+        except Exception:
+            connection.discard()
+            return
+        connection.close()
+    else:
+        connection.discard()
 
-        return StreamingResponse(
-            iter([csv_content.encode("utf-8")]),
-            media_type="text/csv; charset=utf-8",
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-            },
-        )
 
+def _export_chunks(cursor, export_format: str):
+    """按格式编码查询结果, 返回字节块迭代器"""
+    if export_format == "csv":
+        return _csv_chunks(cursor)
+    return export_arrow.arrow_chunks(cursor, EXPORT_FIELDS, export_format, EXPORT_CONFIG["arrow_batch_rows"],
+                                     EXPORT_CONFIG["parquet_compression"])
+
+
+def _export_data(start_datetime: str, end_datetime: str, compress: bool = False, export_format: str = "csv"):
+    start_dt, end_dt = _parse_export_range(start_datetime, end_datetime)
+    _check_export_format(export_format)
+
+    if not export_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="导出任务过多, 请稍后重试")
+
+    connection = None
+    stream = None
+    try:
+        connection = get_db_connection()
+        connection, cursor = _open_export_cursor(connection, start_dt, end_dt)
+
+        chunks = _export_chunks(cursor, export_format)
+        if compress:
+            chunks = _gzip_chunks(chunks)
+
+        # 先生成第一块, 之后连接和导出名额由生成器负责归还(生成器出错时已经归还)
+        stream = _stream_export(connection, cursor, chunks)
+        first_chunk = next(stream)
     except HTTPException:
+        if stream is None:
+            if connection:
+                connection.close()
+            export_slots.release()
         raise
     except Exception as e:
+        if stream is None:
+            if connection:
+                connection.discard()
+            export_slots.release()
         raise HTTPException(status_code=500, detail=f"导出数据失败: {str(e)}")
+
+    # 生成文件名
+    filename, _, media_type = _export_file_type(start_dt, end_dt, export_format)
+
+    # URL编码文件名以支持中文字符
+    encoded_filename = quote(filename)
+    headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(
+        chain([first_chunk], stream),
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+def _csv_chunks(cursor):
+    """逐块读取查询结果并编码为CSV字节(第一块为BOM和表头, 用于Excel正确识别UTF-8)"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+
+    def take() -> bytes:
+        data = output.getvalue().encode("utf-8")
+        output.seek(0)
+        output.truncate(0)
+        return data
+
+    output.write("\ufeff")
+    writer.writerow(EXPORT_HEADERS)
+    yield take()
+
+    while True:
+        rows = cursor.fetchmany(EXPORT_CONFIG["chunk_rows"])
+        if not rows:
+            break
+        writer.writerows(map(format_export_row, rows))
+        yield take()
+
+
+def _gzip_chunks(chunks):
+    """gzip 压缩字节块(Content-Encoding: gzip)"""
+    compressor = zlib.compressobj(EXPORT_CONFIG["gzip_level"], zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _stream_export(connection, cursor, chunks):
+    """
+    发送导出文件的字节块
+
+    结束后归还连接和导出名额(客户端中途断开时在生成器被回收时执行)
+    """
+    completed = False
+    try:
+        yield from chunks
+        completed = True
+    except Exception as e:
+        print(f"[Export] 导出中断: {str(e)}")
+        raise
+    finally:
+        _release_export_cursor(connection, cursor, completed)
+        export_slots.release()
+
+
+class ExportJobRequest(BaseModel):
+    start_datetime: str
+    end_datetime: str
+    format: str = "csv"
+
+
+@router.post("/export/jobs")
+async def submit_export_job(request: ExportJobRequest):
+    """
+    提交后台导出任务, 导出文件写入服务器本地, 完成后通过 download_url 下载
+
+    参数:
+    - start_datetime / end_datetime: 起止时间 格式: YYYY-MM-DD HH:MM:SS
+    - format: csv(默认) / parquet / arrow
+
+    相同参数且范围内没有新数据时返回已有的任务(reused 为 true), 不重新导出
+
+    返回: 任务信息, 与 GET /export/jobs/{job_id} 相同, 另有 reused
+    """
+    return await run_light(_submit_export_job, request.start_datetime, request.end_datetime, request.format)
+
+
+def _submit_export_job(start_datetime: str, end_datetime: str, export_format: str):
+    start_dt, end_dt = _parse_export_range(start_datetime, end_datetime)
+    if export_format not in ("csv", "parquet", "arrow"):
+        raise HTTPException(status_code=400, detail="导出格式应为 csv / parquet / arrow")
+    _check_export_format(export_format)
+
+    connection = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        fingerprint = export_jobs.range_fingerprint(cursor, start_dt, end_dt)
+        cursor.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询导出范围失败: {str(e)}")
     finally:
         if connection:
             connection.close()
 
+    _, extension, _ = _export_file_type(start_dt, end_dt, export_format)
+    job, reused = export_jobs.submit(
+        start_dt.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S"), export_format, extension,
+        fingerprint, functools.partial(_produce_export_file, start_dt, end_dt, export_format),
+    )
+    return {**job.info(), "reused": reused}
+
+
+def _produce_export_file(start_dt: datetime, end_dt: datetime, export_format: str, job):
+    """后台任务中生成导出文件的字节块, 并记录已读取的行数"""
+    connection = get_db_connection()
+    try:
+        connection, cursor = _open_export_cursor(connection, start_dt, end_dt)
+    except Exception:
+        connection.discard()
+        raise
+
+    completed = False
+    try:
+        yield from _export_chunks(export_jobs.ProgressCursor(cursor, job), export_format)
+        completed = True
+    finally:
+        _release_export_cursor(connection, cursor, completed)
+
+
+@router.get("/export/jobs/{job_id}")
+async def get_export_job(job_id: str = Path(..., pattern="^[0-9a-f]{32}$")):
+    """
+    查询后台导出任务的进度
+
+    返回:
+    {
+        "job_id": "...",
+        "status": "queued" | "running" | "done" | "failed",
+        "rows_written": 12000,
+        "estimated_rows": 50000,
+        "progress": 24.0,
+        "bytes": 3456789,
+        "error": null,
+        "download_url": null
+    }
+    """
+    job = await run_light(export_jobs.ExportJob.load, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导出任务不存在或已过期")
+    return job.info()
+
+
+@router.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str = Path(..., pattern="^[0-9a-f]{32}$")):
+    """
+    下载后台导出任务生成的文件, 支持 Range 请求(断点续传)
+
+    文件不经过 GZip 中间件压缩, 以便 Range 的字节位置与文件一致
+    """
+    job = await run_light(export_jobs.ExportJob.load, job_id)
+    if job is None or (job.status == "done" and not os.path.exists(job.path)):
+        raise HTTPException(status_code=404, detail="导出任务不存在或已过期")
+    if job.info()["status"] != "done":
+        raise HTTPException(status_code=409, detail="导出任务尚未完成")
+
+    start_dt = datetime.strptime(job.start_datetime, "%Y-%m-%d %H:%M:%S")
+    end_dt = datetime.strptime(job.end_datetime, "%Y-%m-%d %H:%M:%S")
+    filename, _, media_type = _export_file_type(start_dt, end_dt, job.export_format)
+    return FileResponse(job.path, media_type=media_type, filename=filename,
+                        headers={"Content-Encoding": "identity"})
+
 
 def process_single_machine_timeline(machine_name: str, machine_model: str, db_config: dict):
     """
@@ -468,129 +575,20 @@ def process_single_machine_timeline(machine_name: str, machine_model: str, db_co
         df = pd.DataFrame(machine_rows)
 
         # 组合 date 和 time 成 datetime
-        df["date"] = pd.to_datetime(df["date"])
-
-        # 处理 time 字段
-        if pd.api.types.is_timedelta64_dtype(df["time"]) or isinstance(
-                df["time"].iloc[0], pd.Timedelta
-        ):
-            df["datetime"] = df["date"] + df["time"]
-        else:
-            df["datetime"] = pd.to_datetime(
-                df["date"].astype(str) + " " + df["time"].astype(str)
-            )
+        df["datetime"] = build_datetime(df)
 
-        # ===== 步骤1: 处理cell数据，计算每个cell的zero_ratio，排除>0.8的cell =====
-        valid_cells = []
-        for i in range(1, 21):  # cell_1 到 cell_20
-            cell_field = f"cell_{i}"
+        # ===== 步骤1-3: cell有效性筛选（与图表接口使用相同的规则） =====
+        valid_cells, global_start_time, row_mask, _, _ = select_valid_cells(df)
 
-            if cell_field not in df.columns:
-                continue
-
-            # 创建副本避免警告
-            cell_df = df[["datetime", cell_field]].copy()
-            cell_df.columns = ["datetime", "value"]
-
-            # 转换为数值类型
-            cell_df["value"] = pd.to_numeric(
-                cell_df["value"], errors="coerce"
-            )
-
-            # 找到第一个非0且>1680的值的索引
-            mask = (cell_df["value"] > 0) & (cell_df["value"] > 1680)
-            valid_indices = cell_df[mask].index
-
-            if len(valid_indices) == 0:
-                continue
-
-            # 从第一个>1680的值开始计算
-            start_idx = valid_indices[0]
-            cell_df = cell_df.loc[start_idx:].copy()
-
-            # 计算临时时间差用于分组
-            temp_start_time = cell_df.iloc[0]["datetime"]
-            cell_df["time_diff"] = (
-                    (cell_df["datetime"] - temp_start_time).dt.total_seconds()
-                    / 3600
-            ).astype(int)
-
-            # 分组计算 y=0 比例
-            grouped_temp = (
-                cell_df.groupby("time_diff")
-                .agg({"value": "mean"})
-                .reset_index()
-            )
-            grouped_temp.columns = ["x", "y"]
-            grouped_temp["y"] = grouped_temp["y"].round(2)
-
-            zero_ratio = (
-                (grouped_temp["y"] == 0).sum() / len(grouped_temp)
-                if len(grouped_temp) > 0
-                else 0
-            )
-
-            # 只保留zero_ratio <= 0.8的cell
-            if zero_ratio <= 0.8:
-                valid_cells.append(cell_field)
-
-        # 如果没有有效的cell，返回空数据
-        if len(valid_cells) == 0:
+        # 如果没有有效的cell或没有有效行，返回空数据
+        if len(valid_cells) == 0 or not row_mask.any():
             return {
                 "machine_model": machine_model,
                 "machine_name": machine_name,
                 "time": [],
             }
 
-        # ===== 步骤2: 获取剩余cell的起始时间点，为所有cell均>1680的最小时间点 =====
-        start_time_candidates = []
-        for cell_field in valid_cells:
-            cell_df = df[["datetime", cell_field]].copy()
-            cell_df.columns = ["datetime", "value"]
-            cell_df["value"] = pd.to_numeric(
-                cell_df["value"], errors="coerce"
-            )
-
-            # 找到第一个非0且>1680的值
-            mask = (cell_df["value"] > 0) & (cell_df["value"] > 1680)
-            valid_indices = cell_df[mask].index
-
-            if len(valid_indices) > 0:
-                start_time = cell_df.loc[valid_indices[0], "datetime"]
-                start_time_candidates.append(start_time)
-
-        # 使用最晚的起始时间，确保所有cell在这个时间点都>1680
-        global_start_time = max(start_time_candidates)
-
-        # ===== 步骤3: 基于global_start_time过滤数据，并获取实际的时间点列表 =====
-        cell_df_filtered = df[["datetime"] + valid_cells].copy()
-
-        # 转换所有cell列为数值类型
-        for cell_field in valid_cells:
-            cell_df_filtered[cell_field] = pd.to_numeric(
-                cell_df_filtered[cell_field], errors="coerce"
-            )
-
-        # 使用全局起始时间筛选数据
-        cell_df_filtered = cell_df_filtered[
-            cell_df_filtered["datetime"] >= global_start_time
-            ].copy()
-
-        # 过滤掉任意cell < 1680 的行，确保所有cell都>=1680
-        mask = pd.Series(
-            [True] * len(cell_df_filtered), index=cell_df_filtered.index
-        )
-        for cell_field in valid_cells:
-            mask &= cell_df_filtered[cell_field] >= 1680
-
-        cell_df_filtered = cell_df_filtered[mask].copy()
-
-        if cell_df_filtered.empty:
-            return {
-                "machine_model": machine_model,
-                "machine_name": machine_name,
-                "time": [],
-            }
+        cell_df_filtered = df.loc[row_mask, ["datetime"]]
 
         # 获取过滤后的有效时间点列表
         valid_datetimes = cell_df_filtered["datetime"].unique()
@@ -638,18 +636,16 @@ def get_machine_timeline():
         cursor = connection.cursor(pymysql.cursors.DictCursor)
 
         # 步骤1: 一次性查询所有machine_name的最新machine_model
-        placeholders = ",".join(["%s"] * len(machine_names))
-        sql = f"""
-            SELECT t1.machine_name, t1.machine_model
-            FROM wincc t1
-            INNER JOIN (
-                SELECT machine_name, MAX(CONCAT(date, ' ', time)) as max_datetime
-                FROM wincc
-                WHERE machine_name IN ({placeholders})
-                GROUP BY machine_name
-            ) t2 ON t1.machine_name = t2.machine_name 
-                AND CONCAT(t1.date, ' ', t1.time) = t2.max_datetime
-        """
+        # 每台设备取最新一条记录, 在 (machine_name, date, time) 索引上倒序读取一行即可
+        sql = " UNION ALL ".join(["""
+            (SELECT machine_name, machine_model
+             FROM wincc
+             WHERE machine_name = %s
+               AND date IS NOT NULL
+               AND time IS NOT NULL
+             ORDER BY date DESC, time DESC
+             LIMIT 1)
+        """] * len(machine_names))
         cursor.execute(sql, tuple(machine_names))
         latest_records = cursor.fetchall()
         cursor.close()
@@ -727,9 +723,8 @@ async def get_electrolyzer_hours():
         List[Dict]: 返回格式为 [{"name": "1#", "hours": 7}, ...]
     """
 
-    # 在线程池中执行 get_machine_timeline，避免阻塞事件循环
-    loop = asyncio.get_event_loop()
-    timeline_data = await loop.run_in_executor(None, get_machine_timeline)
+    # 在 heavy 通道中执行 get_machine_timeline，避免阻塞事件循环
+    timeline_data = await run_heavy(get_machine_timeline)
 
     result = []
 
@@ -750,28 +745,13 @@ async def get_electrolyzer_hours():
             )
             continue
 
-        # 计算运行时长
-        total_hours = 0.0
-        current_hours = 0.0
-        for i in range(1, len(times)):
-            prev_time = datetime.strptime(times[i - 1], "%Y-%m-%d %H:%M:%S")
-            current_time = datetime.strptime(times[i], "%Y-%m-%d %H:%M:%S")
-
-            # 计算时间差（分钟）
-            time_diff_minutes = (current_time - prev_time).total_seconds() / 60
-
-            # 如果时间差 <= 60分钟，加上实际时间差
-            if time_diff_minutes <= 60:
-                total_hours += time_diff_minutes / 60
-                current_hours += time_diff_minutes / 60
-            # 如果时间差 > 60分钟，加上0小时
-            else:
-                total_hours += 0
-                current_hours = 0
+        # 计算运行时长（时间差 <= 60分钟计入运行时长，> 60分钟视为停机，当前运行时长从最后一次停机后开始累计）
+        datetimes = pd.to_datetime(times, format="%Y-%m-%d %H:%M:%S")
+        total_hours, current_hours = runtime_hours(datetimes)
 
         # 判断最后一个时间点与当前时间的差值
         if times:
-            last_time = datetime.strptime(times[-1], "%Y-%m-%d %H:%M:%S")
+            last_time = datetimes[-1].to_pydatetime()
             current_query_time = datetime.now()
             time_diff_minutes = (current_query_time - last_time).total_seconds() / 60
             if time_diff_minutes > 60:
@@ -814,6 +794,10 @@ async def get_table_data(
         "data": [数据列表]
     }
     """
+    return await run_light(_get_table_data, machine_name, start_datetime, end_datetime, page, size)
+
+
+def _get_table_data(machine_name: str, start_datetime: str, end_datetime: str, page: int, size: int):
     connection = None
     try:
         # 验证分页参数
@@ -837,18 +821,22 @@ async def get_table_data(
         if start_datetime:
             # 验证时间格式
             try:
-                datetime.strptime(start_datetime, "%Y-%m-%d %H:%M:%S")
-                where_conditions.append("CONCAT(date, ' ', time) >= %s")
-                params.append(start_datetime)
+                range_conditions, range_params = datetime_range_conditions(
+                    start=datetime.strptime(start_datetime, "%Y-%m-%d %H:%M:%S")
+                )
+                where_conditions += range_conditions
+                params += range_params
             except ValueError:
                 raise HTTPException(status_code=400, detail="开始时间格式错误，应为: YYYY-MM-DD HH:MM:SS")
 
         if end_datetime:
             # 验证时间格式
             try:
-                datetime.strptime(end_datetime, "%Y-%m-%d %H:%M:%S")
-                where_conditions.append("CONCAT(date, ' ', time) <= %s")
-                params.append(end_datetime)
+                range_conditions, range_params = datetime_range_conditions(
+                    end=datetime.strptime(end_datetime, "%Y-%m-%d %H:%M:%S")
+                )
+                where_conditions += range_conditions
+                params += range_params
             except ValueError:
                 raise HTTPException(status_code=400, detail="结束时间格式错误，应为: YYYY-MM-DD HH:MM:SS")
 
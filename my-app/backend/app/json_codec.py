@@ -0,0 +1,27 @@
+"""
+JSON 解码后端
+安装了 orjson 时使用 orjson(直接解析 bytes, 速度约为标准库的数倍), 否则使用标准库 json;
+loads 可以直接传入 bytes 或 str, 调用方不需要先 decode('utf-8')
+
+注意: orjson 不接受 NaN / Infinity 和超过64位的整数, 这类消息会按解析失败处理
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+if orjson is not None:
+    BACKEND = "orjson"
+    JSONDecodeError = orjson.JSONDecodeError  # json.JSONDecodeError 的子类
+    loads = orjson.loads
+else:
+    BACKEND = "json"
+    JSONDecodeError = json.JSONDecodeError
+
+    def loads(data):
+        # 标准库直接解析 bytes 时需要先检测编码, 比先 decode 再解析更慢
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf-8')
+        return json.loads(data)
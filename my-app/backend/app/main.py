@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
@@ -5,23 +6,39 @@ from contextlib import asynccontextmanager
 from .charts import router as charts_router
 from .auth import router as auth_router
 from .home import router as home_router
-from .mqtt import router as mqtt_router, start_mqtt_client, stop_mqtt_client
+from .mqtt import router as mqtt_router
+from .mqtt_leader import start_mqtt_ingest, stop_mqtt_ingest
 from .config import debug
+from .db import init_db_pool, close_db_pool
+from . import export_arrow
+from .workers import shutdown_workers
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时执行
+    # 创建数据库连接池, 路由和MQTT写入共用; 预热在线程中执行, 不阻塞事件循环
+    pool = init_db_pool()
+    await asyncio.to_thread(pool.warm_up)
+    print(f"[DB] 数据库连接池已创建, 最大连接数: {pool.max_size}")
+    if not export_arrow.AVAILABLE:
+        print("[Export] 未安装 pyarrow, 只能导出CSV (pip install -r requirements-optional.txt)")
+
+    # 多进程(--workers)部署时各进程选主, 只有 leader 进程启动MQTT客户端
     if not debug:
-        print("[MQTT] 非调试模式，启动MQTT客户端")
-        start_mqtt_client()
+        print("[MQTT] 非调试模式，参与MQTT接收选主")
+        await start_mqtt_ingest()
     else:
         print("[MQTT] 调试模式，跳过MQTT客户端启动")
 
     yield
 
     if not debug:
-        stop_mqtt_client()
+        await stop_mqtt_ingest()
+
+    shutdown_workers()
+    # 关闭空闲连接需要逐个通知服务端, 同样放到线程中执行
+    await asyncio.to_thread(close_db_pool)
 
 
 app = FastAPI(title="My FastAPI Backend", lifespan=lifespan)
@@ -0,0 +1,182 @@
+"""
+wincc 表索引迁移和查询计划检查
+
+用法(在 backend 目录下执行):
+    python -m app.migrate            # 执行迁移并检查热点查询的执行计划
+    python -m app.migrate --check    # 只检查执行计划, 不修改表结构
+    python -m app.migrate --dry-run  # 只打印将要执行的 SQL
+
+首页/导出/分页/时间轴的查询都按 machine_name + (date, time) 范围过滤或排序,
+迁移为 wincc 增加 (machine_name, date, time) 唯一索引, MQTT 写入依赖它合并同一时间的数据;
+表中已有重复数据时先执行 python -m app.dedup 合并, 否则迁移失败。
+检查时对这些查询执行 EXPLAIN, 没有使用索引(type=ALL)的查询视为失败, 退出码为1
+"""
+import sys
+from datetime import datetime, timedelta
+
+import pymysql
+
+from .db import get_db_pool, close_db_pool, datetime_range_conditions
+
+# (索引名, 建索引的 SQL, 被替代的索引), 已存在的索引会跳过, 被替代的索引在同一条 ALTER 中删除
+MIGRATIONS = [
+    (
+        "uniq_machine_date_time",
+        "ALTER TABLE wincc ADD UNIQUE KEY uniq_machine_date_time (machine_name, date, time)",
+        ["idx_machine_date_time"],
+    ),
+]
+
+
+def index_exists(cursor, index_name: str) -> bool:
+    cursor.execute(
+        """
+        SELECT 1
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE()
+          AND table_name = 'wincc'
+          AND index_name = %s
+        LIMIT 1
+        """,
+        (index_name,),
+    )
+    return cursor.fetchone() is not None
+
+
+def count_duplicates(cursor) -> int:
+    """(machine_name, date, time) 重复的组数(唯一索引允许多个 NULL, 不统计含 NULL 的行)"""
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM (SELECT 1
+              FROM wincc
+              WHERE machine_name IS NOT NULL AND date IS NOT NULL AND time IS NOT NULL
+              GROUP BY machine_name, date, time
+              HAVING COUNT(*) > 1) AS duplicates
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def migrate(connection, dry_run: bool = False) -> bool:
+    """执行尚未执行的迁移, 因重复数据无法建唯一索引时返回 False"""
+    cursor = connection.cursor()
+    try:
+        for index_name, sql, replaced in MIGRATIONS:
+            if index_exists(cursor, index_name):
+                print(f"[Migrate] 索引 {index_name} 已存在, 跳过")
+                continue
+            sql += "".join(f", DROP INDEX {name}" for name in replaced if index_exists(cursor, name))
+            if "UNIQUE" in sql:
+                duplicates = count_duplicates(cursor)
+                if duplicates:
+                    print(f"[Migrate] 有{duplicates}组 (machine_name, date, time) 重复的数据, "
+                          f"无法创建唯一索引 {index_name}, 请先执行 python -m app.dedup")
+                    return False
+            if dry_run:
+                print(f"[Migrate] {sql}")
+                continue
+            print(f"[Migrate] 创建索引 {index_name} ...")
+            started = datetime.now()
+            cursor.execute(sql)
+            print(f"[Migrate] 索引 {index_name} 创建完成, 耗时 {(datetime.now() - started).total_seconds():.1f}秒")
+        return True
+    finally:
+        cursor.close()
+
+
+def hot_queries():
+    """与接口中一致的热点查询, 返回 [(名称, SQL, 参数)]"""
+    end = datetime.now()
+    start = end - timedelta(days=1)
+    machines = [f"{i}#" for i in range(1, 16)]
+    placeholders = ",".join(["%s"] * len(machines))
+    range_conditions, range_params = datetime_range_conditions(start, end)
+    range_where = " AND ".join(range_conditions)
+
+    return [
+        (
+            "首页总览 /home/overview",
+            f"""
+            SELECT machine_name, machine_model, date, time, avg_voltage
+            FROM wincc
+            WHERE machine_name IN ({placeholders})
+              AND {range_where}
+            ORDER BY date ASC, time ASC
+            """,
+            machines + range_params,
+        ),
+        (
+            "数据导出 /home/export",
+            f"SELECT * FROM wincc WHERE {range_where} ORDER BY machine_name ASC, date ASC, time ASC",
+            range_params,
+        ),
+        (
+            "分页查询 /home/table-data",
+            f"""
+            SELECT *
+            FROM wincc
+            WHERE machine_name = %s AND {range_where}
+            ORDER BY date DESC, time DESC
+            LIMIT %s OFFSET %s
+            """,
+            ["1#"] + range_params + [20, 0],
+        ),
+        (
+            "设备最新型号 /home/hours",
+            """
+            SELECT machine_name, machine_model
+            FROM wincc
+            WHERE machine_name = %s
+              AND date IS NOT NULL
+              AND time IS NOT NULL
+            ORDER BY date DESC, time DESC
+            LIMIT 1
+            """,
+            ["1#"],
+        ),
+    ]
+
+
+def check_query_plans(connection) -> bool:
+    """对热点查询执行 EXPLAIN, 全部使用索引时返回 True"""
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    ok = True
+    try:
+        for name, sql, params in hot_queries():
+            cursor.execute("EXPLAIN " + sql, params)
+            for row in cursor.fetchall():
+                if row.get("table") != "wincc":
+                    continue
+                uses_index = row.get("key") is not None and row.get("type") != "ALL"
+                ok = ok and uses_index
+                print(f"[Explain] {'OK  ' if uses_index else 'FAIL'} {name}: "
+                      f"type={row.get('type')}, key={row.get('key')}, rows={row.get('rows')}, "
+                      f"extra={row.get('Extra')}")
+    finally:
+        cursor.close()
+    return ok
+
+
+def main(argv):
+    check_only = "--check" in argv
+    dry_run = "--dry-run" in argv
+
+    connection = get_db_pool().acquire()
+    try:
+        if not check_only and not migrate(connection, dry_run=dry_run):
+            return 1
+        if dry_run:
+            return 0
+        if check_query_plans(connection):
+            print("[Explain] 所有热点查询均使用索引")
+            return 0
+        print("[Explain] 存在未使用索引的查询(数据量很小时 MySQL 也可能选择全表扫描)")
+        return 1
+    finally:
+        connection.close()
+        close_db_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
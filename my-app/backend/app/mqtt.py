@@ -1,14 +1,21 @@
+import asyncio
 import paho.mqtt.client as mqtt
+import random
 import threading
+import time
 import uuid
 from datetime import datetime, timedelta
 from collections import deque
 from fastapi import APIRouter
 from typing import Optional
-import json
 import pymysql
 from dateutil import parser
-from .config import DB_CONFIG, MQTT_CONFIG
+from .config import MQTT_CONFIG, MQTT_BUFFER_CONFIG, backend_path
+from .chart_cache import chart_cache
+from . import json_codec
+from .db import get_db_pool
+from .mqtt_spool import MessageSpool
+from .mqtt_tags import lookup_tag
 
 router = APIRouter()
 
@@ -17,6 +24,7 @@ MQTT_BROKER = MQTT_CONFIG["broker"]
 MQTT_PORT = MQTT_CONFIG["port"]
 MQTT_KEEPALIVE = MQTT_CONFIG["keepalive"]
 MQTT_TOPIC = MQTT_CONFIG["topic"]
+MQTT_QOS = MQTT_CONFIG["qos"]
 
 # 全局变量
 mqtt_client: Optional[mqtt.Client] = None
@@ -24,32 +32,141 @@ mqtt_connected = False
 mqtt_lock = threading.Lock()
 mqtt_logs = deque(maxlen=2000)  # 最多保存2000条日志
 
-# 消息处理队列
-message_queue = []  # 消息列表,存储所有接收到的消息
-message_queue_lock = threading.Lock()  # 消息队列锁
+# 连接统计, 由 mqtt_lock 保护; 断开期间 wincc 没有数据, 运行时长统计会出现缺口
+connection_stats = {
+    "connects": 0,  # 连接成功次数
+    "reconnects": 0,  # 断开后重新连接成功的次数
+    "connect_failures": 0,  # 连接失败次数(Broker 不可达或拒绝连接)
+    "last_downtime_s": None,  # 最近一次断开的时长
+    "total_downtime_s": 0.0,  # 累计断开时长
+}
+disconnected_since = None  # 断开(或开始连接)的时间(time.monotonic), 已连接时为 None, 由 mqtt_lock 保护
+
+# 连接线程(线程模式): 负责连接、运行网络循环, 断开后按退避时间重连
+connection_thread: Optional[threading.Thread] = None
+connection_stop = threading.Event()
+
+
+class ReconnectBackoff:
+    """
+    带随机抖动的指数退避
+    第 n 次等待 min_delay * 2^n 秒(不超过 max_delay), 实际等待时间在 [(1-jitter)*t, t] 之间随机,
+    避免 Broker 重启后所有客户端同时重连
+    """
+
+    def __init__(self, min_delay: float, max_delay: float, jitter: float):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self) -> float:
+        delay = min(self.min_delay * 2 ** self.attempts, self.max_delay)
+        self.attempts += 1
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    def reset(self):
+        self.attempts = 0
+
+
+# 两种接收模式共用, 连接成功后重置
+reconnect_backoff = ReconnectBackoff(
+    MQTT_CONFIG["reconnect_min_delay"], MQTT_CONFIG["reconnect_max_delay"], MQTT_CONFIG["reconnect_jitter"]
+)
 
-# 数据合并触发机制 (消息间隔检测)
-last_message_time = None  # 最后一条消息的接收时间
-merge_lock = threading.Lock()  # 合并操作锁,防止重复触发
-MESSAGE_IDLE_THRESHOLD = 20  # 消息间隔阈值(秒),超过此时间无新消息则触发合并
-merge_timer = None  # 消息间隔检测定时器
+# 消息处理队列
+# 有界缓冲区: 接收回调在队尾追加, 写入线程从队首原地取出, 不复制整个队列
+message_queue = deque()  # [(topic, payload)], payload 保持收到的原始 bytes, 清洗时再解析
+message_queue_lock = threading.Lock()  # 保护触发时间和统计信息
+BUFFER_MAX_MESSAGES = MQTT_BUFFER_CONFIG["max_messages"]
+OVERFLOW_POLICY = MQTT_BUFFER_CONFIG["overflow_policy"]  # drop_oldest / drop_newest / spill
+message_spool = MessageSpool(backend_path(MQTT_BUFFER_CONFIG["spool_path"]))  # 溢出和写入失败的消息, 启动接收时 reload()
+
+# 缓冲区统计, 由 message_queue_lock 保护
+buffer_stats = {
+    "enqueued": 0,  # 放入缓冲区的消息数
+    "dropped": 0,  # 缓冲区满时丢弃的消息数
+    "spilled": 0,  # 缓冲区满时写入溢出文件的消息数
+    "flushed": 0,  # 已处理完成的消息数
+}
+
+# 数据合并触发机制, 满足任一条件时触发清洗和上传:
+# - 消息间隔: 超过 MESSAGE_IDLE_THRESHOLD 秒没有新消息
+# - 批次时长: 当前批次第一条消息已等待超过 MAX_BATCH_AGE 秒(消息持续不断时也能定期写入)
+# - 批次大小: 待处理消息达到 MAX_BATCH_SIZE 条
+MESSAGE_IDLE_THRESHOLD = 20  # 消息间隔阈值(秒)
+MAX_BATCH_AGE = 120  # 批次最长等待时间(秒)
+MAX_BATCH_SIZE = 5000  # 批次最大消息数
+last_message_time = None  # 最后一条消息的接收时间(time.monotonic), 由 message_queue_lock 保护
+batch_started_time = None  # 当前批次第一条消息的接收时间(time.monotonic), 由 message_queue_lock 保护
+
+# 写入线程、重试线程和 asyncio 写入任务的数据清洗上传逐个执行(只有 leader 进程写入):
+# - 自增 id 按提交顺序分配, 图表增量刷新按 id 水位读取新行时不会跳过较晚提交的较小 id
+# - 查询已有行到 INSERT 提交之间不会有其他批次插入相同的行, 新行/合并的判断准确
+flush_lock = threading.Lock()
+
+# 写入线程: 同时负责触发调度和数据清洗上传, 接收消息的回调(paho网络线程)不等待数据库
+writer_thread: Optional[threading.Thread] = None
+flush_requested = threading.Event()  # 唤醒写入线程重新检查触发条件
+writer_stop = threading.Event()
+
+# 重试线程: 把本地文件中的消息按顺序重新写入数据库
+retrier_thread: Optional[threading.Thread] = None
+retry_requested = threading.Event()  # 有新的写入失败批次时唤醒重试线程
+retrier_stop = threading.Event()
+spool_stats = {
+    "replayed": 0,  # 重新写入成功的消息数
+    "replay_failures": 0,  # 重新写入失败(数据库仍不可用)的次数
+    "retry_interval": MQTT_BUFFER_CONFIG["retry_interval"],  # 当前重试间隔(秒)
+}
+
+# 接收消息回调的耗时统计, 用于确认网络线程没有被阻塞
+receive_stats = {
+    "messages": 0,
+    "last_blocked_ms": 0,
+    "max_blocked_ms": 0,
+}
+
+# 数据写入统计
+flush_stats = {
+    "flushes": 0,  # 完成的数据清洗和上传次数
+    "batches": 0,  # 执行的批量 INSERT 次数
+    "rows": 0,  # 写入的行数
+    "merged": 0,  # 合并到已有行(相同设备和时间)的行数
+    "last_flush_ms": None,  # 最近一次上传(所有批次+提交)耗时
+    "last_batch_ms": None,  # 最近一个批次耗时
+    "max_batch_ms": 0,  # 最长的批次耗时
+}
 
 
 def on_connect(client, userdata, flags, rc):
-    """MQTT连接成功回调"""
-    global mqtt_connected
+    """MQTT连接成功回调, 每次(重新)连接后都重新订阅主题"""
+    global mqtt_connected, disconnected_since
     if rc == 0:
+        reconnect_backoff.reset()
         msg = f"[MQTT] 成功连接到MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}"
+        if flags.get("session present"):
+            msg += ", 已恢复持久会话"
         with mqtt_lock:
             mqtt_connected = True
+            reconnected = connection_stats["connects"] > 0
+            connection_stats["connects"] += 1
+            if disconnected_since is not None:
+                downtime = round(time.monotonic() - disconnected_since, 1)
+                connection_stats["last_downtime_s"] = downtime
+                connection_stats["total_downtime_s"] = round(connection_stats["total_downtime_s"] + downtime, 1)
+                disconnected_since = None
+                if reconnected:
+                    connection_stats["reconnects"] += 1
+                    msg += f", 断开时长{downtime}秒"
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "level": "成功",
                 "message": msg
             })
         # 订阅主题
-        client.subscribe(MQTT_TOPIC)
-        subscribe_msg = f"[MQTT] 已订阅主题: {MQTT_TOPIC}"
+        client.subscribe(MQTT_TOPIC, qos=MQTT_QOS)
+        subscribe_msg = f"[MQTT] 已订阅主题: {MQTT_TOPIC} (QoS {MQTT_QOS})"
         with mqtt_lock:
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -60,6 +177,7 @@ def on_connect(client, userdata, flags, rc):
         msg = f"[MQTT] 连接失败，返回码: {rc}"
         with mqtt_lock:
             mqtt_connected = False
+            connection_stats["connect_failures"] += 1
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "level": "错误",
@@ -68,10 +186,11 @@ def on_connect(client, userdata, flags, rc):
 
 
 def on_disconnect(client, userdata, rc):
-    """MQTT断开连接回调"""
+    """MQTT断开连接回调, 由连接线程(或 asyncio 模式的连接任务)负责重连"""
     global mqtt_connected
     with mqtt_lock:
         mqtt_connected = False
+    mark_disconnected()
     if rc != 0:
         msg = f"[MQTT] 意外断开连接，返回码: {rc}"
         with mqtt_lock:
@@ -92,27 +211,51 @@ def on_disconnect(client, userdata, rc):
 
 def on_message(client, userdata, msg):
     """MQTT消息接收回调 - 快速接收并放入列表"""
-    global last_message_time, merge_timer
+    global last_message_time, batch_started_time
+    started = time.perf_counter()
     try:
         topic = msg.topic
-        payload = msg.payload.decode('utf-8')
+        payload = msg.payload
 
-        # 放入消息列表
+        # 放入缓冲区并更新最后消息时间
+        spill = False
         with message_queue_lock:
-            message_queue.append((topic, payload))
-
-        # 更新最后消息时间
-        with merge_lock:
-            last_message_time = datetime.now()
-
-            # 取消之前的定时器
-            if merge_timer is not None:
-                merge_timer.cancel()
-
-            # 启动新的间隔检测定时器
-            merge_timer = threading.Timer(MESSAGE_IDLE_THRESHOLD, trigger_merge_on_idle)
-            merge_timer.daemon = True
-            merge_timer.start()
+            accept = True
+            if len(message_queue) >= BUFFER_MAX_MESSAGES:
+                if OVERFLOW_POLICY == "spill":
+                    spill = True
+                    accept = False
+                elif OVERFLOW_POLICY == "drop_newest":
+                    buffer_stats["dropped"] += 1
+                    accept = False
+                else:
+                    message_queue.popleft()
+                    buffer_stats["dropped"] += 1
+            if accept:
+                message_queue.append((topic, payload))
+                buffer_stats["enqueued"] += 1
+            last_message_time = time.monotonic()
+            new_batch = batch_started_time is None
+            if new_batch:
+                batch_started_time = last_message_time
+            batch_full = len(message_queue) >= MAX_BATCH_SIZE
+
+            # 记录本次回调耗时(包括等待锁的时间)
+            blocked_ms = round((time.perf_counter() - started) * 1000, 3)
+            receive_stats["messages"] += 1
+            receive_stats["last_blocked_ms"] = blocked_ms
+            if blocked_ms > receive_stats["max_blocked_ms"]:
+                receive_stats["max_blocked_ms"] = blocked_ms
+
+        # 缓冲区已满, 写入溢出文件(不 fsync, 避免阻塞网络线程), 缓冲区清空后再读回
+        if spill:
+            message_spool.append([(topic, payload)], sync=False)
+            with message_queue_lock:
+                buffer_stats["spilled"] += 1
+
+        # 新批次开始时唤醒写入线程重新计算触发时间, 达到批次大小时立即触发
+        if new_batch or batch_full:
+            flush_requested.set()
 
     except Exception as e:
         error_msg = f"[MQTT] 接收消息时出错: {str(e)}"
@@ -124,52 +267,193 @@ def on_message(client, userdata, msg):
             })
 
 
-def trigger_merge_on_idle():
+def flush_trigger():
     """
-    消息间隔检测触发数据清洗和上传
-    当超过MESSAGE_IDLE_THRESHOLD秒没有新消息时触发
+    检查是否满足触发条件
+
+    返回: (触发原因, 距离下一次可能触发的秒数)
+    - 触发原因为 None 表示暂不触发
+    - 没有待处理消息时等待时间为 None
     """
-    try:
-        with merge_lock:
-            # 检查是否真的超过阈值(防止定时器延迟导致的误触发)
-            if last_message_time is not None:
-                elapsed = (datetime.now() - last_message_time).total_seconds()
-                if elapsed >= MESSAGE_IDLE_THRESHOLD:
-                    msg = f"[数据处理] 检测到消息间隔超过{MESSAGE_IDLE_THRESHOLD}秒,触发数据清洗和上传"
-                    with mqtt_lock:
-                        mqtt_logs.append({
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "level": "信息",
-                            "message": msg
-                        })
-
-                    # 执行数据清洗和上传操作
-                    clean_and_upload_data()
+    with message_queue_lock:
+        if not message_queue:
+            return None, None
+        now = time.monotonic()
+        if len(message_queue) >= MAX_BATCH_SIZE:
+            return f"待处理消息达到{MAX_BATCH_SIZE}条", 0
+        if now - last_message_time >= MESSAGE_IDLE_THRESHOLD:
+            return f"检测到消息间隔超过{MESSAGE_IDLE_THRESHOLD}秒", 0
+        if now - batch_started_time >= MAX_BATCH_AGE:
+            return f"批次等待超过{MAX_BATCH_AGE}秒", 0
+        return None, min(last_message_time + MESSAGE_IDLE_THRESHOLD, batch_started_time + MAX_BATCH_AGE) - now
+
+
+def writer_loop():
+    """
+    写入线程: 按触发条件调度数据清洗和上传, 停止时处理剩余的消息
+    只有这一个线程负责计时, 接收消息时不再为每条消息创建定时器
+    """
+    while True:
+        try:
+            reason, delay = flush_trigger()
+            if reason is None and not writer_stop.is_set():
+                # 等到下一次可能触发的时间, 或被新批次/停止请求唤醒
+                flush_requested.wait(timeout=1 if delay is None else min(delay, 1))
+                flush_requested.clear()
+                continue
 
-    except Exception as e:
-        error_msg = f"[数据处理] 间隔检测触发时出错: {str(e)}"
+            if reason is not None:
+                msg = f"[数据处理] {reason},触发数据清洗和上传"
+                with mqtt_lock:
+                    mqtt_logs.append({
+                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "level": "信息",
+                        "message": msg
+                    })
+            with message_queue_lock:
+                has_messages = bool(message_queue)
+            if has_messages:
+                clean_and_upload_data()
+        except Exception as e:
+            error_msg = f"[数据处理] 触发数据清洗和上传时出错: {str(e)}"
+            with mqtt_lock:
+                mqtt_logs.append({
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "level": "错误",
+                    "message": error_msg
+                })
+
+        if writer_stop.is_set():
+            with message_queue_lock:
+                if not message_queue:
+                    break
+
+
+def retrier_loop():
+    """
+    重试线程: 按写入顺序把本地文件中的消息重新写入数据库
+    - 每批最多 replay_batch_size 条, 速度不超过 replay_max_rate 条/秒
+    - 数据库仍不可用时重试间隔从 retry_interval 开始翻倍, 最长 max_retry_interval 秒
+    """
+    retry_interval = MQTT_BUFFER_CONFIG["retry_interval"]
+    while not retrier_stop.is_set():
+        if not message_spool.pending:
+            # 等待新的写入失败批次(溢出的消息不会唤醒, 靠定时检查)
+            if retry_requested.wait(timeout=5):
+                retry_requested.clear()
+                # 刚写入失败, 数据库大概率还不可用, 先等待一个重试间隔
+                retrier_stop.wait(retry_interval)
+            continue
+
+        started = time.monotonic()
+        try:
+            messages, end_offset, lines = message_spool.read(MQTT_BUFFER_CONFIG["replay_batch_size"])
+            ok = clean_and_upload_data(messages, spool_on_error=False) if messages else True
+        except Exception as e:
+            ok = False
+            error_msg = f"[数据处理] 读取本地文件失败: {str(e)}"
+            with mqtt_lock:
+                mqtt_logs.append({
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "level": "错误",
+                    "message": error_msg
+                })
+
+        if not ok:
+            with mqtt_lock:
+                spool_stats["replay_failures"] += 1
+                spool_stats["retry_interval"] = retry_interval
+            retrier_stop.wait(retry_interval)
+            retry_interval = min(retry_interval * 2, MQTT_BUFFER_CONFIG["max_retry_interval"])
+            continue
+
+        message_spool.commit(end_offset, lines)
+        retry_interval = MQTT_BUFFER_CONFIG["retry_interval"]
+        msg = f"[数据处理] 已从本地文件重新写入{len(messages)}条消息, 剩余{message_spool.pending}条"
         with mqtt_lock:
+            spool_stats["replayed"] += len(messages)
+            spool_stats["retry_interval"] = retry_interval
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "level": "错误",
-                "message": error_msg
+                "level": "成功",
+                "message": msg
             })
 
-
-def clean_and_upload_data():
+        # 限制重新写入的速度
+        min_duration = lines / MQTT_BUFFER_CONFIG["replay_max_rate"]
+        retrier_stop.wait(max(0.0, min_duration - (time.monotonic() - started)))
+
+
+def start_retrier_thread():
+    """启动重试线程(已启动时不重复启动)"""
+    global retrier_thread
+    if retrier_thread is not None and retrier_thread.is_alive():
+        return
+    retrier_stop.clear()
+    retrier_thread = threading.Thread(target=retrier_loop, name="mqtt-retrier", daemon=True)
+    retrier_thread.start()
+
+
+def stop_retrier_thread(timeout: float = 30):
+    """停止重试线程, 未写入的消息保留在本地文件中, 下次启动后继续"""
+    global retrier_thread
+    if retrier_thread is None:
+        return
+    retrier_stop.set()
+    retry_requested.set()
+    retrier_thread.join(timeout)
+    retrier_thread = None
+
+
+def start_writer_thread():
+    """启动写入线程(已启动时不重复启动)"""
+    global writer_thread
+    if writer_thread is not None and writer_thread.is_alive():
+        return
+    writer_stop.clear()
+    writer_thread = threading.Thread(target=writer_loop, name="mqtt-writer", daemon=True)
+    writer_thread.start()
+
+
+def stop_writer_thread(timeout: float = 30):
+    """停止写入线程, 等待剩余消息写入完成"""
+    global writer_thread
+    if writer_thread is None:
+        return
+    writer_stop.set()
+    flush_requested.set()
+    writer_thread.join(timeout)
+    writer_thread = None
+
+
+def clean_and_upload_data(messages: Optional[list] = None, spool_on_error: bool = True) -> bool:
     """
     数据清洗和上传函数
-    从message_queue获取所有数据,清洗后直接上传到wincc表
+    从message_queue获取所有数据(或处理传入的 messages),清洗后直接上传到wincc表;
+    持有 flush_lock, 各线程的写入逐个执行
+
+    参数:
+    - spool_on_error: 数据库错误时把这批消息写入本地文件, 由重试线程在数据库恢复后重新写入
+
+    返回: 数据库错误时返回 False, 其他情况返回 True
     """
-    global message_queue
+    with flush_lock:
+        return _clean_and_upload_data(messages, spool_on_error)
+
+
+def _clean_and_upload_data(messages: Optional[list], spool_on_error: bool) -> bool:
+    global batch_started_time
     conn = None
     cursor = None
 
     try:
-        # 1. 获取所有消息并清空队列
-        with message_queue_lock:
-            messages = message_queue.copy()
-            message_queue = []  # 清空队列
+        # 1. 从缓冲区原地取出当前所有消息, 开始新的批次
+        if messages is None:
+            with message_queue_lock:
+                count = len(message_queue)
+                batch_started_time = None
+            # 只有写入线程从队首取出, 接收回调最多从队首丢弃一条后再追加一条, 队列长度不会小于 count
+            messages = [message_queue.popleft() for _ in range(count)]
 
         if not messages:
             msg = "[数据处理] 没有需要处理的数据"
@@ -179,7 +463,7 @@ def clean_and_upload_data():
                     "level": "信息",
                     "message": msg
                 })
-            return
+            return True
 
         msg = f"[数据处理] 开始处理{len(messages)}条消息..."
         with mqtt_lock:
@@ -191,10 +475,11 @@ def clean_and_upload_data():
 
         # 2. 解析和清洗数据
         temp_data = []
+        time_cache = {}  # 同一批消息的时间字符串大多相同, 每个字符串只解析一次
         for topic, payload in messages:
             try:
-                # 解析JSON格式的payload
-                data = json.loads(payload)
+                # 解析JSON格式的payload (bytes 直接解析, 从本地文件读回的为 str)
+                data = json_codec.loads(payload)
 
                 # 提取字段
                 name = data.get('name')
@@ -205,19 +490,20 @@ def clean_and_upload_data():
                 if name is None or value is None or time_str is None:
                     continue
 
-                # 转换时间格式 (ISO 8601 -> YYYY-MM-DD HH:mm:ss, UTC+0 -> UTC+8)
-                dt = parser.isoparse(time_str)
-                dt_utc8 = dt + timedelta(hours=8)
-                formatted_time = dt_utc8.strftime("%Y-%m-%d %H:%M:%S")
+                # 转换时间 (ISO 8601, UTC+0 -> UTC+8)
+                dt = time_cache.get(time_str)
+                if dt is None:
+                    dt = time_cache[time_str] = parse_message_time(time_str)
 
                 temp_data.append({
                     'name': name,
                     'value': str(value),
-                    'time': formatted_time
+                    'time': dt
                 })
 
-            except (json.JSONDecodeError, Exception) as e:
-                error_msg = f"[数据处理] 数据解析失败: {payload[:50]}..., 错误: {str(e)}"
+            except (json_codec.JSONDecodeError, Exception) as e:
+                preview = payload[:50].decode('utf-8', 'replace') if isinstance(payload, bytes) else payload[:50]
+                error_msg = f"[数据处理] 数据解析失败: {preview}..., 错误: {str(e)}"
                 with mqtt_lock:
                     mqtt_logs.append({
                         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -234,7 +520,7 @@ def clean_and_upload_data():
                     "level": "信息",
                     "message": msg
                 })
-            return
+            return True
 
         # 3. 按设备分组数据 (通过name字段识别设备编号)
         devices_data = {}  # {machine_name: {field_name: value, time: datetime}}
@@ -244,102 +530,100 @@ def clean_and_upload_data():
             value = row['value']
             time_val = row['time']
 
-            # 确保time_val是datetime对象
-            if isinstance(time_val, str):
-                time_val = datetime.strptime(time_val, "%Y-%m-%d %H:%M:%S")
-
-            # 解析设备编号 (从name中提取)
-            machine_name = extract_machine_name(name)
+            # 查表得到设备编号和字段名
+            machine_name, field_name = lookup_tag(name)
 
             if machine_name not in devices_data:
                 devices_data[machine_name] = {'time': time_val}
 
-            # 映射字段名
-            field_name = map_mqtt_to_db_field(name, machine_name)
             if field_name:
                 devices_data[machine_name][field_name] = value
                 # 保留最新的时间
                 if time_val > devices_data[machine_name]['time']:
                     devices_data[machine_name]['time'] = time_val
 
-        # 4. 连接数据库并为每个设备插入数据到wincc表
-        conn = pymysql.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        inserted_count = 0
+        # 4. 按字段集合分组, 同一组的设备用一条多行 INSERT 写入
+        batches = {}  # {(字段,...): [(machine_name, values), ...]}
         for machine_name, data in devices_data.items():
             if int(machine_name) not in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]:
                 with mqtt_lock:
                     mqtt_logs.append({
                         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                         "level": "错误",
-                        "message": "[数据处理] 无效的设备编号: {machine_name}"
+                        "message": f"[数据处理] 无效的设备编号: {machine_name}"
                     })
                 continue  # 跳过无效设备编号
-            try:
-                # 提取时间字段
-                dt = data.pop('time')
-                date_val = dt.date()
-                time_val = dt.time()
-
-                # 构建插入SQL (设备编号加上井号)
-                fields = ['machine_name', 'date', 'time']
-                values = [f"{machine_name}#", date_val, time_val]
-                placeholders = ['%s', '%s', '%s']
-
-                # 添加其他字段
-                for field_name, value in data.items():
-                    fields.append(field_name)
-                    values.append(value)
-                    placeholders.append('%s')
-
-                insert_sql = f"""
-                    INSERT INTO wincc ({', '.join(fields)})
-                    VALUES ({', '.join(placeholders)})
-                """
 
-                cursor.execute(insert_sql, values)
-                inserted_count += 1
+            # 提取时间字段
+            dt = data.pop('time')
 
-                # 记录详细的插入日志
-                detail_msg = f"[数据处理] 设备{machine_name}数据已插入,包含{len(data)}个字段"
-                with mqtt_lock:
-                    mqtt_logs.append({
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "level": "成功",
-                        "message": detail_msg
-                    })
+            # 字段排序后作为分组键 (设备编号加上井号)
+            field_names = sorted(data)
+            fields = ('machine_name', 'date', 'time', *field_names)
+            values = [f"{machine_name}#", dt.date(), dt.time(), *(data[name] for name in field_names)]
+            batches.setdefault(fields, []).append((machine_name, values))
 
-            except Exception as e:
-                error_msg = f"[数据处理] 设备{machine_name}数据插入失败: {str(e)}"
-                with mqtt_lock:
-                    mqtt_logs.append({
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "level": "错误",
-                        "message": error_msg
-                    })
+        # 5. 从连接池获取连接(连接池中的连接会被复用), 逐批写入wincc表
+        flush_started = time.perf_counter()
+        conn = get_db_pool().acquire()
+        cursor = conn.cursor()
+
+        # 相同设备和时间的行已存在时(重复投递、一次突发被拆成两批)合并到已有行;
+        # 多行 INSERT 的影响行数无法区分"一行更新+一行值不变"和"两行新插入", 先查询已有行,
+        # 查询和提交都在 flush_lock 内, 期间不会有其他批次插入
+        existing = existing_rows(cursor, [values for rows in batches.values() for _, values in rows])
+
+        inserted_count = 0
+        inserted_machines = []
+        for fields, rows in batches.items():
+            inserted = insert_batch(cursor, fields, rows)
+            inserted_count += len(inserted)
+            inserted_machines += [f"{machine_name}#" for machine_name in inserted]
 
         # 提交事务
         conn.commit()
+        with message_queue_lock:
+            buffer_stats["flushed"] += len(messages)
+        with mqtt_lock:
+            flush_stats["flushes"] += 1
+            flush_stats["merged"] += len(existing)
+            flush_stats["last_flush_ms"] = round((time.perf_counter() - flush_started) * 1000, 1)
+
+        # 有新数据写入的设备, 图表缓存标记为 dirty, 下次请求时增量累加;
+        # 已有行被更新的设备无法增量累加, 使缓存失效
+        for inserted_machine in inserted_machines:
+            if inserted_machine in existing:
+                chart_cache.invalidate_machine(inserted_machine)
+            else:
+                chart_cache.mark_dirty(inserted_machine)
 
         success_msg = f"[数据处理] 数据处理完成,共处理{len(temp_data)}条记录,插入{inserted_count}个设备的数据"
+        if existing:
+            success_msg += f",其中{', '.join(sorted(existing))}合并到相同时间的已有记录"
         with mqtt_lock:
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "level": "成功",
                 "message": success_msg
             })
+        return True
 
     except pymysql.Error as db_error:
         if conn:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except pymysql.Error:
+                conn.discard()
         error_msg = f"[数据处理] 数据库错误: {str(db_error)}"
+        if spool_on_error:
+            error_msg += spool_failed_batch(messages)
         with mqtt_lock:
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "level": "错误",
                 "message": error_msg
             })
+        return False
     except Exception as e:
         if conn:
             conn.rollback()
@@ -350,6 +634,7 @@ def clean_and_upload_data():
                 "level": "错误",
                 "message": error_msg
             })
+        return True
     finally:
         if cursor:
             cursor.close()
@@ -357,141 +642,173 @@ def clean_and_upload_data():
             conn.close()
 
 
-def extract_machine_name(mqtt_name: str) -> str:
+def parse_message_time(time_str: str) -> datetime:
     """
-    从MQTT字段名中提取设备编号
-    例如: SYS_T/CM_H -> 1, SYS_T/CM_H_1 -> 2, SYS_T/CM_H_2 -> 3, ... SYS_T/CM_H_14 -> 15
-         CELL1 -> 1, CELL1_1 -> 2, CELL1_2 -> 3, ... CELL1_14 -> 15
-         1_Type -> 1, 2_Type -> 2, ... 15_Type -> 15
+    解析消息中的 ISO 8601 时间并转换为 UTC+8 的 datetime (精确到秒, 不带时区)
+    优先使用标准库 fromisoformat, 无法解析的格式再使用 dateutil
     """
-    # 检查是否是 数字_Type 格式
-    if '_Type' in mqtt_name:
-        parts = mqtt_name.split('_Type')
-        if parts[0].isdigit():
-            return parts[0]
-
-    # 查找最后一个下划线后的数字
-    parts = mqtt_name.split('_')
+    try:
+        dt = datetime.fromisoformat(time_str)
+    except ValueError:
+        dt = parser.isoparse(time_str)
+    return (dt.replace(tzinfo=None) + timedelta(hours=8)).replace(microsecond=0)
 
-    # 从后往前查找,找到第一个纯数字部分
-    for i in range(len(parts) - 1, -1, -1):
-        if parts[i].isdigit():
-            device_suffix = int(parts[i])
-            # 后缀从1开始对应设备2, 后缀14对应设备15
-            return str(device_suffix + 1)
 
-    # 没有数字后缀的是设备1
-    return '1'
+def spool_failed_batch(messages: list) -> str:
+    """数据库错误时把整批消息写入本地文件, 返回附加到错误日志中的说明"""
+    try:
+        message_spool.append(messages, batch=uuid.uuid4().hex)
+        retry_requested.set()
+        return f", {len(messages)}条消息已写入本地文件, 数据库恢复后重新写入"
+    except Exception as e:
+        return f", 写入本地文件失败, {len(messages)}条消息丢失: {str(e)}"
 
 
-def map_mqtt_to_db_field(mqtt_name: str, machine_name: str) -> str:
+def existing_rows(cursor, rows: list) -> set:
     """
-    将MQTT字段名映射到数据库字段名
+    查询 wincc 中已存在的 (machine_name, date, time)
+    需要在 flush_lock 内调用, 并与随后的 INSERT 使用同一事务, 查询结果到提交前不会被其他批次改变
 
     参数:
-    - mqtt_name: MQTT字段名 (如: SYS_T/CM_H, SYS_T/CM_H_1, CELL1, CELL1_2)
-    - machine_name: 设备编号 (如: '1', '2', ...)
+    - rows: 待写入的值列表, 每项以 machine_name, date, time 开头
 
-    返回:
-    - 数据库字段名
+    返回: 已存在行的设备名集合
     """
-    base_name = mqtt_name
-
-    # 检查是否是 数字_Type 格式 (映射到 machine_model)
-    if '_Type' in base_name:
-        return 'machine_model'
-
-    # 去掉设备编号后缀,获取基础字段名
-    if machine_name != '1':
-        # 移除 _数字 后缀
-        suffix = f"_{int(machine_name) - 1}"
-        if base_name.endswith(suffix):
-            base_name = base_name[:-len(suffix)]
-
-    # 字段映射表 (基于mqtt说明.md)
-    field_mapping = {
-        'SYS_T/CM_H': 'hours',
-        'ELE_I': 'total_current',
-        'ELE_V': 'total_voltage',
-        'CELL1': 'cell_1',
-        'CELL2': 'cell_2',
-        'CELL3': 'cell_3',
-        'CELL4': 'cell_4',
-        'CELL5': 'cell_5',
-        'CELL6': 'cell_6',
-        'CELL7': 'cell_7',
-        'CELL8': 'cell_8',
-        'CELL9': 'cell_9',
-        'CELL10': 'cell_10',
-        'CELL11': 'cell_11',
-        'CELL12': 'cell_12',
-        'CELL13': 'cell_13',
-        'CELL14': 'cell_14',
-        'CELL15': 'cell_15',
-        'CELL16': 'cell_16',
-        'CELL17': 'cell_17',
-        'CELL18': 'cell_18',
-        'CELL19': 'cell_19',
-        'CELL20': 'cell_20',
-        'CELL21': 'cell_21',
-        'CELL22': 'cell_22',
-        'CELL23': 'cell_23',
-        'CELL24': 'cell_24',
-        'CELL25': 'cell_25',
-        'cell_max': 'max_voltage',
-        'cell_min': 'min_voltage',
-        'cell_ave': 'avg_voltage',
-        'cell_range': 'voltage_range',
-        'PUMP_P': 'pump_pressure',
-        'LCP_OUT': 'pump_opening',
-        'FAN_OUT': 'fan_opening',
-        'DT118': 'specific_gravity',
-        'PT102': 'inlet_pressure',
-        'LIT109': 'liquid_level',
-        'PT104': 'oxygen_outlet_pressure',
-        'PT105': 'hydrogen_outlet_pressure',
-        'TT103': 'oxygen_outlet_temp',
-        'TT101': 'alkali_inlet_temp',
-        'TT106': 'hydrogen_outlet_temp',
-        'TT114': 'hydrogen_gas_temp',
-        'FIT109': 'alkali_flow_meter',
-        'AT132': 'oxygen_in_hydrogen',
-        'AT131': 'hydrogen_in_oxygen',
-        '当前能耗': 'current_power',
-        'ELE_PDT': 'pressure_diff',
-        'SEP_PDT': 'sep_pressure_diff',
-        '标准差': 'std_deviation',
-        '当前产氢量': 'hydrogen_flow_meter'
-    }
+    if not rows:
+        return set()
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(rows))
+    cursor.execute(
+        f"SELECT DISTINCT machine_name FROM wincc WHERE (machine_name, date, time) IN ({placeholders})",
+        [value for values in rows for value in values[:3]]
+    )
+    return {row[0] for row in cursor.fetchall()}
 
-    return field_mapping.get(base_name, None)
 
+def insert_batch(cursor, fields: tuple, rows: list) -> list:
+    """
+    将字段集合相同的多个设备数据写入wincc表
+    使用 executemany 生成一条多行 VALUES 的 INSERT, 一次网络往返完成;
+    (machine_name, date, time) 已存在时更新本批次包含的字段, 其余字段保留原值(合并被拆开的数据);
+    整批失败时逐行重试, 只跳过出错的设备
 
-def start_mqtt_client():
-    """启动MQTT客户端"""
-    global mqtt_client, mqtt_connected
+    参数:
+    - fields: 字段名元组
+    - rows: [(machine_name, values), ...]
 
+    返回: 成功插入的设备编号列表
+    """
+    update_clause = ", ".join(f"{field} = VALUES({field})" for field in fields[3:]) or "id = id"
+    insert_sql = f"""
+        INSERT INTO wincc ({', '.join(fields)})
+        VALUES ({', '.join(['%s'] * len(fields))})
+        ON DUPLICATE KEY UPDATE {update_clause}
+    """
+    started = time.perf_counter()
     try:
-        # 生成随机的客户端ID，避免重复连接冲突
-        random_client_id = f"fastapi_backend_{uuid.uuid4().hex[:8]}"
-
-        # 创建MQTT客户端实例
-        mqtt_client = mqtt.Client(client_id=random_client_id)
-
-        startup_msg = f"[MQTT] 使用客户端ID: {random_client_id}"
+        cursor.executemany(insert_sql, [values for _, values in rows])
+        inserted = [machine_name for machine_name, _ in rows]
+    except pymysql.err.OperationalError:
+        # 连接问题, 逐行重试也会失败, 交给上层回滚
+        raise
+    except Exception as e:
+        warn_msg = f"[数据处理] 批量插入{len(rows)}台设备失败, 改为逐条插入: {str(e)}"
         with mqtt_lock:
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "level": "信息",
-                "message": startup_msg
+                "level": "警告",
+                "message": warn_msg
             })
+        inserted = []
+        for machine_name, values in rows:
+            try:
+                cursor.execute(insert_sql, values)
+                inserted.append(machine_name)
+            except Exception as e:
+                error_msg = f"[数据处理] 设备{machine_name}数据插入失败: {str(e)}"
+                with mqtt_lock:
+                    mqtt_logs.append({
+                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "level": "错误",
+                        "message": error_msg
+                    })
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    with mqtt_lock:
+        flush_stats["batches"] += 1
+        flush_stats["rows"] += len(inserted)
+        flush_stats["last_batch_ms"] = round(elapsed_ms, 1)
+        flush_stats["max_batch_ms"] = max(flush_stats["max_batch_ms"], round(elapsed_ms, 1))
+        mqtt_logs.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": "成功",
+            "message": f"[数据处理] 批量插入设备{', '.join(inserted) or '无'}的数据,"
+                       f"每条{len(fields) - 3}个字段,耗时{elapsed_ms:.1f}ms"
+        })
+    return inserted
+
+
+def mark_disconnected():
+    """开始计算断开时长(已在计时时不重新开始)"""
+    global disconnected_since
+    with mqtt_lock:
+        if disconnected_since is None:
+            disconnected_since = time.monotonic()
+
+
+def connect_failed(error: Exception) -> float:
+    """记录连接失败, 返回下一次重连前的等待时间(秒)"""
+    delay = reconnect_backoff.next()
+    error_msg = f"[MQTT] 连接失败: {str(error)}, {delay:.1f}秒后重试"
+    with mqtt_lock:
+        connection_stats["connect_failures"] += 1
+        mqtt_logs.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": "错误",
+            "message": error_msg
+        })
+    return delay
 
-        # 设置回调函数
-        mqtt_client.on_connect = on_connect
-        mqtt_client.on_disconnect = on_disconnect
-        mqtt_client.on_message = on_message
 
-        # 连接到MQTT Broker
+def create_client() -> mqtt.Client:
+    """
+    按配置创建MQTT客户端
+    - 配置了固定 client_id 时使用该ID, 否则生成随机ID, 避免重复连接冲突
+    - 持久会话(clean_session=False)需要固定的 client_id, 未配置时仍使用 clean session
+    """
+    client_id = MQTT_CONFIG["client_id"]
+    clean_session = MQTT_CONFIG["clean_session"]
+    if not client_id:
+        client_id = f"fastapi_backend_{uuid.uuid4().hex[:8]}"
+        if not clean_session:
+            clean_session = True
+            with mqtt_lock:
+                mqtt_logs.append({
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "level": "警告",
+                    "message": "[MQTT] 持久会话需要配置固定的 client_id, 改用 clean session"
+                })
+
+    client = mqtt.Client(client_id=client_id, clean_session=clean_session)
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = on_message
+
+    startup_msg = f"[MQTT] 使用客户端ID: {client_id}, {'clean session' if clean_session else '持久会话'}"
+    with mqtt_lock:
+        mqtt_logs.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": "信息",
+            "message": startup_msg
+        })
+    return client
+
+
+def connection_loop(client: mqtt.Client):
+    """
+    连接线程(线程模式): 连接 Broker 并运行网络循环
+    启动时 Broker 不可用或运行中断开后, 按带抖动的指数退避重连, 直到 stop_mqtt_client
+    """
+    while not connection_stop.is_set():
         connecting_msg = f"[MQTT] 正在连接到 {MQTT_BROKER}:{MQTT_PORT}..."
         with mqtt_lock:
             mqtt_logs.append({
@@ -499,11 +816,59 @@ def start_mqtt_client():
                 "level": "信息",
                 "message": connecting_msg
             })
+        try:
+            client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
+        except Exception as e:
+            connection_stop.wait(connect_failed(e))
+            continue
+
+        # 网络循环: 收发报文和心跳, 连接断开时返回错误码
+        rc = mqtt.MQTT_ERR_SUCCESS
+        while rc == mqtt.MQTT_ERR_SUCCESS and not connection_stop.is_set():
+            rc = client.loop(timeout=1.0)
+
+        if connection_stop.is_set():
+            break
+        delay = reconnect_backoff.next()
+        retry_msg = f"[MQTT] 连接已断开, {delay:.1f}秒后重新连接"
+        with mqtt_lock:
+            mqtt_logs.append({
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "level": "警告",
+                "message": retry_msg
+            })
+        connection_stop.wait(delay)
 
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
+    # 停止: 发送 DISCONNECT 并等待发送完成
+    if client.socket() is not None:
+        client.disconnect()
+        deadline = time.monotonic() + 2
+        while client.socket() is not None and time.monotonic() < deadline:
+            client.loop(timeout=0.1)
 
-        # 在后台线程中运行MQTT客户端循环
-        mqtt_client.loop_start()
+
+def start_mqtt_client():
+    """启动MQTT客户端, 连接由连接线程负责, Broker 暂不可用时不影响启动"""
+    global mqtt_client, connection_thread
+
+    try:
+        # 成为 leader 后才打开本地文件, 从其中恢复上次的读取位置
+        message_spool.reload()
+
+        # 先启动写入线程和重试线程, 收到的消息由它们写入数据库
+        start_writer_thread()
+        start_retrier_thread()
+
+        # 创建MQTT客户端实例
+        mqtt_client = create_client()
+
+        # 在连接线程中连接和运行MQTT客户端循环
+        mark_disconnected()
+        connection_stop.clear()
+        connection_thread = threading.Thread(
+            target=connection_loop, args=(mqtt_client,), name="mqtt-connection", daemon=True
+        )
+        connection_thread.start()
 
         started_msg = "[MQTT] MQTT客户端已启动"
         with mqtt_lock:
@@ -516,7 +881,6 @@ def start_mqtt_client():
     except Exception as e:
         error_msg = f"[MQTT] 启动失败: {str(e)}"
         with mqtt_lock:
-            mqtt_connected = False
             mqtt_logs.append({
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "level": "错误",
@@ -526,16 +890,19 @@ def start_mqtt_client():
 
 def stop_mqtt_client():
     """停止MQTT客户端"""
-    global mqtt_client, mqtt_connected, merge_timer
+    global mqtt_client, mqtt_connected, connection_thread
 
     if mqtt_client:
         try:
-            # 取消定时器
-            if merge_timer is not None:
-                merge_timer.cancel()
+            # 连接线程断开连接后退出
+            connection_stop.set()
+            if connection_thread is not None:
+                connection_thread.join(10)
+                connection_thread = None
 
-            mqtt_client.loop_stop()
-            mqtt_client.disconnect()
+            # 不再接收新消息后停止写入线程, 剩余消息写入数据库
+            stop_writer_thread()
+            stop_retrier_thread()
 
             stopped_msg = "[MQTT] MQTT客户端已停止"
             with mqtt_lock:
@@ -555,6 +922,44 @@ def stop_mqtt_client():
         finally:
             with mqtt_lock:
                 mqtt_connected = False
+            mqtt_client = None
+
+
+def collect_status() -> dict:
+    """当前进程的MQTT接收状态(/status 的内容), 需要在事件循环中调用"""
+    from .mqtt_async import ingester
+
+    extra = {}
+    if ingester is not None:
+        extra = ingester.status()
+    else:
+        with message_queue_lock:
+            extra["receive"] = dict(receive_stats)
+            extra["buffer"] = {
+                "capacity": BUFFER_MAX_MESSAGES,
+                "overflow_policy": OVERFLOW_POLICY,
+                "buffered": len(message_queue),
+                **buffer_stats,
+            }
+    spool = message_spool.status()
+    with mqtt_lock:
+        connection = dict(connection_stats)
+        connection["current_downtime_s"] = (
+            None if disconnected_since is None else round(time.monotonic() - disconnected_since, 1)
+        )
+        return {
+            "connected": mqtt_connected,
+            "broker": MQTT_BROKER,
+            "port": MQTT_PORT,
+            "topic": MQTT_TOPIC,
+            "qos": MQTT_QOS,
+            "connection": connection,
+            "flush": dict(flush_stats),
+            "spool": {**spool, **spool_stats},
+            "json_backend": json_codec.BACKEND,
+            "mode": "thread" if ingester is None else "asyncio",
+            **extra
+        }
 
 
 @router.get("/status")
@@ -567,16 +972,42 @@ async def get_mqtt_status():
         "connected": true/false,
         "broker": "124.222.161.163",
         "port": 1883,
-        "topic": "WinCC/#"
+        "topic": "WinCC/#",
+        "qos": 0,
+        "connection": {"connects": 2, "reconnects": 1, "connect_failures": 3, "last_downtime_s": 12.5,
+                       "total_downtime_s": 12.5, "current_downtime_s": null},
+        "flush": {"flushes": 3, "batches": 5, "rows": 45, "merged": 0, "last_flush_ms": 85.2, ...},
+        "receive": {"messages": 825, "last_blocked_ms": 0.05, "max_blocked_ms": 0.4},
+        "buffer": {"capacity": 50000, "overflow_policy": "drop_oldest", "buffered": 120,
+                   "enqueued": 825, "dropped": 0, "spilled": 0, "flushed": 705},
+        "spool": {"path": "data/mqtt_spool.jsonl", "pending_messages": 0, "size_bytes": 0,
+                  "replayed": 1650, "replay_failures": 3, "retry_interval": 5},
+        "json_backend": "orjson",
+        "mode": "thread"
     }
+    asyncio 模式下接收和缓冲统计由事件循环中的任务维护, 另外返回 "asyncio" 字段:
+    {"pending": 120, "queued_batches": 0, "queued_messages": 0, "batches": 3,
+     "last_queue_wait_ms": 0.1, "last_ingest_ms": 20150.3, "max_ingest_ms": 20310.8}
+
+    多进程部署时只有 leader 进程接收MQTT消息, 其他进程返回 leader 最近写入的状态,
+    "leader" 字段为 leader 进程的信息:
+    {"pid": 1234, "host": "server", "backend": "file", "since": "2025-01-24 10:30:00",
+     "updated_at": "2025-01-24 10:35:12", "stale": false, "is_leader": false}
+    leader 尚未选出时 "connected" 为 false, "leader" 为 null
     """
-    with mqtt_lock:
-        return {
-            "connected": mqtt_connected,
-            "broker": MQTT_BROKER,
-            "port": MQTT_PORT,
-            "topic": MQTT_TOPIC
-        }
+    from .mqtt_leader import election, follower_state
+
+    state = await asyncio.to_thread(follower_state)
+    if state is not None:
+        if state["status"] is None:
+            return {"connected": False, "broker": MQTT_BROKER, "port": MQTT_PORT, "topic": MQTT_TOPIC,
+                    "leader": None}
+        return {**state["status"], "leader": {**state["leader"], "is_leader": False}}
+
+    status = collect_status()
+    if election is not None:
+        status["leader"] = {**election.info(), "is_leader": True}
+    return status
 
 
 @router.get("/logs")
@@ -597,8 +1028,15 @@ async def get_mqtt_logs():
         "total": 5
     }
     """
-    with mqtt_lock:
-        logs_list = list(mqtt_logs)
+    from .mqtt_leader import follower_state
+
+    # 非 leader 进程返回 leader 写入的日志
+    state = await asyncio.to_thread(follower_state)
+    if state is not None:
+        logs_list = state["logs"]
+    else:
+        with mqtt_lock:
+            logs_list = list(mqtt_logs)
 
     return {
         "logs": logs_list,
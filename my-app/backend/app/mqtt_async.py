@@ -0,0 +1,375 @@
+"""
+asyncio 模式的 MQTT 接收 (MQTT_CONFIG["mode"] = "asyncio")
+
+不启动 paho 的 loop_start() 网络线程, 而是把 socket 注册到 FastAPI 的事件循环上:
+- socket 可读时在事件循环中调用 loop_read(), 消息回调也在事件循环中执行
+- 有数据待发送时注册可写回调调用 loop_write(), 另有任务每秒调用 loop_misc() 处理心跳
+
+收到的消息按与线程模式相同的条件(消息间隔/批次时长/批次大小)组成批次, 通过 asyncio.Queue
+交给写入任务, 写入任务在线程中执行 clean_and_upload_data, 不阻塞事件循环。
+接收和组批只在事件循环中进行, 不需要加锁; 断开连接或连接失败后按与线程模式相同的退避时间重新连接。
+"""
+import asyncio
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+
+from . import mqtt as ingest
+
+BATCH_QUEUE_SIZE = 4  # 等待写入的最大批次数, 写入跟不上时新消息留在当前批次中(受缓冲区上限约束)
+
+
+def _log(level: str, message: str):
+    with ingest.mqtt_lock:
+        ingest.mqtt_logs.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": level,
+            "message": message
+        })
+
+
+def supports_socket_watch(loop: asyncio.AbstractEventLoop) -> bool:
+    """事件循环是否支持 add_reader (ProactorEventLoop 不支持)"""
+    a, b = socket.socketpair()
+    try:
+        loop.add_reader(a, lambda: None)
+        loop.remove_reader(a)
+        return True
+    except NotImplementedError:
+        return False
+    finally:
+        a.close()
+        b.close()
+
+
+class AsyncMQTTIngester:
+    """
+    在事件循环中运行的 MQTT 接收器
+
+    任务:
+    - 连接任务: 连接 Broker, 连接失败或断开后按退避时间重连
+    - 组批任务: 检查触发条件, 把当前批次放入 batch_queue
+    - 写入任务: 从 batch_queue 取出批次, 在线程中清洗和写入数据库
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.client: Optional[mqtt.Client] = None
+        self.connected = False
+
+        self.pending = deque()  # 当前批次 [(topic, payload)]
+        self.batch_started: Optional[float] = None  # 当前批次第一条消息的接收时间(loop.time)
+        self.last_message: Optional[float] = None  # 最后一条消息的接收时间(loop.time)
+        self.batch_queue: asyncio.Queue = asyncio.Queue(maxsize=BATCH_QUEUE_SIZE)
+        self.queued_messages = 0  # batch_queue 中的消息数
+
+        self.wakeup = asyncio.Event()  # 新批次开始或批次已满时唤醒组批任务
+        self.disconnected = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.tasks = []
+        self.misc_task: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "messages": 0,
+            "last_blocked_ms": 0,
+            "max_blocked_ms": 0,
+            "enqueued": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "batches": 0,  # 交给写入任务的批次数
+            "last_queue_wait_ms": None,  # 批次在 batch_queue 中等待写入的时间
+            "last_ingest_ms": None,  # 批次第一条消息从接收到写入完成的时间
+            "max_ingest_ms": 0,
+        }
+
+    # ---------- 把 paho 的 socket 注册到事件循环 ----------
+
+    def _in_loop(self, func, *args):
+        """connect() 在线程池中执行, 期间的 socket 回调转到事件循环中执行"""
+        if threading.get_ident() == self.loop_thread_id:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self._in_loop(self._watch_socket, sock)
+
+    def _watch_socket(self, sock):
+        if sock.fileno() == -1:
+            return
+        self.loop.add_reader(sock, self.client.loop_read)
+        self.misc_task = self.loop.create_task(self._misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        # 连接失败或重连时可能在线程池中关闭 socket, 同样转到事件循环, 并排在 _watch_socket 之后执行
+        self._in_loop(self._unwatch_socket, sock)
+
+    def _unwatch_socket(self, sock):
+        # socket 已关闭(fileno 为 -1)时事件循环仍按 socket 对象找到并移除注册
+        self.loop.remove_reader(sock)
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+            self.misc_task = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self.loop.add_writer, sock, self.client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self):
+        """心跳和超时检查"""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    # ---------- MQTT 回调(在事件循环中执行) ----------
+
+    def on_connect(self, client, userdata, flags, rc):
+        ingest.on_connect(client, userdata, flags, rc)
+        if rc == 0:
+            self.connected = True
+
+    def on_disconnect(self, client, userdata, rc):
+        ingest.on_disconnect(client, userdata, rc)
+        self.connected = False
+        self.disconnected.set()
+
+    def on_message(self, client, userdata, msg):
+        """放入当前批次, 缓冲区满时的处理方式与线程模式相同"""
+        started = time.perf_counter()
+        try:
+            stats = self.stats
+            if len(self.pending) >= ingest.BUFFER_MAX_MESSAGES:
+                if ingest.OVERFLOW_POLICY == "spill":
+                    ingest.message_spool.append([(msg.topic, msg.payload)], sync=False)
+                    stats["spilled"] += 1
+                elif ingest.OVERFLOW_POLICY == "drop_newest":
+                    stats["dropped"] += 1
+                else:
+                    self.pending.popleft()
+                    self.pending.append((msg.topic, msg.payload))
+                    stats["dropped"] += 1
+                    stats["enqueued"] += 1
+            else:
+                self.pending.append((msg.topic, msg.payload))
+                stats["enqueued"] += 1
+
+            self.last_message = self.loop.time()
+            if self.batch_started is None:
+                # 新批次开始, 唤醒组批任务计算触发时间
+                self.batch_started = self.last_message
+                self.wakeup.set()
+            elif len(self.pending) >= ingest.MAX_BATCH_SIZE:
+                self.wakeup.set()
+
+            blocked_ms = round((time.perf_counter() - started) * 1000, 3)
+            stats["messages"] += 1
+            stats["last_blocked_ms"] = blocked_ms
+            if blocked_ms > stats["max_blocked_ms"]:
+                stats["max_blocked_ms"] = blocked_ms
+        except Exception as e:
+            _log("错误", f"[MQTT] 接收消息时出错: {str(e)}")
+
+    # ---------- 任务 ----------
+
+    async def _wait_stopping(self, timeout: float) -> bool:
+        """等待 timeout 秒, 期间收到停止请求时返回 True"""
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _connection_loop(self):
+        """连接 Broker, 连接失败或断开后按带抖动的指数退避重连"""
+        while not self.stopping.is_set():
+            self.disconnected.clear()
+            _log("信息", f"[MQTT] 正在连接到 {ingest.MQTT_BROKER}:{ingest.MQTT_PORT}...")
+            try:
+                # connect() 包含 DNS 解析和 TCP 握手, 在线程池中执行
+                await self.loop.run_in_executor(
+                    None, self.client.connect, ingest.MQTT_BROKER, ingest.MQTT_PORT, ingest.MQTT_KEEPALIVE
+                )
+            except Exception as e:
+                await self._wait_stopping(ingest.connect_failed(e))
+                continue
+
+            await self.disconnected.wait()
+            if self.stopping.is_set():
+                break
+            delay = ingest.reconnect_backoff.next()
+            _log("警告", f"[MQTT] 连接已断开, {delay:.1f}秒后重新连接")
+            await self._wait_stopping(delay)
+
+    def _flush_trigger(self):
+        """与 mqtt.flush_trigger 相同的触发条件, 返回 (触发原因, 距离下一次可能触发的秒数)"""
+        if not self.pending:
+            return None, None
+        now = self.loop.time()
+        if len(self.pending) >= ingest.MAX_BATCH_SIZE:
+            return f"待处理消息达到{ingest.MAX_BATCH_SIZE}条", 0
+        if now - self.last_message >= ingest.MESSAGE_IDLE_THRESHOLD:
+            return f"检测到消息间隔超过{ingest.MESSAGE_IDLE_THRESHOLD}秒", 0
+        if now - self.batch_started >= ingest.MAX_BATCH_AGE:
+            return f"批次等待超过{ingest.MAX_BATCH_AGE}秒", 0
+        return None, min(self.last_message + ingest.MESSAGE_IDLE_THRESHOLD,
+                         self.batch_started + ingest.MAX_BATCH_AGE) - now
+
+    async def _enqueue_batch(self, reason: str):
+        """取出当前批次放入 batch_queue, 写入任务跟不上时在这里等待"""
+        messages = list(self.pending)
+        self.pending.clear()
+        received = self.batch_started
+        self.batch_started = None
+        _log("信息", f"[数据处理] {reason},触发数据清洗和上传")
+        self.queued_messages += len(messages)
+        await self.batch_queue.put((messages, received, self.loop.time()))
+
+    async def _batch_loop(self):
+        """按触发条件组批, 停止时把剩余消息作为最后一批"""
+        while not self.stopping.is_set():
+            reason, delay = self._flush_trigger()
+            if reason is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._enqueue_batch(reason)
+
+        if self.pending:
+            await self._enqueue_batch("MQTT客户端停止")
+        await self.batch_queue.put(None)
+
+    async def _flush_loop(self):
+        """依次写入批次, 数据库操作在线程中执行"""
+        while True:
+            item = await self.batch_queue.get()
+            if item is None:
+                break
+            messages, received, queued = item
+            self.stats["last_queue_wait_ms"] = round((self.loop.time() - queued) * 1000, 1)
+            try:
+                # 数据库错误时这批消息写入本地文件, 由重试线程重新写入
+                await asyncio.to_thread(ingest.clean_and_upload_data, messages)
+            except Exception as e:
+                _log("错误", f"[数据处理] 触发数据清洗和上传时出错: {str(e)}")
+            self.queued_messages -= len(messages)
+
+            ingest_ms = round((self.loop.time() - received) * 1000, 1)
+            self.stats["batches"] += 1
+            self.stats["last_ingest_ms"] = ingest_ms
+            self.stats["max_ingest_ms"] = max(self.stats["max_ingest_ms"], ingest_ms)
+
+    # ---------- 启动和停止 ----------
+
+    def start(self):
+        self.client = ingest.create_client()
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+        ingest.mark_disconnected()
+
+        self.tasks = [
+            self.loop.create_task(self._connection_loop(), name="mqtt-connection"),
+            self.loop.create_task(self._batch_loop(), name="mqtt-batcher"),
+            self.loop.create_task(self._flush_loop(), name="mqtt-flusher"),
+        ]
+
+    async def stop(self, timeout: float = 30):
+        """断开连接, 等待剩余消息写入数据库"""
+        connection_task, batch_task, flush_task = self.tasks
+        self.stopping.set()
+        self.wakeup.set()
+
+        if self.connected:
+            # DISCONNECT 报文由 loop_write 发送, 发送后 paho 关闭 socket 并调用 on_disconnect
+            self.client.disconnect()
+            try:
+                await asyncio.wait_for(self.disconnected.wait(), 2)
+            except asyncio.TimeoutError:
+                pass
+        connection_task.cancel()
+
+        try:
+            await asyncio.wait_for(asyncio.gather(batch_task, flush_task), timeout)
+        except asyncio.TimeoutError:
+            _log("警告", f"[MQTT] 等待剩余消息写入超时, {len(self.pending) + self.queued_messages}条消息未写入")
+        if self.client.socket() is not None:
+            # 未正常断开, 直接关闭 socket
+            self.client.disconnect()
+            self.client.loop_write()
+        self.connected = False
+
+    def status(self) -> dict:
+        """/status 中的接收和缓冲统计(在事件循环中调用, 不需要加锁)"""
+        stats = self.stats
+        with ingest.message_queue_lock:
+            flushed = ingest.buffer_stats["flushed"]
+        return {
+            "receive": {key: stats[key] for key in ("messages", "last_blocked_ms", "max_blocked_ms")},
+            "buffer": {
+                "capacity": ingest.BUFFER_MAX_MESSAGES,
+                "overflow_policy": ingest.OVERFLOW_POLICY,
+                "buffered": len(self.pending) + self.queued_messages,
+                "enqueued": stats["enqueued"],
+                "dropped": stats["dropped"],
+                "spilled": stats["spilled"],
+                "flushed": flushed,
+            },
+            "asyncio": {
+                "pending": len(self.pending),
+                "queued_batches": self.batch_queue.qsize(),
+                "queued_messages": self.queued_messages,
+                **{key: stats[key] for key in ("batches", "last_queue_wait_ms", "last_ingest_ms",
+                                                "max_ingest_ms")},
+            },
+        }
+
+
+ingester: Optional[AsyncMQTTIngester] = None
+
+
+async def start_async_ingester() -> bool:
+    """启动 asyncio 模式的 MQTT 接收, 事件循环不支持时返回 False(由调用方改用线程模式)"""
+    global ingester
+    loop = asyncio.get_running_loop()
+    if not supports_socket_watch(loop):
+        _log("警告", f"[MQTT] 当前事件循环({type(loop).__name__})不支持 add_reader, 改用线程模式")
+        return False
+
+    # 本地文件中的消息仍由重试线程重新写入
+    await asyncio.to_thread(ingest.message_spool.reload)
+    ingest.start_retrier_thread()
+    ingester = AsyncMQTTIngester(loop)
+    ingester.start()
+    _log("成功", "[MQTT] MQTT客户端已启动(asyncio模式)")
+    return True
+
+
+async def stop_async_ingester():
+    """停止 asyncio 模式的 MQTT 接收"""
+    global ingester
+    if ingester is None:
+        return
+    try:
+        await ingester.stop()
+        await asyncio.to_thread(ingest.stop_retrier_thread)
+        _log("信息", "[MQTT] MQTT客户端已停止")
+    except Exception as e:
+        _log("错误", f"[MQTT] 停止MQTT客户端时出错: {str(e)}")
+    finally:
+        ingester = None
+        with ingest.mqtt_lock:
+            ingest.mqtt_connected = False
@@ -0,0 +1,270 @@
+"""
+多进程部署时的 MQTT 接收选主
+
+uvicorn --workers N 会在每个进程中执行 lifespan, 如果每个进程都订阅 MQTT, 每条消息会被写入 N 次。
+每个进程启动后竞争同一把锁, 只有持有锁的进程(leader)启动 MQTT 接收, 其他进程(follower)只处理HTTP请求:
+- file: 对 lock_path 加 flock/msvcrt 文件锁, 进程退出时由操作系统释放
+- mysql: 使用专用连接执行 GET_LOCK, 连接断开时由 MySQL 释放, 可用于多台机器
+
+follower 定期重新尝试加锁, leader 退出后接替; leader 定期检查自己仍持有锁, 锁丢失时停止接收。
+leader 定期把 /status 和 /logs 的内容写入 state_path, follower 的这两个接口从该文件读取。
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Optional
+
+import pymysql
+
+from . import mqtt as ingest
+from .config import DB_CONFIG, MQTT_CONFIG, MQTT_LEADER_CONFIG, backend_path
+from .mqtt_async import start_async_ingester, stop_async_ingester
+
+STATE_PATH = backend_path(MQTT_LEADER_CONFIG["state_path"])
+STATE_INTERVAL = MQTT_LEADER_CONFIG["state_interval"]
+ELECTION_INTERVAL = MQTT_LEADER_CONFIG["election_interval"]
+
+
+def _log(level: str, message: str):
+    with ingest.mqtt_lock:
+        ingest.mqtt_logs.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": level,
+            "message": message
+        })
+
+
+class FileLeaderLock:
+    """文件锁, 只能在同一台机器的进程之间选主"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self) -> bool:
+        """非阻塞加锁, 成功返回 True"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        f = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def held(self) -> bool:
+        return self._file is not None
+
+    def release(self):
+        if self._file is not None:
+            # 关闭文件即释放锁
+            self._file.close()
+            self._file = None
+
+
+class MySQLLeaderLock:
+    """MySQL 咨询锁, 锁属于会话, 使用不放回连接池的专用连接"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._connection = None
+
+    def try_acquire(self) -> bool:
+        connection = pymysql.connect(connect_timeout=10, **DB_CONFIG)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT GET_LOCK(%s, 0)", (self.name,))
+                acquired = cursor.fetchone()[0] == 1
+        except pymysql.Error:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def held(self) -> bool:
+        """确认锁仍属于当前连接(连接断开后锁已被释放, 可能已被其他进程获取)"""
+        if self._connection is None:
+            return False
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.name,))
+                return cursor.fetchone()[0] == 1
+        except pymysql.Error:
+            self.release()
+            return False
+
+    def release(self):
+        if self._connection is not None:
+            try:
+                with self._connection.cursor() as cursor:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (self.name,))
+            except pymysql.Error:
+                pass
+            try:
+                self._connection.close()
+            except pymysql.Error:
+                pass
+            self._connection = None
+
+
+def read_state() -> Optional[dict]:
+    """读取 leader 写入的状态文件, 不存在或不完整时返回 None"""
+    try:
+        with open(STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(state: dict):
+    """先写临时文件再替换, 读取方不会读到写了一半的文件"""
+    directory = os.path.dirname(STATE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{STATE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, STATE_PATH)
+
+
+class MQTTElection:
+    """
+    在 lifespan 中运行的选主任务
+    - 成为 leader 后按 MQTT_CONFIG["mode"] 启动 MQTT 接收
+    - 作为 leader 时每 state_interval 秒检查锁并写入状态文件
+    - 作为 follower 时每 election_interval 秒尝试加锁
+    """
+
+    def __init__(self):
+        if MQTT_LEADER_CONFIG["backend"] == "mysql":
+            self.lock = MySQLLeaderLock(MQTT_LEADER_CONFIG["mysql_lock_name"])
+        else:
+            self.lock = FileLeaderLock(backend_path(MQTT_LEADER_CONFIG["lock_path"]))
+        self.is_leader = False
+        self.leader_since: Optional[str] = None
+        self.async_mqtt = False
+        self.stopping = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def info(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "backend": MQTT_LEADER_CONFIG["backend"],
+            "since": self.leader_since,
+        }
+
+    async def _become_leader(self):
+        self.is_leader = True
+        self.leader_since = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _log("成功", f"[MQTT] 进程 {os.getpid()} 成为 leader, 启动MQTT接收")
+        print(f"[MQTT] 进程 {os.getpid()} 成为 leader, 启动MQTT客户端 ({MQTT_CONFIG['mode']}模式)")
+
+        # asyncio 模式在事件循环中接收MQTT消息, 事件循环不支持时退回线程模式
+        self.async_mqtt = False
+        if MQTT_CONFIG["mode"] == "asyncio":
+            self.async_mqtt = await start_async_ingester()
+        if not self.async_mqtt:
+            ingest.start_mqtt_client()
+
+    async def _stop_ingester(self):
+        if self.async_mqtt:
+            await stop_async_ingester()
+        else:
+            await asyncio.to_thread(ingest.stop_mqtt_client)
+
+    async def _step_down(self):
+        """锁已丢失(如 MySQL 连接断开), 其他进程可能已成为 leader, 停止接收"""
+        _log("警告", f"[MQTT] 进程 {os.getpid()} 已不再持有 leader 锁, 停止MQTT接收")
+        await self._stop_ingester()
+        await asyncio.to_thread(self.lock.release)
+        self.is_leader = False
+        self.leader_since = None
+
+    async def _write_state(self):
+        with ingest.mqtt_lock:
+            logs = list(ingest.mqtt_logs)
+        state = {
+            "leader": {**self.info(), "updated_at": time.time()},
+            "status": ingest.collect_status(),
+            "logs": logs,
+        }
+        await asyncio.to_thread(write_state, state)
+
+    async def run(self):
+        while not self.stopping.is_set():
+            try:
+                if not self.is_leader:
+                    if await asyncio.to_thread(self.lock.try_acquire):
+                        await self._become_leader()
+                elif not await asyncio.to_thread(self.lock.held):
+                    await self._step_down()
+                if self.is_leader:
+                    await self._write_state()
+            except Exception as e:
+                _log("错误", f"[MQTT] 选主出错: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self.stopping.wait(), STATE_INTERVAL if self.is_leader else ELECTION_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        self.stopping.set()
+        if self.task is not None:
+            await self.task
+        if self.is_leader:
+            await self._stop_ingester()
+            try:
+                await self._write_state()
+            except Exception:
+                pass
+            await asyncio.to_thread(self.lock.release)
+            self.is_leader = False
+
+
+election: Optional[MQTTElection] = None
+
+
+async def start_mqtt_ingest():
+    """参与选主, 成为 leader 的进程启动MQTT接收(在 lifespan 启动阶段调用)"""
+    global election
+    election = MQTTElection()
+    election.task = asyncio.get_running_loop().create_task(election.run(), name="mqtt-election")
+
+
+async def stop_mqtt_ingest():
+    """停止选主任务, leader 进程停止MQTT接收并释放锁"""
+    global election
+    if election is None:
+        return
+    await election.stop()
+    election = None
+
+
+def follower_state() -> Optional[dict]:
+    """当前进程不是 leader 时返回 leader 写入的状态, 否则返回 None"""
+    if election is None or election.is_leader:
+        return None
+    state = read_state() or {"leader": None, "status": None, "logs": []}
+    if state["leader"] is not None:
+        updated_at = state["leader"]["updated_at"]
+        state["leader"]["updated_at"] = datetime.fromtimestamp(updated_at).strftime("%Y-%m-%d %H:%M:%S")
+        # 超过3个写入间隔没有更新, leader 可能已退出, 其他进程尚未接替
+        state["leader"]["stale"] = time.time() - updated_at > STATE_INTERVAL * 3
+    return state
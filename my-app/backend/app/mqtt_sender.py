@@ -15,6 +15,7 @@ import os
 # 添加父目录到路径以便导入config
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from config import MQTT_CONFIG
+from mqtt_tags import device_tag  # 与接收端共用同一份标签映射
 
 # MQTT配置
 MQTT_BROKER = MQTT_CONFIG["broker"]
@@ -36,63 +37,6 @@ send_stats = {
 # 设备型号映射 (启动时生成,每个设备一个随机8字符字符串)
 device_models = {}
 
-# 数据库字段到MQTT字段名的映射 (根据mqtt.py中的map_mqtt_to_db_field反向映射)
-DB_TO_MQTT_MAPPING = {
-    'hours': 'SYS_T/CM_H',
-    'total_current': 'ELE_I',
-    'total_voltage': 'ELE_V',
-    'cell_1': 'CELL1',
-    'cell_2': 'CELL2',
-    'cell_3': 'CELL3',
-    'cell_4': 'CELL4',
-    'cell_5': 'CELL5',
-    'cell_6': 'CELL6',
-    'cell_7': 'CELL7',
-    'cell_8': 'CELL8',
-    'cell_9': 'CELL9',
-    'cell_10': 'CELL10',
-    'cell_11': 'CELL11',
-    'cell_12': 'CELL12',
-    'cell_13': 'CELL13',
-    'cell_14': 'CELL14',
-    'cell_15': 'CELL15',
-    'cell_16': 'CELL16',
-    'cell_17': 'CELL17',
-    'cell_18': 'CELL18',
-    'cell_19': 'CELL19',
-    'cell_20': 'CELL20',
-    'cell_21': 'CELL21',
-    'cell_22': 'CELL22',
-    'cell_23': 'CELL23',
-    'cell_24': 'CELL24',
-    'cell_25': 'CELL25',
-    'max_voltage': 'cell_max',
-    'min_voltage': 'cell_min',
-    'avg_voltage': 'cell_ave',
-    'voltage_range': 'cell_range',
-    'pump_pressure': 'PUMP_P',
-    'pump_opening': 'LCP_OUT',
-    'fan_opening': 'FAN_OUT',
-    'specific_gravity': 'DT118',
-    'inlet_pressure': 'PT102',
-    'liquid_level': 'LIT109',
-    'oxygen_outlet_pressure': 'PT104',
-    'hydrogen_outlet_pressure': 'PT105',
-    'oxygen_outlet_temp': 'TT103',
-    'alkali_inlet_temp': 'TT101',
-    'hydrogen_outlet_temp': 'TT106',
-    'hydrogen_gas_temp': 'TT114',
-    'hydrogen_flow_meter': 'FIT109',
-    'oxygen_in_hydrogen': 'AT132',
-    'hydrogen_in_oxygen': 'AT131',
-    'current_power': '当前能耗',
-    'pressure_diff': 'ELE_PDT',
-    'sep_pressure_diff': 'SEP_PDT',
-    'std_deviation': '标准差',
-    'machine_model': '_Type',  # 设备型号字段
-}
-
-
 
 def generate_random_string(length=8):
     """
@@ -259,22 +203,14 @@ def generate_device_data(device_num):
     ]
     
     for db_field, data_type in fields:
-        # 获取MQTT字段名
-        mqtt_field = DB_TO_MQTT_MAPPING.get(db_field)
-        if not mqtt_field:
+        # 获取MQTT字段名 (machine_model 为 设备编号_Type, 其他字段1号设备不加后缀, 2号设备加_1, 以此类推)
+        mqtt_name = device_tag(db_field, device_num)
+        if not mqtt_name:
             continue
         
-        # 特殊处理 machine_model 字段 (格式: 设备编号_Type)
         if db_field == 'machine_model':
-            mqtt_name = f"{device_num}_Type"
             value = device_models.get(device_num, generate_random_string(8))
         else:
-            # 添加设备编号后缀 (1号设备不加后缀, 2号设备加_1, 3号设备加_2, 以此类推)
-            if device_num == 1:
-                mqtt_name = mqtt_field
-            else:
-                mqtt_name = f"{mqtt_field}_{device_num - 1}"
-            
             # 生成随机值
             value = generate_random_value(db_field, data_type)
         
@@ -0,0 +1,154 @@
+"""
+MQTT消息本地文件(溢出和写入失败的消息)
+只追加写入的 JSON lines 文件, 每行一条消息 [batch, topic, payload] (payload 以字符串保存):
+- batch 为写入失败批次的编号, 同一批次的消息必须一起处理
+  (清洗时同一设备的字段会合并为一行, 拆开或与其他批次合并都会改变写入结果)
+- batch 为 null 表示缓冲区溢出的消息, 连续的溢出消息可以合并处理
+读取位置保存在同目录的 .offset 文件中, 进程重启后从上次的位置继续读取,
+所有消息都处理完后清空文件
+
+多进程部署时文件由 MQTT leader 独占: 创建 MessageSpool 时不打开文件,
+成为 leader 启动接收时才调用 reload() 恢复读取位置, follower 进程不读写该文件
+"""
+import json
+import os
+import threading
+from typing import List, Optional, Tuple
+
+
+class MessageSpool:
+    """
+    线程安全的追加写入消息文件
+    - append: 追加一批消息并刷新到磁盘
+    - read: 从当前读取位置读取若干条消息(不移动读取位置)
+    - commit: 消息处理完成后移动读取位置
+    - reload: 开始使用前(成为 leader 后)从文件恢复读取位置
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._pending = 0
+
+    def reload(self):
+        """
+        丢弃内存中的读取位置, 从 .offset 文件和消息文件重新恢复
+        会截断文件末尾的不完整行, 只能在持有 leader 锁、没有其他进程写入时调用
+        """
+        with self._lock:
+            self._offset = 0
+            self._pending = 0
+            self._load()
+
+    def _load(self):
+        """恢复读取位置并统计未处理的消息数"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.offset_path, "r") as f:
+                self._offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            self._offset = 0
+        if self._offset > os.path.getsize(self.path):
+            self._offset = 0
+        with open(self.path, "rb+") as f:
+            f.seek(self._offset)
+            complete = self._offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                complete += len(line)
+                self._pending += 1
+            # 去掉进程退出时写入中断的不完整行
+            f.truncate(complete)
+
+    def _save_offset(self):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(self._offset))
+        os.replace(tmp_path, self.offset_path)
+
+    def append(self, messages: List[Tuple[str, str]], batch: Optional[str] = None, sync: bool = True):
+        """
+        追加消息
+        - batch: 批次编号, 同一批次的消息读取时不会被拆开; None 表示溢出的消息
+        - sync: 为 True 时返回前 fsync 到磁盘; 在 MQTT 接收回调中写入时使用 False,
+          只写入系统缓存, 避免阻塞网络线程
+        """
+        if not messages:
+            return
+        data = "".join(
+            json.dumps([batch, topic, payload.decode("utf-8", "replace") if isinstance(payload, bytes) else payload],
+                       ensure_ascii=False) + "\n"
+            for topic, payload in messages
+        ).encode("utf-8")
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as f:
+                f.write(data)
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            self._pending += len(messages)
+
+    def read(self, max_messages: int) -> Tuple[List[Tuple[str, str]], int, int]:
+        """
+        从读取位置开始读取一批消息
+        - 写入失败的批次: 读取该批次的全部消息(不受 max_messages 限制)
+        - 溢出的消息: 最多读取 max_messages 条连续的溢出消息
+
+        返回: (消息列表, 读取结束位置, 读取的行数), 行数包括无法解析而跳过的行
+        """
+        messages = []
+        lines = 0
+        with self._lock:
+            if self._pending == 0:
+                return messages, self._offset, 0
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                end_offset = self._offset
+                first_batch = None
+                while True:
+                    line = f.readline()
+                    if not line:
+                        break
+                    try:
+                        batch, topic, payload = json.loads(line)
+                    except (ValueError, TypeError):
+                        # 无法解析的行直接跳过
+                        lines += 1
+                        end_offset = f.tell()
+                        continue
+                    if messages and (batch != first_batch or (batch is None and len(messages) >= max_messages)):
+                        break
+                    first_batch = batch
+                    messages.append((topic, payload))
+                    lines += 1
+                    end_offset = f.tell()
+        return messages, end_offset, lines
+
+    def commit(self, end_offset: int, lines: int):
+        """read 返回的消息已处理完成, 移动读取位置; 全部处理完时清空文件"""
+        with self._lock:
+            self._offset = end_offset
+            self._pending = max(0, self._pending - lines)
+            if self._pending == 0 and os.path.getsize(self.path) <= self._offset:
+                open(self.path, "wb").close()
+                self._offset = 0
+            self._save_offset()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def status(self) -> dict:
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            return {
+                "path": self.path,
+                "pending_messages": self._pending,
+                "size_bytes": size - self._offset,
+            }
@@ -0,0 +1,169 @@
+"""
+MQTT标签名 -> (设备编号, 数据库字段) 查找表
+
+WinCC 标签名的规则: 1号设备使用基础标签名(如 CELL3), 2-15号设备在后面加 _设备编号-1
+(如 CELL3_7 为8号设备), 设备型号为 设备编号_Type(如 3_Type)。
+所有合法标签在导入时预先生成, 清洗数据时每条消息只需查一次字典;
+不在表中的标签按原规则解析一次后缓存
+"""
+from typing import Dict, Optional, Tuple
+
+NUM_DEVICES = 15  # 设备数量
+
+# 基础标签名 -> 数据库字段 (基于mqtt说明.md)
+TAG_FIELDS = {
+    'SYS_T/CM_H': 'hours',
+    'ELE_I': 'total_current',
+    'ELE_V': 'total_voltage',
+    'CELL1': 'cell_1',
+    'CELL2': 'cell_2',
+    'CELL3': 'cell_3',
+    'CELL4': 'cell_4',
+    'CELL5': 'cell_5',
+    'CELL6': 'cell_6',
+    'CELL7': 'cell_7',
+    'CELL8': 'cell_8',
+    'CELL9': 'cell_9',
+    'CELL10': 'cell_10',
+    'CELL11': 'cell_11',
+    'CELL12': 'cell_12',
+    'CELL13': 'cell_13',
+    'CELL14': 'cell_14',
+    'CELL15': 'cell_15',
+    'CELL16': 'cell_16',
+    'CELL17': 'cell_17',
+    'CELL18': 'cell_18',
+    'CELL19': 'cell_19',
+    'CELL20': 'cell_20',
+    'CELL21': 'cell_21',
+    'CELL22': 'cell_22',
+    'CELL23': 'cell_23',
+    'CELL24': 'cell_24',
+    'CELL25': 'cell_25',
+    'cell_max': 'max_voltage',
+    'cell_min': 'min_voltage',
+    'cell_ave': 'avg_voltage',
+    'cell_range': 'voltage_range',
+    'PUMP_P': 'pump_pressure',
+    'LCP_OUT': 'pump_opening',
+    'FAN_OUT': 'fan_opening',
+    'DT118': 'specific_gravity',
+    'PT102': 'inlet_pressure',
+    'LIT109': 'liquid_level',
+    'PT104': 'oxygen_outlet_pressure',
+    'PT105': 'hydrogen_outlet_pressure',
+    'TT103': 'oxygen_outlet_temp',
+    'TT101': 'alkali_inlet_temp',
+    'TT106': 'hydrogen_outlet_temp',
+    'TT114': 'hydrogen_gas_temp',
+    'FIT109': 'alkali_flow_meter',
+    'AT132': 'oxygen_in_hydrogen',
+    'AT131': 'hydrogen_in_oxygen',
+    '当前能耗': 'current_power',
+    'ELE_PDT': 'pressure_diff',
+    'SEP_PDT': 'sep_pressure_diff',
+    '标准差': 'std_deviation',
+    '当前产氢量': 'hydrogen_flow_meter'
+}
+
+# 数据库字段 -> 基础标签名, 供模拟数据发送工具使用
+FIELD_TAGS = {field: tag for tag, field in TAG_FIELDS.items()}
+
+MAX_UNKNOWN_TAGS = 10000  # 未知标签缓存上限, 避免异常标签名无限增长
+
+
+def extract_machine_name(mqtt_name: str) -> str:
+    """
+    从MQTT字段名中提取设备编号
+    例如: SYS_T/CM_H -> 1, SYS_T/CM_H_1 -> 2, SYS_T/CM_H_2 -> 3, ... SYS_T/CM_H_14 -> 15
+         CELL1 -> 1, CELL1_1 -> 2, CELL1_2 -> 3, ... CELL1_14 -> 15
+         1_Type -> 1, 2_Type -> 2, ... 15_Type -> 15
+    """
+    # 检查是否是 数字_Type 格式
+    if '_Type' in mqtt_name:
+        parts = mqtt_name.split('_Type')
+        if parts[0].isdigit():
+            return parts[0]
+
+    # 查找最后一个下划线后的数字
+    parts = mqtt_name.split('_')
+
+    # 从后往前查找,找到第一个纯数字部分
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i].isdigit():
+            device_suffix = int(parts[i])
+            # 后缀从1开始对应设备2, 后缀14对应设备15
+            return str(device_suffix + 1)
+
+    # 没有数字后缀的是设备1
+    return '1'
+
+
+def map_mqtt_to_db_field(mqtt_name: str, machine_name: str) -> str:
+    """
+    将MQTT字段名映射到数据库字段名
+
+    参数:
+    - mqtt_name: MQTT字段名 (如: SYS_T/CM_H, SYS_T/CM_H_1, CELL1, CELL1_2)
+    - machine_name: 设备编号 (如: '1', '2', ...)
+
+    返回:
+    - 数据库字段名
+    """
+    base_name = mqtt_name
+
+    # 检查是否是 数字_Type 格式 (映射到 machine_model)
+    if '_Type' in base_name:
+        return 'machine_model'
+
+    # 去掉设备编号后缀,获取基础字段名
+    if machine_name != '1':
+        # 移除 _数字 后缀
+        suffix = f"_{int(machine_name) - 1}"
+        if base_name.endswith(suffix):
+            base_name = base_name[:-len(suffix)]
+
+    return TAG_FIELDS.get(base_name, None)
+
+
+def device_tag(field: str, device_num: int) -> Optional[str]:
+    """
+    根据数据库字段和设备编号生成标签名, 字段没有对应标签时返回 None
+    例如: ('cell_3', 1) -> CELL3, ('cell_3', 8) -> CELL3_7, ('machine_model', 3) -> 3_Type
+    """
+    if field == 'machine_model':
+        return f"{device_num}_Type"
+    tag = FIELD_TAGS.get(field)
+    if tag is None:
+        return None
+    return tag if device_num == 1 else f"{tag}_{device_num - 1}"
+
+
+def _build_tag_table() -> Dict[str, Tuple[str, str]]:
+    """生成所有设备所有合法标签的查找表"""
+    table = {}
+    for device_num in range(1, NUM_DEVICES + 1):
+        for field in ['machine_model', *TAG_FIELDS.values()]:
+            table[device_tag(field, device_num)] = (str(device_num), field)
+    return table
+
+
+TAG_TABLE = _build_tag_table()
+_unknown_tags: Dict[str, Tuple[str, Optional[str]]] = {}  # 不在查找表中的标签的解析结果
+
+
+def lookup_tag(mqtt_name: str) -> Tuple[str, Optional[str]]:
+    """
+    查找标签对应的 (设备编号, 数据库字段)
+    不在查找表中的标签按原规则解析(字段为 None 表示无法映射), 结果缓存
+    """
+    result = TAG_TABLE.get(mqtt_name)
+    if result is not None:
+        return result
+    result = _unknown_tags.get(mqtt_name)
+    if result is None:
+        machine_name = extract_machine_name(mqtt_name)
+        result = (machine_name, map_mqtt_to_db_field(mqtt_name, machine_name))
+        if len(_unknown_tags) < MAX_UNKNOWN_TAGS:
+            _unknown_tags[mqtt_name] = result
+    return result
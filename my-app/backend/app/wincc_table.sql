@@ -81,6 +81,9 @@ CREATE TABLE wincc
 
     PRIMARY KEY (`id`),
     KEY `idx_machine_name` (`machine_name`, `machine_model`),
-    KEY `idx_date_time` (`date`, `time`)
+    KEY `idx_date_time` (`date`, `time`),
+    -- 按设备+时间范围查询/排序(首页总览、分页查询、设备最新记录), MQTT 写入按它合并同一时间的数据;
+    -- 已有的表执行 python -m app.migrate 添加
+    UNIQUE KEY `uniq_machine_date_time` (`machine_name`, `date`, `time`)
 ) ENGINE = InnoDB;
 
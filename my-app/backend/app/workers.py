@@ -0,0 +1,124 @@
+"""
+阻塞任务工作池
+pymysql 查询和 pandas 计算都是同步阻塞的, 在 async 接口中直接执行会卡住整个事件循环,
+这里把它们放到有界线程池中执行, 并按接口类型分为两个通道分别限制并发:
+- heavy: 图表分析、数据导出等耗时计算
+- light: 设备列表、分页查询、数据修改等简单操作
+等待队列已满或等待超时时返回503, 而不是让所有请求排队阻塞
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from .config import EXPORT_CONFIG, EXPORT_JOB_CONFIG, WORKER_CONFIG
+
+
+class WorkerLane:
+    """
+    有界工作通道
+    - max_workers: 同时执行的任务数(线程数)
+    - max_pending: 最多允许排队等待的请求数, 超过直接返回503
+    - wait_timeout: 排队等待的最长时间(秒), 超时返回503
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, wait_timeout: float):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"worker-{name}")
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiting = 0
+        self.stats = {
+            "completed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+        }
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop, future):
+        """线程任务结束后才释放名额(即使请求已被取消), 避免线程池超额排队"""
+        with self._lock:
+            self._running -= 1
+            self.stats["completed"] += 1
+        try:
+            loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    async def run(self, func, *args, **kwargs):
+        """在本通道的线程池中执行 func(*args, **kwargs) 并等待结果"""
+        if not self._semaphore.locked():
+            # 有空闲名额, 立即获取
+            await self._semaphore.acquire()
+        else:
+            with self._lock:
+                if self._waiting >= self.max_pending:
+                    self.stats["rejected"] += 1
+                    raise HTTPException(status_code=503, detail="服务器繁忙, 请稍后重试")
+                self._waiting += 1
+
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                raise HTTPException(status_code=503, detail="服务器繁忙, 请求排队超时")
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._running += 1
+        future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        future.add_done_callback(functools.partial(self._on_done, loop))
+        return await asyncio.wrap_future(future)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": self._running,
+                "waiting": self._waiting,
+                **self.stats,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+heavy_lane = WorkerLane("heavy", **WORKER_CONFIG["heavy"])
+light_lane = WorkerLane("light", **WORKER_CONFIG["light"])
+
+# 分区导出的查询线程池(见 export_partitions.py), 所有导出共享,
+# 同时执行的分区查询(即占用的连接数)不超过 parallel_partitions
+export_executor = ThreadPoolExecutor(max_workers=max(1, EXPORT_CONFIG["parallel_partitions"]),
+                                     thread_name_prefix="worker-export")
+
+# 后台导出任务(见 export_jobs.py)的执行线程池
+export_job_executor = ThreadPoolExecutor(max_workers=EXPORT_JOB_CONFIG["max_running"],
+                                         thread_name_prefix="worker-export-job")
+
+
+async def run_heavy(func, *args, **kwargs):
+    """在 heavy 通道执行耗时计算(图表分析、导出等)"""
+    return await heavy_lane.run(func, *args, **kwargs)
+
+
+async def run_light(func, *args, **kwargs):
+    """在 light 通道执行简单查询或更新"""
+    return await light_lane.run(func, *args, **kwargs)
+
+
+def shutdown_workers():
+    """关闭所有工作通道"""
+    heavy_lane.shutdown()
+    light_lane.shutdown()
+    export_executor.shutdown(wait=False, cancel_futures=True)
+    export_job_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,92 @@
+"""analysis 模块: cell 有效性筛选与连续时间映射"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analysis import (CELL_FIELDS, GAP_FILL_MINUTES, NS_PER_MINUTE, compress_time_gaps, runtime_hours,
+                          select_valid_cells)
+from app.bench_analysis import batched_valid_cells, current_analysis, generate_frame, legacy_analysis
+
+
+def frame(minutes, cells: dict) -> pd.DataFrame:
+    """按分钟偏移生成数据, cells 为 {cell字段: 值列表}, 未给出的 cell 全部为0"""
+    datetimes = pd.Timestamp("2024-01-01") + pd.to_timedelta(minutes, unit="min")
+    df = pd.DataFrame({"id": np.arange(1, len(minutes) + 1), "datetime": datetimes})
+    for field in CELL_FIELDS:
+        df[field] = cells.get(field, [0] * len(minutes))
+    return df
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_select_valid_cells_matches_legacy(seed):
+    # 与原来逐个 cell 的 pandas 流程逐位一致(有效 cell、全局起始时间、每小时均值和 id 列表)
+    df = generate_frame(20000, seed)
+    assert current_analysis(df) == legacy_analysis(df)
+    assert batched_valid_cells(df) == legacy_analysis(df)[:2]
+
+
+def test_select_valid_cells_start_time_and_rows():
+    minutes = list(range(0, 300, 10))
+    df = frame(minutes, {
+        "cell_1": [1700] * 30,
+        "cell_2": [1600] * 6 + [1700] * 24,  # 第60分钟才超过1680
+        "cell_3": [1700] * 10 + [1500] + [1700] * 19,  # 中间一行低于1680
+    })
+    valid_cells, global_start_time, row_mask, cell_values, _ = select_valid_cells(df)
+
+    assert valid_cells == ["cell_1", "cell_2", "cell_3"]
+    assert global_start_time == pd.Timestamp("2024-01-01 01:00")
+    assert cell_values.shape == (30, 3)
+    expected = np.ones(30, dtype=bool)
+    expected[:6] = False
+    expected[10] = False
+    np.testing.assert_array_equal(row_mask, expected)
+
+
+def test_select_valid_cells_excludes_mostly_zero_cell():
+    # cell_2 在10个小时中只有第1个小时有值, 均值为0的小时占比 0.9 > 0.8
+    minutes = list(range(0, 600, 10))
+    df = frame(minutes, {"cell_1": [1700] * 60, "cell_2": [1700] * 6 + [0] * 54})
+    valid_cells, global_start_time, row_mask, _, _ = select_valid_cells(df)
+
+    assert valid_cells == ["cell_1"]
+    assert global_start_time == pd.Timestamp("2024-01-01")
+    assert row_mask.all()
+
+
+def test_select_valid_cells_without_valid_cell():
+    df = frame([0, 10, 20], {"cell_1": [1500, None, "x"]})
+    valid_cells, global_start_time, row_mask, cell_values, _ = select_valid_cells(df)
+
+    assert valid_cells == []
+    assert global_start_time is None
+    assert not row_mask.any()
+    assert cell_values.shape == (3, 0)
+
+
+def test_compress_time_gaps():
+    datetimes = pd.Timestamp("2024-01-01") + pd.to_timedelta([0, 10, 70, 200, 205], unit="min")
+    # 60分钟的间隔保持原值, 130分钟的间隔替换为10分钟
+    np.testing.assert_array_equal(compress_time_gaps(datetimes), np.array([0, 10, 70, 80, 85]) * NS_PER_MINUTE)
+    np.testing.assert_array_equal(compress_time_gaps(datetimes, gap_fill_minutes=0),
+                                  np.array([0, 10, 70, 70, 75]) * NS_PER_MINUTE)
+    assert compress_time_gaps([]).dtype == np.int64
+    assert len(compress_time_gaps([])) == 0
+
+
+def test_compress_time_gaps_matches_loop():
+    rng = np.random.default_rng(0)
+    steps = rng.choice([10, 30, 60, 61, 600], 1000) * NS_PER_MINUTE + rng.integers(0, 60, 1000) * 10 ** 9
+    times = np.cumsum(steps).astype("datetime64[ns]")
+
+    expected = [0]
+    for previous, current in zip(times[:-1], times[1:]):
+        diff = int((current - previous).astype(np.int64))
+        expected.append(expected[-1] + (diff if diff <= 60 * NS_PER_MINUTE else GAP_FILL_MINUTES * NS_PER_MINUTE))
+    np.testing.assert_array_equal(compress_time_gaps(times), expected)
+
+
+def test_runtime_hours():
+    datetimes = pd.Timestamp("2024-01-01") + pd.to_timedelta([0, 60, 120, 300, 330], unit="min")
+    assert runtime_hours(datetimes) == (2.5, 0.5)
+    assert runtime_hours([]) == (0.0, 0.0)
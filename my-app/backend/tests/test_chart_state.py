@@ -0,0 +1,92 @@
+"""DeviceChartState: 分批累加与全量构建的结果一致"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.analysis import CELL_FIELDS
+from app.chart_state import DeviceChartState
+
+METRIC_FIELDS = ["avg_voltage", "pump_pressure", "pressure_diff"]
+
+
+def generate_rows(count: int, seed: int) -> pd.DataFrame:
+    """生成按时间升序的设备数据(date + timedelta 类型的 time), 含停机间隔、空值和晚启用的 cell"""
+    rng = np.random.default_rng(seed)
+    steps = np.where(rng.random(count) < 0.05, rng.choice([61, 90, 600], count), rng.choice([7, 10, 13], count))
+    datetimes = pd.Timestamp("2025-01-01 00:03") + pd.to_timedelta(np.cumsum(steps), unit="min")
+    df = pd.DataFrame({
+        "id": np.arange(1, count + 1),
+        "date": datetimes.normalize(),
+        "time": datetimes - datetimes.normalize(),
+    })
+    values = rng.integers(1700, 2100, (count, len(CELL_FIELDS))).astype(float)
+    values[:, :2] = 0  # 始终为0的 cell
+    values[: count // 4, 2] = 1500  # 前1/4的数据中低于阈值的 cell
+    values[rng.random(values.shape) < 0.01] = np.nan
+    values[rng.random(count) < 0.01, 5] = 1650
+    for i, field in enumerate(CELL_FIELDS):
+        df[field] = values[:, i]
+    for field in METRIC_FIELDS:
+        metric = np.round(rng.uniform(0, 100, count), 4)
+        metric[rng.random(count) < 0.03] = np.nan
+        df[field] = metric
+    return df
+
+
+def fold_in_batches(df: pd.DataFrame, seed: int) -> DeviceChartState:
+    """随机分批累加, fold 返回 False 时与接口一样用已读取的全部数据重建"""
+    rng = np.random.default_rng(seed)
+    state = DeviceChartState("1#", "X", METRIC_FIELDS)
+    start = 0
+    while start < len(df):
+        end = min(len(df), start + int(rng.integers(1, 300)))
+        if not state.fold(df.iloc[start:end].copy()):
+            state = DeviceChartState.build("1#", "X", df.iloc[:end].copy(), METRIC_FIELDS)
+        start = end
+    return state
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fold_matches_build(seed):
+    df = generate_rows(3000, seed)
+    full = DeviceChartState.build("1#", "X", df.copy(), METRIC_FIELDS)
+    folded = fold_in_batches(df, seed)
+
+    assert folded.valid_cells == full.valid_cells
+    assert folded.global_start_time == full.global_start_time
+    assert folded.watermark_id == full.watermark_id == 3000
+    assert folded.series() == full.series()
+    # 增量结果与全量结果的对应部分相同
+    since = int(full.x[-1]) - 5
+    voltage, _ = folded.series(since)
+    assert voltage["cell_4"]["x"] == [x for x in full.series()[0]["cell_4"]["x"] if x >= since]
+
+
+def test_fold_rejects_rows_not_after_watermark():
+    df = generate_rows(200, 0)
+    state = DeviceChartState.build("1#", "X", df.iloc[:100].copy(), METRIC_FIELDS)
+    assert state.fold(df.iloc[50:150].copy()) is False
+    assert state.watermark_id == 100
+
+
+def test_fold_restores_state_on_error(monkeypatch):
+    df = generate_rows(600, 0)
+    state = DeviceChartState.build("1#", "X", df.iloc[:300].copy(), METRIC_FIELDS)
+    before = state.series()
+    stats_before = {key: value.copy() for key, value in state.cell_stats.items()}
+
+    def fail(*args):
+        raise RuntimeError("aggregate failed")
+
+    monkeypatch.setattr(state, "_aggregate", fail)
+    with pytest.raises(RuntimeError):
+        state.fold(df.iloc[300:].copy())
+    assert state.watermark_id == 300
+    assert state.series() == before
+    for key, value in stats_before.items():
+        np.testing.assert_array_equal(state.cell_stats[key], value)
+
+    # 失败后重新累加相同的行, 结果与全量构建一致
+    monkeypatch.undo()
+    assert state.fold(df.iloc[300:].copy())
+    assert state.series() == DeviceChartState.build("1#", "X", df.copy(), METRIC_FIELDS).series()
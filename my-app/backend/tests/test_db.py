@@ -0,0 +1,62 @@
+"""datetime_range_conditions 与原来的 CONCAT(date, ' ', time) 比较等价"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db import datetime_range_conditions
+
+BOUNDS = [
+    datetime(2024, 1, 2, 0, 0, 0),
+    datetime(2024, 1, 2, 10, 30, 0),
+    datetime(2024, 1, 3, 23, 59, 59),
+]
+
+
+@pytest.fixture(scope="module")
+def connection():
+    """sqlite 中的 wincc 表, 每 17 分钟 13 秒一行, 覆盖边界日期的前后"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE wincc (id INTEGER, date TEXT, time TEXT)")
+    moment = datetime(2024, 1, 1, 22, 0, 0)
+    rows = []
+    for i in range(400):
+        rows.append((i, moment.strftime("%Y-%m-%d"), moment.strftime("%H:%M:%S")))
+        moment += timedelta(minutes=17, seconds=13)
+    # 恰好落在边界上的行
+    rows += [(1000 + i, bound.strftime("%Y-%m-%d"), bound.strftime("%H:%M:%S")) for i, bound in enumerate(BOUNDS)]
+    connection.executemany("INSERT INTO wincc VALUES (?, ?, ?)", rows)
+    yield connection
+    connection.close()
+
+
+def select_ids(connection, conditions, params):
+    where = " AND ".join(conditions) or "1"
+    sql = f"SELECT t1.id FROM wincc t1 WHERE {where} ORDER BY t1.id".replace("%s", "?")
+    return [row[0] for row in connection.execute(sql, [str(param) for param in params])]
+
+
+@pytest.mark.parametrize("start", [None] + BOUNDS)
+@pytest.mark.parametrize("end", [None] + BOUNDS)
+def test_matches_concat(connection, start, end):
+    concat = []
+    concat_params = []
+    if start is not None:
+        concat.append("t1.date || ' ' || t1.time >= %s")
+        concat_params.append(start.strftime("%Y-%m-%d %H:%M:%S"))
+    if end is not None:
+        concat.append("t1.date || ' ' || t1.time <= %s")
+        concat_params.append(end.strftime("%Y-%m-%d %H:%M:%S"))
+
+    conditions, params = datetime_range_conditions(start, end, alias="t1")
+    assert select_ids(connection, conditions, params) == select_ids(connection, concat, concat_params)
+
+
+def test_alias_and_empty_range():
+    assert datetime_range_conditions() == ([], [])
+    conditions, params = datetime_range_conditions(start=BOUNDS[1])
+    assert conditions == ["date >= %s AND (date > %s OR time >= %s)"]
+    assert params == [BOUNDS[1].date(), BOUNDS[1].date(), "10:30:00"]
+    assert datetime_range_conditions(end=BOUNDS[1], alias="t1")[0] == [
+        "t1.date <= %s AND (t1.date < %s OR t1.time <= %s)"
+    ]
@@ -0,0 +1,99 @@
+"""MessageSpool: 读取位置、不完整行和提交"""
+import os
+
+from app.mqtt_spool import MessageSpool
+
+
+def new_spool(tmp_path) -> MessageSpool:
+    spool = MessageSpool(str(tmp_path / "spool" / "messages.jsonl"))
+    spool.reload()
+    return spool
+
+
+def test_read_keeps_batches_together(tmp_path):
+    spool = new_spool(tmp_path)
+    spool.append([("t", "a"), ("t", b"b")])
+    spool.append([("t", "c"), ("t", "d"), ("t", "e")], batch="b1")
+    spool.append([("t", "f")])
+    assert spool.pending == 6
+
+    # 溢出的消息最多读取 max_messages 条, 不与后面的批次合并
+    messages, end_offset, lines = spool.read(10)
+    assert messages == [("t", "a"), ("t", "b")]
+    # read 不移动读取位置
+    assert spool.read(10)[0] == messages
+    spool.commit(end_offset, lines)
+
+    # 写入失败的批次整批读取, 不受 max_messages 限制
+    messages, end_offset, lines = spool.read(1)
+    assert messages == [("t", "c"), ("t", "d"), ("t", "e")]
+    spool.commit(end_offset, lines)
+    assert spool.pending == 1
+
+    messages, end_offset, lines = spool.read(1)
+    assert messages == [("t", "f")]
+    spool.commit(end_offset, lines)
+
+    # 全部处理完后清空文件
+    assert spool.pending == 0
+    assert os.path.getsize(spool.path) == 0
+    assert spool.read(10) == ([], 0, 0)
+
+
+def test_overflow_messages_limited_by_max_messages(tmp_path):
+    spool = new_spool(tmp_path)
+    spool.append([("t", str(i)) for i in range(5)])
+    messages, end_offset, lines = spool.read(3)
+    assert [payload for _, payload in messages] == ["0", "1", "2"]
+    spool.commit(end_offset, lines)
+    assert [payload for _, payload in spool.read(3)[0]] == ["3", "4"]
+
+
+def test_reload_resumes_from_saved_offset(tmp_path):
+    spool = new_spool(tmp_path)
+    spool.append([("t", "a")], batch="b1")
+    spool.append([("t", "b")], batch="b2")
+    _, end_offset, lines = spool.read(10)
+    spool.commit(end_offset, lines)
+
+    # 进程重启: 从 .offset 文件恢复读取位置
+    restarted = new_spool(tmp_path)
+    assert restarted.pending == 1
+    assert restarted.read(10)[0] == [("t", "b")]
+
+
+def test_reload_truncates_partial_line(tmp_path):
+    spool = new_spool(tmp_path)
+    spool.append([("t", "a"), ("t", "b")])
+    size = os.path.getsize(spool.path)
+    with open(spool.path, "ab") as f:
+        f.write(b'[null, "t", "c')  # 写入中断的行
+
+    restarted = new_spool(tmp_path)
+    assert restarted.pending == 2
+    assert os.path.getsize(restarted.path) == size
+    assert restarted.read(10)[0] == [("t", "a"), ("t", "b")]
+
+    # 之后追加的消息从完整行之后开始
+    restarted.append([("t", "d")])
+    messages, end_offset, lines = restarted.read(10)
+    assert messages == [("t", "a"), ("t", "b"), ("t", "d")]
+    restarted.commit(end_offset, lines)
+    assert restarted.pending == 0
+
+
+def test_unparseable_line_skipped_and_counted(tmp_path):
+    spool = new_spool(tmp_path)
+    spool.append([("t", "a")])
+    with open(spool.path, "ab") as f:
+        f.write(b"not json\n")
+    spool.append([("t", "b")])
+
+    restarted = new_spool(tmp_path)
+    assert restarted.pending == 3
+    messages, end_offset, lines = restarted.read(10)
+    assert messages == [("t", "a"), ("t", "b")]
+    assert lines == 3
+    restarted.commit(end_offset, lines)
+    assert restarted.pending == 0
+    assert restarted.status()["size_bytes"] == 0
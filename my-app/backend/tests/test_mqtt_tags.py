@@ -0,0 +1,52 @@
+"""MQTT 标签查找表与原解析规则一致"""
+import pytest
+
+from app import mqtt_tags
+from app.mqtt_tags import (NUM_DEVICES, TAG_FIELDS, TAG_TABLE, device_tag, extract_machine_name, lookup_tag,
+                           map_mqtt_to_db_field)
+
+
+def test_tag_table_matches_parsing_rules():
+    assert len(TAG_TABLE) == NUM_DEVICES * (len(TAG_FIELDS) + 1)
+    for tag, (machine_name, field) in TAG_TABLE.items():
+        assert extract_machine_name(tag) == machine_name, tag
+        assert map_mqtt_to_db_field(tag, machine_name) == field, tag
+
+
+@pytest.mark.parametrize("tag, expected", [
+    ("SYS_T/CM_H", ("1", "hours")),
+    ("SYS_T/CM_H_14", ("15", "hours")),
+    ("CELL3", ("1", "cell_3")),
+    ("CELL3_7", ("8", "cell_3")),
+    ("cell_max_2", ("3", "max_voltage")),
+    ("3_Type", ("3", "machine_model")),
+    ("当前产氢量_1", ("2", "hydrogen_flow_meter")),
+])
+def test_lookup_known_tags(tag, expected):
+    assert TAG_TABLE[tag] == expected
+    assert lookup_tag(tag) == expected
+
+
+@pytest.mark.parametrize("tag", ["UNKNOWN", "CELL3_20", "CELL99_1", "16_Type"])
+def test_lookup_unknown_tags_uses_parsing_rules(monkeypatch, tag):
+    monkeypatch.setattr(mqtt_tags, "_unknown_tags", {})
+    machine_name = extract_machine_name(tag)
+    expected = (machine_name, map_mqtt_to_db_field(tag, machine_name))
+    assert tag not in TAG_TABLE
+    assert lookup_tag(tag) == expected
+    assert mqtt_tags._unknown_tags[tag] == expected
+
+
+def test_unknown_tag_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(mqtt_tags, "_unknown_tags", {})
+    monkeypatch.setattr(mqtt_tags, "MAX_UNKNOWN_TAGS", 2)
+    for i in range(5):
+        assert lookup_tag(f"UNKNOWN{i}") == ("1", None)
+    assert len(mqtt_tags._unknown_tags) == 2
+
+
+def test_device_tag():
+    assert device_tag("cell_3", 1) == "CELL3"
+    assert device_tag("cell_3", 8) == "CELL3_7"
+    assert device_tag("machine_model", 3) == "3_Type"
+    assert device_tag("no_such_field", 1) is None